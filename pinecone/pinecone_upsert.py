@@ -1,13 +1,60 @@
-from pinecone import Pinecone
+"""
+Index patient records (data/db.json) into Pinecone.
+
+Each record becomes one Pinecone record (the JSON text plus its fields as
+metadata). --batch-size records go per request, with at most --workers
+requests in flight. The client retries a request that hits the rate limit
+or a server error a few times itself; a batch it still gives up on, or one
+whose connection drops, is retried here with exponential backoff and jitter,
+up to --max-retries times. Progress and records/s are printed as batches land.
+The namespace is then marked re-upserted, so running agents drop their
+cached search results.
+
+Runs are incremental. A manifest per index host and namespace
+(data/.pinecone-manifests/<host>/<namespace>.json) maps each upserted record
+id to a hash of the record as sent. An id that repeats in the source counts
+once, with its last record. The next run upserts only the records that are
+new or whose hash changed, deletes the ids that left the source, and reports
+how many were skipped, upserted and deleted. The manifest is saved at the
+end of every run, including a failed or interrupted one, and holds only what
+landed. --full re-sends every record.
+
+--dry-run sends the batches to a local stand-in for the upsert endpoint
+instead. The stand-in answers after --standin-latency seconds and returns
+429 beyond --standin-rps requests per second. Use it to tune batch size and
+workers and to measure records/s without touching the index. A dry run
+plans against --manifest, if given, and never saves a manifest. --repeat
+multiplies the records, under new ids, to stand in for a larger export.
+
+Usage:
+    python pinecone/pinecone_upsert.py
+    python pinecone/pinecone_upsert.py data/db.json --batch-size 96 --workers 8
+    python pinecone/pinecone_upsert.py --dry-run --repeat 100 --workers 16
+    python pinecone/pinecone_upsert.py --full
+"""
+from pinecone import Pinecone, RateLimitError, ServiceError, PineconeConnectionError, PineconeTimeoutError
+import os
+import sys
 import json
+import hashlib
+import time
+import random
+import argparse
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from decouple import config
 
-PINECONE_API_KEY = config("PINECONE_API_KEY")
-PINECONE_HOST = config("PINECONE_HOST")
-PINECONE_NAMESPACE = config("PINECONE_NAMESPACE")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from query_cache import mark_namespace_upserted
+
+MANIFEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", ".pinecone-manifests")
+# upsert_records takes at most 96 records per request, delete 1000 ids
+MAX_BATCH_SIZE = 96
+MAX_DELETE_IDS = 1000
+RETRYABLE = (RateLimitError, ServiceError, PineconeConnectionError, PineconeTimeoutError)
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(host=PINECONE_HOST)
 
 def sanitize_metadata(value):
     if value is None:
@@ -18,38 +65,340 @@ def sanitize_metadata(value):
         return [str(v) for v in value]
     return json.dumps(value, ensure_ascii=False)
 
-def batch_upsert(records, batch_size=10):
-    for i in range(0, len(records), batch_size):
-        batch = records[i:i + batch_size]
-        pinecone_records = []
 
-        for record in batch:
-            record_id = record["id"]
+def to_pinecone_record(record: dict) -> dict:
+    """The record as Pinecone holds it: its JSON text plus the non-null fields."""
+    payload = {k: v for k, v in record.items() if k != "id"}
+    metadata = {}
+    for key, value in payload.items():
+        value = sanitize_metadata(value)
+        if value is not None:
+            metadata[key] = value
+    return {"_id": record["id"], "text": json.dumps(payload, ensure_ascii=False), **metadata}
+
+
+def content_hash(pinecone_record: dict) -> str:
+    """Hash of the record as sent, so a change to any field (or to how it is
+    sanitized) makes the record upsert again."""
+    text = json.dumps(pinecone_record, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def manifest_path(host: str, namespace: str) -> str:
+    """data/.pinecone-manifests/<index host>/<namespace>.json: a namespace name is only unique per index."""
+    host_dir = host.split("://", 1)[-1].rstrip("/").replace(":", "_").replace("/", "_")
+    return os.path.join(MANIFEST_DIR, host_dir, (namespace.replace(os.sep, "_") or "_default") + ".json")
+
+
+def load_manifest(path: str, host: str | None = None) -> dict[str, str]:
+    """Record id -> content hash of what the namespace holds; empty on a first run.
+    Raises ValueError for the manifest of an index other than `host`, if given."""
+    try:
+        with open(path, "r") as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if host and saved.get("host", host) != host:
+        raise ValueError(f"{path} is the manifest of {saved['host']}, not {host}")
+    return saved["records"]
+
+
+def save_manifest(path: str, host: str, namespace: str, manifest: dict[str, str]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"host": host, "namespace": namespace, "records": manifest}, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+@dataclass
+class SyncPlan:
+    """What a run sends: the new and changed records, and the ids to delete."""
+    upserts: list[dict] = field(default_factory=list)  # Pinecone records
+    hashes: dict[str, str] = field(default_factory=dict)  # every source record's content hash
+    new: int = 0
+    changed: int = 0
+    unchanged: int = 0
+    deletes: list[str] = field(default_factory=list)
+
+
+def plan_sync(records: list[dict], manifest: dict[str, str], full: bool = False) -> SyncPlan:
+    """Compare the source with the manifest; with `full`, every record is upserted."""
+    plan = SyncPlan()
+    # A repeated id: the last one wins, as when every record was upserted in order
+    latest = {}
+    for record in records:
+        pinecone_record = to_pinecone_record(record)
+        latest[pinecone_record["_id"]] = pinecone_record
+    for record_id, pinecone_record in latest.items():
+        digest = plan.hashes[record_id] = content_hash(pinecone_record)
+        previous = manifest.get(record_id)
+        if previous == digest and not full:
+            plan.unchanged += 1
+            continue
+        plan.upserts.append(pinecone_record)
+        if previous is None:
+            plan.new += 1
+        elif previous != digest:
+            plan.changed += 1
+        else:
+            plan.unchanged += 1
+    plan.deletes = [record_id for record_id in manifest if record_id not in plan.hashes]
+    return plan
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter for retry `attempt` (0-based)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class Progress:
+    """Records upserted, retries and failures, shared by the upsert workers."""
+
+    def __init__(self, total: int, every_s: float):
+        self.total = total
+        self.every_s = every_s
+        self.upserted = self.failed = self.retries = 0
+        self.start = self._last_print = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, upserted: int = 0, failed: int = 0, retries: int = 0) -> None:
+        with self._lock:
+            self.upserted += upserted
+            self.failed += failed
+            self.retries += retries
+            now = time.perf_counter()
+            if now - self._last_print >= self.every_s:
+                self._last_print = now
+                print(self.line(now))
+
+    def line(self, now: float | None = None) -> str:
+        elapsed = (now or time.perf_counter()) - self.start
+        done = self.upserted + self.failed
+        return (f"{done}/{self.total} records ({done / max(self.total, 1):.0%}), {self.failed} failed, "
+                f"{self.retries} retries, {self.upserted / elapsed:.0f} records/s")
 
-            payload = {k: v for k, v in record.items() if k != "id"}
 
-            sanitized_metadata = {
-                k: sanitize_metadata(v)
-                for k, v in payload.items()
-                if sanitize_metadata(v) is not None
-            }
+def with_retries(call, what: str, progress: Progress, max_retries: int, backoff_s: float,
+                 max_backoff_s: float) -> bool:
+    """Run `call`, retrying transient errors; False once it gives up."""
+    for attempt in range(max_retries + 1):
+        try:
+            call()
+            return True
+        except RETRYABLE as e:
+            if attempt == max_retries:
+                print(f"Giving up on {what} after {attempt + 1} attempts: {e}", file=sys.stderr)
+                return False
+            progress.add(retries=1)
+            time.sleep(backoff_delay(attempt, backoff_s, max_backoff_s))
+    return False
 
-            pinecone_records.append({
-                "_id": record_id,
-                "text": json.dumps(payload, ensure_ascii=False),
-                **sanitized_metadata
-            })
 
-        index.upsert_records(
-            namespace=PINECONE_NAMESPACE,
-            records=pinecone_records
-        )
+def upsert_batch(index, namespace: str, records: list[dict], progress: Progress,
+                 max_retries: int, backoff_s: float, max_backoff_s: float) -> bool:
+    """Upsert one batch of Pinecone records; False once it gives up."""
+    ok = with_retries(lambda: index.upsert_records(namespace=namespace, records=records),
+                      f"batch starting at {records[0]['_id']}", progress, max_retries, backoff_s, max_backoff_s)
+    if ok:
+        progress.add(upserted=len(records))
+    else:
+        progress.add(failed=len(records))
+    return ok
+
+
+def batch_upsert(index, namespace: str, records: list[dict], batch_size: int = MAX_BATCH_SIZE, workers: int = 4,
+                 max_retries: int = 6, backoff_s: float = 0.5, max_backoff_s: float = 30.0,
+                 progress_s: float = 2.0, on_upserted=None) -> Progress:
+    """Upsert Pinecone `records` in batches over a pool of `workers` threads,
+    calling `on_upserted(batch)` for each batch that lands.
+
+    At most 2 x `workers` batches are queued at a time."""
+    progress = Progress(len(records), progress_s)
+    pending = {}
+
+    def collect(done):
+        for future in done:
+            batch = pending.pop(future)
+            if future.result() and on_upserted:
+                on_upserted(batch)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pinecone-upsert") as pool:
+        for i in range(0, len(records), batch_size):
+            if len(pending) >= 2 * workers:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            batch = records[i:i + batch_size]
+            pending[pool.submit(upsert_batch, index, namespace, batch, progress,
+                                max_retries, backoff_s, max_backoff_s)] = batch
+        collect(wait(pending).done)
+    return progress
+
+
+def delete_ids(index, namespace: str, ids: list[str], progress: Progress,
+               max_retries: int, backoff_s: float, max_backoff_s: float) -> list[str]:
+    """Delete `ids` in chunks of MAX_DELETE_IDS; the ids actually deleted."""
+    deleted = []
+    for i in range(0, len(ids), MAX_DELETE_IDS):
+        chunk = ids[i:i + MAX_DELETE_IDS]
+        if with_retries(lambda: index.delete(ids=chunk, namespace=namespace), f"deleting {len(chunk)} ids",
+                        progress, max_retries, backoff_s, max_backoff_s):
+            deleted.extend(chunk)
+    return deleted
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers POST /records/namespaces/<ns>/upsert and /vectors/delete after
+    `latency`, or 429 beyond `rps` requests in the current second."""
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.05
+    rps = 50.0
+    _lock = threading.Lock()
+    _window = (0, 0)  # (second, requests in it)
+    records = deleted = throttled = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        cls = StandInHandler
+        with cls._lock:
+            second, count = cls._window
+            now = int(time.monotonic())
+            cls._window = (now, count + 1 if now == second else 1)
+            limited = cls._window[1] > cls.rps
+            if limited:
+                cls.throttled += 1
+        if limited:
+            payload = b'{"error": {"code": "RESOURCE_EXHAUSTED", "message": "Too many requests"}, "status": 429}'
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        time.sleep(self.latency)
+        if self.path.endswith("/vectors/delete"):
+            with cls._lock:
+                cls.deleted += len(json.loads(body)["ids"])
+            payload = b"{}"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        with cls._lock:
+            cls.records += body.count(b"\n") + (not body.endswith(b"\n"))
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def handle(self):
+        # The client drops its idle keep-alive connections when it exits
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def start_standin(latency: float, rps: float) -> ThreadingHTTPServer:
+    StandInHandler.latency, StandInHandler.rps = latency, rps
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def load_records(json_path: str, repeat: int) -> list[dict]:
+    with open(json_path, "r") as f:
+        records = json.load(f)
+    if repeat > 1:
+        records = [{**r, "id": f"{r['id']}-{n}"} for n in range(repeat) for r in records]
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("json_path", nargs="?", default="data/db.json")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE, help=f"records per request (at most {MAX_BATCH_SIZE})")
+    parser.add_argument("--workers", type=int, default=4, help="requests in flight")
+    parser.add_argument("--max-retries", type=int, default=6, help="per batch, once the client's own retries give up")
+    parser.add_argument("--backoff", type=float, default=0.5, help="first retry delay cap in seconds, doubled per retry")
+    parser.add_argument("--max-backoff", type=float, default=30.0)
+    parser.add_argument("--progress-every", type=float, default=2.0, help="seconds between progress lines")
+    parser.add_argument("--full", action="store_true", help="upsert every record, not only new and changed ones")
+    parser.add_argument("--manifest", help="manifest path (default: data/.pinecone-manifests/<host>/<namespace>.json); "
+                                           "a dry run only reads it")
+    parser.add_argument("--repeat", type=int, default=1, help="upsert the records this many times, under new ids")
+    parser.add_argument("--dry-run", action="store_true", help="upsert to a local stand-in instead of Pinecone")
+    parser.add_argument("--standin-latency", type=float, default=0.05, help="dry run: seconds per request")
+    parser.add_argument("--standin-rps", type=float, default=50, help="dry run: requests/s before 429s")
+    args = parser.parse_args()
+    if not 1 <= args.batch_size <= MAX_BATCH_SIZE:
+        parser.error(f"--batch-size must be between 1 and {MAX_BATCH_SIZE}")
+
+    records = load_records(args.json_path, args.repeat)
+    if args.dry_run:
+        server = start_standin(args.standin_latency, args.standin_rps)
+        api_key, host, namespace = "stand-in", f"http://127.0.0.1:{server.server_port}", "stand-in"
+    else:
+        api_key, host, namespace = config("PINECONE_API_KEY"), config("PINECONE_HOST"), config("PINECONE_NAMESPACE")
+
+    # One keep-alive connection per worker
+    pc = Pinecone(api_key=api_key, connection_pool_maxsize=args.workers)
+    index = pc.Index(host=host)
+
+    # A dry run plans against --manifest, whatever index it is for, and never writes it
+    if args.dry_run:
+        path = args.manifest
+        manifest = load_manifest(path) if path else {}
+    else:
+        path = args.manifest or manifest_path(host, namespace)
+        try:
+            manifest = load_manifest(path, host)
+        except ValueError as e:
+            parser.error(str(e))
+    plan = plan_sync(records, manifest, full=args.full)
+    target = "the stand-in" if args.dry_run else f"namespace {namespace!r}"
+    print(f"{len(records)} records: {plan.new} new, {plan.changed} changed, {plan.unchanged} unchanged; "
+          f"{len(plan.deletes)} ids gone from the source")
+
+    def landed(batch: list[dict]) -> None:
+        for record in batch:
+            manifest[record["_id"]] = plan.hashes[record["_id"]]
 
-        print(f"Upserted batch {i // batch_size + 1}")
+    progress, deleted = Progress(0, args.progress_every), []
+    try:
+        if plan.upserts:
+            print(f"Upserting {len(plan.upserts)} records into {target}: "
+                  f"batches of {args.batch_size}, {args.workers} workers")
+            progress = batch_upsert(index, namespace, plan.upserts, args.batch_size, args.workers, args.max_retries,
+                                    args.backoff, args.max_backoff, args.progress_every, on_upserted=landed)
+            print(progress.line())
+        deleted = delete_ids(index, namespace, plan.deletes, progress,
+                             args.max_retries, args.backoff, args.max_backoff)
+        for record_id in deleted:
+            del manifest[record_id]
+    finally:
+        # Whatever landed is recorded, so the next run does not send it again
+        if not args.dry_run:
+            save_manifest(path, host, namespace, manifest)
 
+    skipped = plan.unchanged if not args.full else 0
+    print(f"sync: {skipped} skipped, {progress.upserted} upserted, {len(deleted)} deleted, "
+          f"{progress.failed + len(plan.deletes) - len(deleted)} failed"
+          + ("" if args.dry_run else f" (manifest {path})"))
+    if args.dry_run:
+        print(f"stand-in received {StandInHandler.records} records and {StandInHandler.deleted} deletes, "
+              f"answered {StandInHandler.throttled} requests with 429")
+        server.shutdown()
+    elif progress.upserted or deleted:
+        # Running agents drop their cached search results for this namespace
+        mark_namespace_upserted(namespace)
+    sys.exit(1 if progress.failed or len(deleted) < len(plan.deletes) else 0)
 
-# -------- RUN --------
-with open("data/db.json", "r") as f:
-    records = json.load(f)
 
-batch_upsert(records)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Text chat server — the RAG agent (src/rag.py) over HTTP and WebSocket,
+one rag.ChatSession per conversation, all in one process.
+
+Sessions only hold their ChatMemory; they share CHAT_LLM_POOLS Groq
+clients, CHAT_MAX_TURNS connections in all. A session idle for
+CHAT_SESSION_IDLE_S is evicted, and beyond CHAT_MAX_SESSIONS the least
+recently used one is. At most CHAT_MAX_TURNS turns run at once; the rest
+wait for a slot.
+
+Routes:
+    POST   /api/chat/sessions                 -> {"session_id"}
+    POST   /api/chat/sessions/{id}/messages   {"text"} -> text/event-stream of events
+    DELETE /api/chat/sessions/{id}
+    WS     /api/chat/ws[?session_id=]         send {"text"}, receive the events, then {"type": "done"}
+    GET    /api/chat/stats
+
+Events are {"type": "search", "query"}, {"type": "token", "text"} and
+{"type": "error", "message"}.
+
+Run:
+    python playground/chat_server.py
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import contextlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+import rag
+import provider_clients
+from chat_memory import ChatMemory
+from tool_format import token_counter
+
+CHAT_PORT = int(os.getenv("CHAT_PORT", "8090"))
+CHAT_SESSION_IDLE_S = float(os.getenv("CHAT_SESSION_IDLE_S", "600"))
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "10000"))
+CHAT_MAX_TURNS = int(os.getenv("CHAT_MAX_TURNS", "50"))
+# One 50-connection pool spends more CPU on its own bookkeeping than on the
+# streams (see provider_clients.new_openai_client); five of ten do not
+CHAT_LLM_POOLS = int(os.getenv("CHAT_LLM_POOLS", "5"))
+
+# Every session counts tokens the same way; build the counter once
+_, _count_tokens = token_counter()
+
+
+@dataclass
+class _Entry:
+    session: rag.ChatSession
+    # One turn at a time per session: a turn appends to the memory the next one reads
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SessionStore:
+    """The live sessions, least recently used first."""
+
+    def __init__(self, idle_s: float = CHAT_SESSION_IDLE_S, max_sessions: int = CHAT_MAX_SESSIONS):
+        self.idle_s = idle_s
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[str, _Entry] = OrderedDict()
+        self._clients = []
+        self.created = self.evicted_idle = self.evicted_full = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self) -> str:
+        session_id = uuid.uuid4().hex
+        if not self._clients:
+            per_pool = max(1, CHAT_MAX_TURNS // CHAT_LLM_POOLS)
+            self._clients = [
+                provider_clients.new_openai_client(per_pool).with_options(
+                    base_url=rag.GROQ_BASE_URL, api_key=rag.GROQ_API_KEY,
+                )
+                for _ in range(max(1, CHAT_LLM_POOLS))
+            ]
+        client = self._clients[self.created % len(self._clients)]
+        self._sessions[session_id] = _Entry(rag.ChatSession(ChatMemory(count=_count_tokens), client=client))
+        self.created += 1
+        if len(self._sessions) > self.max_sessions:
+            # The oldest session not in the middle of a turn makes room
+            for old_id, entry in self._sessions.items():
+                if old_id != session_id and not entry.lock.locked():
+                    del self._sessions[old_id]
+                    self.evicted_full += 1
+                    break
+        return session_id
+
+    def get(self, session_id: str) -> _Entry | None:
+        entry = self._sessions.get(session_id)
+        if entry is not None:
+            entry.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+        return entry
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    async def aclose(self) -> None:
+        self._sessions.clear()
+        for client in self._clients:
+            await client.close()
+        self._clients = []
+
+    def evict_idle(self) -> int:
+        """Drop the sessions unused for idle_s; a session mid-turn is kept."""
+        cutoff = time.monotonic() - self.idle_s
+        idle = []
+        for session_id, entry in self._sessions.items():
+            if entry.last_used > cutoff:
+                break  # the rest were used more recently
+            if not entry.lock.locked():
+                idle.append(session_id)
+        for session_id in idle:
+            del self._sessions[session_id]
+        self.evicted_idle += len(idle)
+        return len(idle)
+
+
+store = SessionStore()
+_turn_slots = asyncio.Semaphore(CHAT_MAX_TURNS)
+_turns = {"running": 0, "done": 0, "failed": 0}
+
+
+async def run_turn(entry: _Entry, text: str):
+    """The events of one turn; a failure ends it with an error event."""
+    async with entry.lock, _turn_slots:
+        _turns["running"] += 1
+        try:
+            async for event in entry.session.ask(text):
+                yield event
+            _turns["done"] += 1
+        except Exception as e:
+            _turns["failed"] += 1
+            yield {"type": "error", "message": str(e)}
+        finally:
+            _turns["running"] -= 1
+            entry.last_used = time.monotonic()
+
+
+async def _sweep() -> None:
+    while True:
+        await asyncio.sleep(min(60.0, store.idle_s / 4))
+        store.evict_idle()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(rag.warm)
+    sweeper = asyncio.create_task(_sweep())
+    yield
+    sweeper.cancel()
+    await store.aclose()
+
+
+app = FastAPI(title="Pharmacy Agent Text Chat", lifespan=lifespan)
+
+
+class Message(BaseModel):
+    text: str
+
+
+def _missing(session_id: str) -> JSONResponse:
+    return JSONResponse({"error": f"Unknown or expired session {session_id}"}, status_code=404)
+
+
+@app.post("/api/chat/sessions")
+async def create_session():
+    return {"session_id": store.create()}
+
+
+@app.delete("/api/chat/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not store.delete(session_id):
+        return _missing(session_id)
+    return {"deleted": session_id}
+
+
+@app.post("/api/chat/sessions/{session_id}/messages")
+async def post_message(session_id: str, message: Message):
+    """Stream one turn as server-sent events, ending with a done event."""
+    entry = store.get(session_id)
+    if entry is None:
+        return _missing(session_id)
+
+    async def events():
+        async for event in run_turn(entry, message.text):
+            yield f"data: {json.dumps(event)}\n\n"
+        yield 'data: {"type": "done"}\n\n'
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.websocket("/api/chat/ws")
+async def chat_ws(websocket: WebSocket, session_id: str | None = None):
+    """A conversation over one socket; reconnecting with its session_id resumes it."""
+    await websocket.accept()
+    if session_id is None or store.get(session_id) is None:
+        session_id = store.create()
+    await websocket.send_json({"type": "session", "session_id": session_id})
+    try:
+        while True:
+            message = await websocket.receive_json()
+            entry = store.get(session_id)
+            if entry is None:
+                await websocket.send_json({"type": "error", "message": "Session expired"})
+                await websocket.close(code=4404)
+                return
+            async for event in run_turn(entry, str(message.get("text", ""))):
+                await websocket.send_json(event)
+            await websocket.send_json({"type": "done"})
+    except WebSocketDisconnect:
+        pass
+
+
+@app.get("/api/chat/stats")
+async def stats():
+    return {
+        "sessions": len(store),
+        "created": store.created,
+        "evicted_idle": store.evicted_idle,
+        "evicted_full": store.evicted_full,
+        "turns_running": _turns["running"],
+        "turns_done": _turns["done"],
+        "turns_failed": _turns["failed"],
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    print(f"Text chat on http://localhost:{CHAT_PORT}/api/chat")
+    uvicorn.run(app, host="0.0.0.0", port=CHAT_PORT, log_level="warning")
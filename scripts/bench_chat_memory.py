@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Prompt tokens per turn of a 30-turn call, unbounded history vs ChatMemory.
+
+Replays a scripted console call (rag.ask_groq_with_context) over five
+patients from data/db.json, six turns each: identify the patient, ask why
+the claim was denied, ask for alternatives, ask how to resolve it, confirm
+the policy, move on. The searches return the record texts Pinecone holds
+(the patient again on later turns, PBM call records from data/pharma.json
+for the drug), so records repeat the way they do in real calls. Prints the
+prompt of each turn's last LLM step (system prompt included) and the total
+over all steps.
+
+Usage:
+    python scripts/bench_chat_memory.py
+    python scripts/bench_chat_memory.py --budget 2000 --keep-turns 2
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from chat_memory import CHAT_KEEP_TURNS, CHAT_TOKEN_BUDGET, ChatMemory  # noqa: E402
+from system_prompt import SYSTEM_PROMPT  # noqa: E402
+from tool_format import token_counter  # noqa: E402
+from vector_index import record_text  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+
+def script(patients: list[dict], calls: list[dict]) -> list[dict]:
+    """Six turns per patient: the caller's words, the searches (query, hits) and the reply."""
+    turns = []
+    for i, p in enumerate(patients):
+        same_drug = [c for c in calls if c["drug_class"] == p["drug_class"]] or calls
+        neighbours = [record_text(r) for r in patients[i + 1:i + 3]]
+        patient = record_text(p)
+        pbm = [record_text(c) for c in same_drug[:2]]
+        turns += [
+            {"user": f"I'm calling about {p['patient_name']}, Emirates ID {p['emirates_id']}.",
+             "searches": [(f"{p['patient_name']} {p['emirates_id']}", [patient] + neighbours)],
+             "reply": f"I found {p['patient_name']}, policy {p['policy_number']} with {p['pbm_name']}. "
+                      f"How can I help with the {p['drug_brand_name']} claim?"},
+            {"user": "Why was the claim denied?",
+             "searches": [(f"denial code {p['denial_code']} {p['drug_brand_name']}", [patient] + pbm)],
+             "reply": f"Claim {p['claim_id']} was denied with code {p['denial_code']}: {p['denial_reason']}."},
+            {"user": "Are there covered alternatives?",
+             "searches": [(f"{p['drug_generic_name']} alternatives", [patient] + pbm[:1])],
+             "reply": "The alternatives on file are "
+                      f"{', '.join(p.get('alternative_drugs') or ['none'])}. Shall I check stock for one of them?"},
+            {"user": "What do I need to do to get it approved?",
+             "searches": [],
+             "reply": f"The recommended resolution is: {p['recommended_resolution']}."},
+            {"user": "Can you confirm the policy is still active?",
+             "searches": [(p["policy_number"], [patient])],
+             "reply": f"Policy {p['policy_number']} is {'active' if p['policy_active'] else 'not active'}, "
+                      f"ending {p['policy_end_date']}."},
+            {"user": "Thanks, I have another patient.",
+             "searches": [],
+             "reply": "Of course. Please give me the next patient's name or Emirates ID."},
+        ]
+    return turns
+
+
+def replay(turns: list[dict], memory: ChatMemory, render) -> list[tuple[int, int]]:
+    """Run the tool loop's appends; per turn (last step's prompt tokens, all steps' prompt tokens)."""
+    system = {"role": "system", "content": SYSTEM_PROMPT}
+    per_turn = []
+    for t, turn in enumerate(turns):
+        memory.append({"role": "user", "content": turn["user"]})
+        steps = []
+        for s, (query, hits) in enumerate(turn["searches"]):
+            steps.append(memory.tokens([system] + render()))
+            call_id = f"call_{t}_{s}"
+            memory.append({"role": "assistant", "content": None, "tool_calls": [{
+                "id": call_id, "type": "function",
+                "function": {"name": "pinecone_search", "arguments": json.dumps({"query": query, "top_k": 3})},
+            }]})
+            memory.append({"tool_call_id": call_id, "role": "tool", "name": "pinecone_search",
+                           "content": "\n---\n".join(hits)}, records=hits)
+        steps.append(memory.tokens([system] + render()))
+        memory.append({"role": "assistant", "content": turn["reply"]})
+        per_turn.append((steps[-1], sum(steps)))
+    return per_turn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=int, default=CHAT_TOKEN_BUDGET, help="history token budget")
+    parser.add_argument("--keep-turns", type=int, default=CHAT_KEEP_TURNS, help="recent turns kept verbatim")
+    parser.add_argument("--patients", type=int, default=5, help="six turns each")
+    args = parser.parse_args()
+
+    with open(os.path.join(DATA_DIR, "db.json")) as f:
+        patients = json.load(f)[:args.patients + 2]
+    with open(os.path.join(DATA_DIR, "pharma.json")) as f:
+        calls = json.load(f)
+    turns = script(patients, calls)[:6 * args.patients]
+
+    tokenizer, count = token_counter()
+    unbounded = ChatMemory(count=count)
+    budgeted = ChatMemory(args.budget, args.keep_turns, count)
+    raw = replay(turns, unbounded, unbounded.raw)
+    kept = replay(turns, budgeted, budgeted.messages)
+
+    print(f"tokens ({tokenizer}); system prompt {count(SYSTEM_PROMPT)}, "
+          f"budget {args.budget} for the history, last {args.keep_turns} turns verbatim\n")
+    print(f"{'turn':>4} {'unbounded':>10} {'memory':>8} {'saved':>6}")
+    for t, ((r, _), (k, _)) in enumerate(zip(raw, kept), start=1):
+        print(f"{t:>4} {r:>10} {k:>8} {1 - k / r:>6.0%}")
+    total_raw, total_kept = sum(s for _, s in raw), sum(s for _, s in kept)
+    print(f"\nall LLM steps: {total_raw} -> {total_kept} prompt tokens ({1 - total_kept / total_raw:.0%} fewer)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+lookup_drug_code latency with and without the per-session drug prefetch.
+
+Replays the SYSTEM_PROMPT workflow for each patient in data/db.json: the
+patient lookup returns the record, the LLM takes --think-ms to produce its
+next tool call, then looks up the brand, the generic and each alternative
+(retrying with the bare name when "Aspirin 100mg" finds nothing).
+
+Usage:
+    python scripts/bench_drug_prefetch.py
+    python scripts/bench_drug_prefetch.py --patients 50 --think-ms 300
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from drug_index import DrugCodeIndex  # noqa: E402
+from drug_prefetch import _STRENGTH_RE, DrugCodePrefetcher  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+
+def llm_drug_calls(record: dict, search) -> list[str]:
+    """The drug-name lookups the LLM makes for a record, retries included."""
+    calls = [record["drug_brand_name"], record["drug_generic_name"]]
+    for alternative in record.get("alternative_drugs") or []:
+        calls.append(alternative)
+        if not search(drug_name=alternative):
+            calls.append(_STRENGTH_RE.sub("", alternative))
+    return calls
+
+
+async def session(record: dict, search, calls: list[str], prefetch: bool, think_s: float) -> list[float]:
+    prefetcher = DrugCodePrefetcher(search)
+    if prefetch:
+        prefetcher.prefetch([record])
+    latencies = []
+    for name in calls:
+        await asyncio.sleep(think_s)
+        start = time.perf_counter()
+        await prefetcher.lookup(drug_name=name)
+        latencies.append(time.perf_counter() - start)
+    session.stats.append(prefetcher.stats())
+    return latencies
+
+
+async def main_async(args):
+    index = DrugCodeIndex.attach(os.path.join(DATA_DIR, "Claim Drug Code List.xlsx"))
+    with open(os.path.join(DATA_DIR, "db.json")) as f:
+        records = json.load(f)[:args.patients]
+
+    def search(drug_code=None, drug_name=None):
+        return index.search(drug_code=drug_code, drug_name=drug_name)
+
+    plans = [(r, llm_drug_calls(r, search)) for r in records]
+    print(f"{len(plans)} sessions, {sum(len(c) for _, c in plans)} lookup_drug_code calls, think time {args.think_ms}ms")
+    print(f"{'prefetch':<9} {'mean ms':>8} {'p95 ms':>8} {'hit rate':>9} {'saved ms/call':>14}")
+    for prefetch in (False, True):
+        session.stats = []
+        latencies = []
+        for record, calls in plans:
+            latencies += await session(record, search, calls, prefetch, args.think_ms / 1e3)
+        latencies.sort()
+        lookups = sum(s["lookups"] for s in session.stats)
+        hits = sum(s["prefetch_hits"] for s in session.stats)
+        saved = sum(s["saved_ms"] for s in session.stats)
+        print(
+            f"{'on' if prefetch else 'off':<9} {sum(latencies) / len(latencies) * 1e3:>8.3f} "
+            f"{latencies[int(len(latencies) * 0.95)] * 1e3:>8.3f} {hits / lookups:>9.0%} {saved / lookups:>14.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=100)
+    parser.add_argument("--think-ms", type=float, default=20.0, help="LLM time between tool calls")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Wall clock of multi-drug calls through rag.ChatSession, with the searches
+of each LLM step run one after another vs at once.
+
+Each scripted call takes four patients from data/db.json. On each turn the
+caller asks about one patient's drug and its alternatives, and the model
+answers with one pinecone_search per drug in a single step, then replies.
+Groq is the stand-in from scripts/sim_standins.py (--ttft-ms), Pinecone the
+one from scripts/bench_pinecone_async.py (--latency). The query cache is
+cleared between runs, so every search goes upstream.
+
+Usage:
+    python scripts/bench_parallel_tools.py
+    python scripts/bench_parallel_tools.py --calls 5 --latency 0.3 --ttft-ms 300
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import contextlib
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import sim_standins  # noqa: E402
+from bench_pinecone_async import StandInHandler, start_stand_in  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+
+def call_script(records: list[dict]) -> list[dict]:
+    """One turn per record: a search for the brand, the generic and each alternative, then a reply."""
+    turns = []
+    for r in records:
+        drugs = [r["drug_brand_name"], r["drug_generic_name"]] + list(r.get("alternative_drugs") or [])
+        turns.append({
+            "user": f"Is {r['drug_brand_name']} covered for {r['patient_name']}, or one of the alternatives?",
+            "tools": [{"name": "pinecone_search", "arguments": {"query": f"{d} coverage {r['pbm_name']}", "top_k": 3}}
+                      for d in drugs],
+            "reply": f"{r['drug_brand_name']} needs prior authorization; the alternatives are on file.",
+        })
+    return turns
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run(rag, calls: dict[str, list[dict]]) -> tuple[list[float], int]:
+    """Per-turn wall clock over every call, and the number of searches made."""
+    import provider_clients
+
+    rag.invalidate_search_cache()
+    StandInHandler.requests = 0
+    clients = provider_clients.shared()
+    walls = []
+    for key, turns in calls.items():
+        # The stand-in picks the call's script by API key
+        session = rag.ChatSession(client=clients.openai_client(rag.GROQ_BASE_URL, key))
+        for turn in turns:
+            start = time.perf_counter()
+            async for _ in session.ask(turn["user"]):
+                pass
+            walls.append(time.perf_counter() - start)
+    await provider_clients.aclose()
+    return walls, StandInHandler.requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=3, help="scripted calls, four turns each")
+    parser.add_argument("--latency", type=float, default=0.2, help="Pinecone stand-in response delay (s)")
+    parser.add_argument("--ttft-ms", type=float, default=200, help="Groq stand-in time to first token")
+    args = parser.parse_args()
+
+    with open(os.path.join(DATA_DIR, "db.json")) as f:
+        records = json.load(f)
+    calls = {f"sim-{i}": call_script(records[4 * i:4 * i + 4]) for i in range(args.calls)}
+
+    port = free_port()
+    llm = multiprocessing.Process(
+        target=sim_standins.serve, args=(port, calls, 0.0, args.ttft_ms / 1e3, 500.0, 0.0), daemon=True,
+    )
+    llm.start()
+    pinecone = start_stand_in()
+    StandInHandler.latency = args.latency
+    os.environ.update({
+        "RAG_BACKEND": "pinecone",
+        "PINECONE_API_KEY": "stand-in",
+        "PINECONE_HOST": f"http://127.0.0.1:{pinecone.server_port}",
+        "PINECONE_NAMESPACE": "stand-in",
+        "GROQ_API_KEY": "sim-0",
+        "GROQ_BASE_URL": f"http://127.0.0.1:{port}/openai/v1",
+    })
+    for _ in range(100):
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.1):
+            break
+        time.sleep(0.05)
+
+    import rag
+
+    searches = sum(len(t["tools"]) for turns in calls.values() for t in turns)
+    turns = sum(len(turns) for turns in calls.values())
+    print(f"{args.calls} calls, {turns} turns, {searches} searches ({searches / turns:.1f} per step); "
+          f"Pinecone {args.latency * 1e3:.0f}ms, LLM TTFT {args.ttft_ms:.0f}ms\n")
+    print(f"{'searches':<11} {'turn p50 ms':>12} {'turn max ms':>12} {'total s':>8} {'requests':>9}")
+    totals = {}
+    for parallel in (False, True):
+        rag.RAG_PARALLEL_TOOLS = parallel
+        walls, requests = asyncio.run(run(rag, calls))
+        totals[parallel] = sum(walls)
+        name = "concurrent" if parallel else "sequential"
+        print(f"{name:<11} {sorted(walls)[len(walls) // 2] * 1e3:>12.0f} {max(walls) * 1e3:>12.0f} "
+              f"{sum(walls):>8.2f} {requests:>9}")
+    print(f"\nwall clock saved: {1 - totals[True] / totals[False]:.0%}")
+
+    pinecone.shutdown()
+    llm.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark lookup_database: original linear scan vs PatientIndex.
+
+Builds synthetic patient tables by cloning data/db.json with unique IDs,
+checks both paths return the same records, and prints per-query latency.
+
+Usage:
+    python scripts/bench_patient_lookup.py                    # 10k, 100k, 1M
+    python scripts/bench_patient_lookup.py --sizes 10000 50000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from patient_index import ID_FIELDS, PatientIndex
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "db.json")
+
+
+def linear_lookup(records, emirates_id=None, policy_number=None, claim_id=None, patient_id=None, patient_name=None):
+    """The pre-index lookup_database loop, kept here as the baseline."""
+    matches = []
+    for record in records:
+        if emirates_id and record.get("emirates_id") == emirates_id:
+            matches.append(record)
+            continue
+        if policy_number and record.get("policy_number") == policy_number:
+            matches.append(record)
+            continue
+        if claim_id and record.get("claim_id") == claim_id:
+            matches.append(record)
+            continue
+        if patient_id and record.get("patient_id") == patient_id:
+            matches.append(record)
+            continue
+        if patient_name:
+            if patient_name.lower() in record.get("patient_name", "").lower():
+                matches.append(record)
+                continue
+    return matches[:3]
+
+
+def make_records(templates, n):
+    """Clone the template records with unique IDs. Only the fields the lookup
+    touches are kept so the 1M table fits in memory."""
+    records = []
+    for i in range(n):
+        t = templates[i % len(templates)]
+        records.append({
+            "id": f"INS-{i:07d}",
+            "patient_name": t["patient_name"],
+            "emirates_id": f"784-{1950 + i % 60}-{i:07d}-{i % 10}",
+            "policy_number": f"POL-{i:07d}",
+            "claim_id": f"CLM-{i:08d}",
+            "patient_id": f"PAT-{i:07d}",
+        })
+    return records
+
+
+def make_queries(records, count, rng):
+    queries = []
+    for _ in range(count):
+        r = rng.choice(records)
+        kind = rng.choice(ID_FIELDS + ("patient_name", "miss"))
+        if kind == "patient_name":
+            queries.append({"patient_name": r["patient_name"].split()[-1].lower()})
+        elif kind == "miss":
+            queries.append({"policy_number": "POL-NOPE"})
+        else:
+            queries.append({kind: r[kind]})
+    return queries
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    results = [fn(**q) for q in queries]
+    return (time.perf_counter() - start) / len(queries), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with open(DB_PATH, "r") as f:
+        templates = json.load(f)
+    rng = random.Random(args.seed)
+
+    print(f"{'records':>10} {'build s':>9} {'scan ms/q':>11} {'index ms/q':>11} {'speedup':>9}")
+    for n in args.sizes:
+        records = make_records(templates, n)
+        queries = make_queries(records, args.queries, rng)
+
+        start = time.perf_counter()
+        index = PatientIndex(records)
+        build = time.perf_counter() - start
+
+        # The scan is slow at 1M; time a slice of the query mix for it
+        scan_queries = queries[: max(10, args.queries * 10_000 // n)]
+        scan_t, scan_results = timed(lambda **q: linear_lookup(records, **q), scan_queries)
+        index_t, index_results = timed(lambda **q: index.lookup(limit=3, **q), queries)
+
+        assert scan_results == index_results[: len(scan_results)], "index results differ from linear scan"
+        print(f"{n:>10,} {build:>9.2f} {scan_t * 1e3:>11.3f} {index_t * 1e3:>11.4f} {scan_t / index_t:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
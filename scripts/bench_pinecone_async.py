@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Event loop responsiveness during concurrent Pinecone searches.
+
+Starts a local stand-in for the Pinecone search endpoint that answers after a
+fixed delay, points rag.py at it and runs concurrent searches the way the
+agent's tool calls do, while a heartbeat task measures how late the event
+loop wakes up (audio frames and VAD would stall by the same amount).
+
+  blocking  rag.pinecone_search called from the coroutine (old tool path)
+  async     rag.pinecone_search_async (bounded thread pool + deadline)
+
+A cache run sends the same query (in varying case/spacing) concurrently,
+repeats it, then marks the namespace re-upserted, and counts the requests
+that reach the stand-in. A last run makes the stand-in slower than the
+timeout and checks the search gives up on time. Exits 1 if the async path
+stalls the loop, overruns, or the cache does not coalesce.
+
+Usage:
+    python scripts/bench_pinecone_async.py
+    python scripts/bench_pinecone_async.py --concurrency 16 --latency 0.3
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers POST /records/namespaces/<ns>/search with one hit after `latency`."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+    latency = 0.2
+    requests = 0
+
+    def do_POST(self):
+        StandInHandler.requests += 1
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.latency)
+        text = body["query"]["inputs"]["text"]
+        payload = json.dumps({
+            "result": {"hits": [{"_id": "rec-1", "_score": 0.9, "fields": {"text": f"record for {text}"}}]},
+            "usage": {"read_units": 1},
+        }).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out and hung up
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stand_in() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def heartbeat(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Return the worst lateness (seconds) of a timer that should fire every `interval`."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def run(mode: str, concurrency: int) -> tuple[float, float, int]:
+    import rag
+
+    async def tool_call(i: int):
+        # Mirrors PharmacyTools.pinecone_search in agent.py
+        if mode == "blocking":
+            return rag.pinecone_search(f"query {i}", 3)
+        return await rag.pinecone_search_async(f"query {i}", 3)
+
+    rag.invalidate_search_cache()  # every search goes upstream
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(stop))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(tool_call(i) for i in range(concurrency)))
+    wall = time.perf_counter() - start
+    stop.set()
+    return wall, await beat, sum(len(r) for r in results)
+
+
+async def run_cache(concurrency: int) -> list[int]:
+    """Upstream request counts after: a concurrent burst, a repeat, a re-upsert."""
+    import rag
+    import query_cache
+
+    variants = ["Prior auth rejection insulin Daman", "prior auth  rejection INSULIN daman", " prior auth rejection insulin daman "]
+    counts = []
+    StandInHandler.requests = 0
+    await asyncio.gather(*(rag.pinecone_search_async(variants[i % 3], 3) for i in range(concurrency)))
+    counts.append(StandInHandler.requests)
+    await rag.pinecone_search_async(variants[0], 3)
+    counts.append(StandInHandler.requests)
+    query_cache.mark_namespace_upserted(rag.PINECONE_NAMESPACE)
+    await rag.pinecone_search_async(variants[0], 3)
+    counts.append(StandInHandler.requests)
+    return counts
+
+
+async def run_timeout(timeout: float) -> tuple[float, str]:
+    import rag
+
+    start = time.perf_counter()
+    try:
+        await rag.pinecone_search_async("slow query", 3, timeout=timeout)
+        outcome = "returned"
+    except TimeoutError:
+        outcome = "TimeoutError"
+    return time.perf_counter() - start, outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="stand-in response delay (s)")
+    parser.add_argument("--timeout", type=float, default=0.5, help="deadline for the slow-server run (s)")
+    args = parser.parse_args()
+
+    server = start_stand_in()
+    StandInHandler.latency = args.latency
+    os.environ.update({
+        "PINECONE_API_KEY": "stand-in",
+        "PINECONE_HOST": f"http://127.0.0.1:{server.server_port}",
+        "PINECONE_NAMESPACE": "stand-in",
+        "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "stand-in"),
+        "PINECONE_MAX_WORKERS": str(args.concurrency),
+    })
+
+    # Keep the upsert markers of this run out of data/
+    import query_cache
+    query_cache.UPSERT_MARKER_DIR = tempfile.mkdtemp(prefix="pinecone-upserts-")
+
+    # The timed-out search keeps retrying in its worker thread until the
+    # client gives up; its tracebacks are expected here
+    logging.getLogger("rag").setLevel(logging.CRITICAL)
+
+    failed = False
+    print(f"{args.concurrency} concurrent searches, stand-in latency {args.latency * 1e3:.0f}ms")
+    print(f"{'mode':<9} {'wall ms':>8} {'max loop lag ms':>16} {'hits':>5}")
+    for mode in ("blocking", "async"):
+        wall, lag, hits = asyncio.run(run(mode, args.concurrency))
+        print(f"{mode:<9} {wall * 1e3:>8.0f} {lag * 1e3:>16.1f} {hits:>5}")
+        # One stand-in hit per search; with RAG_HYBRID, BM25 adds its own
+        if mode == "async" and (lag > args.latency / 2 or hits < args.concurrency):
+            failed = True
+
+    import rag
+    counts = asyncio.run(run_cache(args.concurrency))
+    print(f"upstream requests: {counts[0]} for {args.concurrency} concurrent identical queries, "
+          f"{counts[1]} after a repeat, {counts[2]} after re-upsert")
+    print(f"cache stats: {rag.search_cache_stats()}")
+    if counts != [1, 1, 2]:
+        failed = True
+
+    StandInHandler.latency = args.timeout * 4
+    elapsed, outcome = asyncio.run(run_timeout(args.timeout))
+    print(f"slow stand-in ({StandInHandler.latency:.1f}s) with {args.timeout:.1f}s timeout: {outcome} after {elapsed * 1e3:.0f}ms")
+    if outcome != "TimeoutError" or elapsed > args.timeout + 0.2:
+        failed = True
+
+    server.shutdown()
+    print("FAIL" if failed else "OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Input tokens per turn of a 30-turn call, with the whole system prompt vs
+the sections for the call's stage (system_prompt.build_system_prompt).
+
+Replays the scripted console call from scripts/bench_chat_memory.py (five
+patients, six turns each, the caller giving each one's Emirates ID) through
+the tool loop's appends, with the history in a ChatMemory. The search
+results identify the caller's record the way rag.ChatSession does
+(CallFacts.add_search_hits). For the last LLM step of each turn, prints the
+system prompt and the whole input in tokens, and the share of the system
+prompt that repeats the previous request's (what a provider's prompt cache
+can reuse); then the input tokens of all steps.
+
+With --live and GROQ_API_KEY set, also measures time-to-first-token of the
+agent's model on a call context holding one patient record, with each
+prompt.
+
+Usage:
+    python scripts/bench_stage_prompt.py
+    python scripts/bench_stage_prompt.py --live --runs 5
+"""
+import os
+import sys
+import json
+import argparse
+from os.path import commonprefix
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import system_prompt  # noqa: E402
+from bench_chat_memory import script  # noqa: E402
+from chat_memory import ChatMemory  # noqa: E402
+from system_prompt import SYSTEM_PROMPT, CallFacts  # noqa: E402
+from tool_format import format_records, token_counter  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+
+def replay(turns: list[dict], staged: bool, count) -> list[dict]:
+    """Per turn, the last LLM step's system prompt and input tokens, the system
+    prompt's cached share, and the input tokens of all its steps."""
+    system_prompt.SYSTEM_PROMPT_STAGED = staged
+    memory, facts = ChatMemory(count=count), CallFacts()
+    caller_text, previous = "", ""
+    per_turn = []
+
+    def step() -> tuple[str, int]:
+        prompt = system_prompt.build_system_prompt(facts)
+        return prompt, memory.tokens([{"role": "system", "content": prompt}] + memory.messages())
+
+    for t, turn in enumerate(turns):
+        memory.append({"role": "user", "content": turn["user"]})
+        caller_text += "\n" + turn["user"]
+        steps = []
+        for s, (query, hits) in enumerate(turn["searches"]):
+            steps.append(step())
+            call_id = f"call_{t}_{s}"
+            memory.append({"role": "assistant", "content": None, "tool_calls": [{
+                "id": call_id, "type": "function",
+                "function": {"name": "pinecone_search", "arguments": json.dumps({"query": query, "top_k": 3})},
+            }]})
+            memory.append({"tool_call_id": call_id, "role": "tool", "name": "pinecone_search",
+                           "content": "\n---\n".join(hits)}, records=hits)
+            facts.add_search_hits(hits, caller_text)
+        steps.append(step())
+        # The cache can reuse what the previous request started with
+        for prompt, _ in steps:
+            cached = count(commonprefix([previous, prompt])) if previous else 0
+            previous = prompt
+        prompt, tokens = steps[-1]
+        system_tokens = count(prompt)
+        per_turn.append({
+            "stage": facts.stage,
+            "system": system_tokens,
+            "input": tokens,
+            "cached": cached / system_tokens,
+            "all_steps": sum(tokens for _, tokens in steps),
+        })
+        memory.append({"role": "assistant", "content": turn["reply"]})
+    return per_turn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=5, help="six turns each")
+    parser.add_argument("--live", action="store_true", help="measure TTFT against Groq (needs GROQ_API_KEY)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(os.path.join(DATA_DIR, "db.json")) as f:
+        patients = json.load(f)[:args.patients + 2]
+    with open(os.path.join(DATA_DIR, "pharma.json")) as f:
+        calls = json.load(f)
+    turns = script(patients, calls)[:6 * args.patients]
+
+    tokenizer, count = token_counter()
+    whole = replay(turns, False, count)
+    staged = replay(turns, True, count)
+
+    print(f"tokens ({tokenizer}); whole system prompt {count(SYSTEM_PROMPT)}; "
+          f"history in a ChatMemory; 'cached': system prompt shared with the previous request\n")
+    print(f"{'turn':>4} {'stage':<9} {'system':>7} {'staged':>7} {'input':>7} {'staged':>7} {'saved':>6} "
+          f"{'cached':>7}")
+    for t, (w, s) in enumerate(zip(whole, staged), start=1):
+        print(f"{t:>4} {s['stage']:<9} {w['system']:>7} {s['system']:>7} {w['input']:>7} {s['input']:>7} "
+              f"{1 - s['input'] / w['input']:>6.0%} {s['cached']:>7.0%}")
+    total_whole, total_staged = sum(w["all_steps"] for w in whole), sum(s["all_steps"] for s in staged)
+    print(f"\nall LLM steps: {total_whole} -> {total_staged} input tokens ({1 - total_staged / total_whole:.0%} fewer)")
+
+    if args.live:
+        from bench_tool_tokens import time_to_first_token
+
+        facts = CallFacts()
+        facts.add(patients[0])
+        system_prompt.SYSTEM_PROMPT_STAGED = True
+        prompts = {"whole": SYSTEM_PROMPT, "staged": system_prompt.build_system_prompt(facts)}
+        patient_result = format_records([patients[0]], "lines")
+        print(f"\nmedian time to first token over {args.runs} runs (one patient record in context):")
+        for name, prompt in prompts.items():
+            ttft = time_to_first_token(prompt, patient_result, "No matching drugs found.", args.runs)
+            print(f"  {name:<7} {count(prompt):>5} tokens {ttft * 1e3:>7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Prompt tokens of lookup_database / lookup_drug_code results per format.
+
+Serializes real tool results (3 patient matches, 5 drug rows) in each
+TOOL_RESULT_FORMAT and with single field groups, and counts tokens with
+tiktoken's o200k_base (the gpt-oss tokenizer family) when installed, or a
+word/punctuation approximation otherwise.
+
+With --live and GROQ_API_KEY set, also measures time-to-first-token of
+the agent's model on a call context holding the results (system prompt +
+patient lookup + drug lookup), before and after.
+
+Usage:
+    python scripts/bench_tool_tokens.py
+    python scripts/bench_tool_tokens.py --live --runs 5
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from drug_index import DrugCodeIndex  # noqa: E402
+from patient_index import PatientIndex  # noqa: E402
+from tool_format import FIELD_GROUPS, format_records, format_table, token_counter  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+
+def drug_rows(index: DrugCodeIndex, name: str) -> list[dict]:
+    # Same projection as agent._search_drug_codes
+    return [
+        {
+            "drug_code": m.get("Code", ""), "scientific_name": m.get("Scientific Name", ""),
+            "brand_name": m.get("Description", ""), "strength": m.get("Strength", ""), "route": m.get("Roa", ""),
+            "dosage_form": m.get("Dosage Form Package", ""), "unit_price_aed": m.get("Price", ""),
+            "package_size": m.get("Package Size", ""), "active": m.get("Active", ""),
+        }
+        for m in index.search(drug_name=name)
+    ]
+
+
+def time_to_first_token(system_prompt: str, patient_result: str, drug_result: str, runs: int) -> float:
+    from groq import Groq
+
+    client = Groq(api_key=os.environ["GROQ_API_KEY"])
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": "Hi, I'm calling about Fatima Al Mansoori's Plavix claim."},
+        {"role": "assistant", "content": "Looking up the record.", "tool_calls": [
+            {"id": "c1", "type": "function", "function": {"name": "lookup_database", "arguments": "{}"}},
+            {"id": "c2", "type": "function", "function": {"name": "lookup_drug_code", "arguments": "{}"}},
+        ]},
+        {"role": "tool", "tool_call_id": "c1", "content": patient_result},
+        {"role": "tool", "tool_call_id": "c2", "content": drug_result},
+        {"role": "user", "content": "So is it covered?"},
+    ]
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        stream = client.chat.completions.create(model="openai/gpt-oss-120b", messages=messages, stream=True, max_tokens=32)
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                samples.append(time.perf_counter() - start)
+                break
+    samples.sort()
+    return samples[len(samples) // 2] if samples else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="measure TTFT against Groq (needs GROQ_API_KEY)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    patients = PatientIndex.attach(os.path.join(DATA_DIR, "db.json"))
+    drugs = DrugCodeIndex.attach(os.path.join(DATA_DIR, "Claim Drug Code List.xlsx"))
+    matches = patients.lookup(patient_name="al", limit=3)
+    rows = drug_rows(drugs, "clopidogrel")
+
+    tokenizer, count = token_counter()
+    print(f"tokens ({tokenizer}); lookup_database: {len(matches)} matches, lookup_drug_code: {len(rows)} rows\n")
+    print(f"{'format':<27} {'patients':>9} {'drugs':>7} {'total':>7} {'vs pretty':>10}")
+    results = {}
+    for fmt in ("pretty", "json", "lines"):
+        results[fmt] = (format_records(matches, fmt), format_table(rows, fmt))
+    for group in FIELD_GROUPS:
+        results[f"lines, fields={group}"] = (format_records(matches, "lines", [group]), results["lines"][1])
+
+    baseline = sum(map(count, results["pretty"]))
+    for name, (patient_text, drug_text) in results.items():
+        p, d = count(patient_text), count(drug_text)
+        print(f"{name:<27} {p:>9} {d:>7} {p + d:>7} {(p + d) / baseline:>9.0%}")
+
+    if args.live:
+        from system_prompt import SYSTEM_PROMPT
+
+        print(f"\nmedian time to first token over {args.runs} runs:")
+        for fmt in ("pretty", "lines"):
+            ttft = time_to_first_token(SYSTEM_PROMPT, *results[fmt], args.runs)
+            print(f"  {fmt:<7} {ttft * 1e3:>7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks of the agent's tool paths across table sizes.
+
+Builds synthetic patient tables (the full data/db.json schema, unique IDs,
+names recombined from the real first/last names) and drug tables (the
+Claim Drug Code List columns, real rows cloned with unique codes and brand
+variants) at each --sizes, then runs a seeded query mix through:
+
+  lookup_database    PatientIndex.lookup + format_records, as the tool does
+                     (exact IDs, partial and full names, misses)
+  lookup_drug_code   DrugCodeIndex.search + the agent's row projection +
+                     format_table (codes, brands, generics, misspelled
+                     names, misses)
+  serialize_*        format_records / format_table alone, per format, on
+                     the results of the query mix
+
+and reports throughput, p50/p99 latency, hit rate and peak traced memory
+(table + index build, and the query run on top of it). Results are written
+as JSON; --compare checks them against an earlier run and exits 1 when any
+p99 grew by more than --threshold.
+
+Usage:
+    python scripts/bench_tools.py                          # 1k, 10k, 100k
+    python scripts/bench_tools.py --sizes 10000 --queries 2000
+    python scripts/bench_tools.py --compare data/bench/tools-abc1234.json
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from drug_index import DrugCodeIndex  # noqa: E402
+from patient_index import ID_FIELDS, PatientIndex  # noqa: E402
+from tool_format import FORMATS, format_records, format_table  # noqa: E402
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DATA_DIR = os.path.join(REPO_DIR, "data")
+
+BRAND_VARIANTS = ("XR", "Forte", "Plus", "Duo", "Retard", "MR", "Junior", "Max")
+
+
+def make_patients(templates: list[dict], n: int, rng: random.Random) -> list[dict]:
+    firsts = sorted({t["patient_name"].split()[0] for t in templates})
+    lasts = sorted({" ".join(t["patient_name"].split()[1:]) for t in templates})
+    records = []
+    for i in range(n):
+        record = dict(templates[i % len(templates)])
+        record.update({
+            "id": f"INS-{i:07d}",
+            "patient_id": f"PAT-{i:07d}",
+            "patient_name": f"{rng.choice(firsts)} {rng.choice(lasts)}",
+            "emirates_id": f"784-{1950 + i % 60}-{i:07d}-{i % 10}",
+            "policy_number": f"POL-{i:07d}",
+            "claim_id": f"CLM-{i:08d}",
+        })
+        records.append(record)
+    return records
+
+
+def make_drugs(rows: list[dict], n: int) -> list[dict]:
+    records = []
+    for i in range(n):
+        row = dict(rows[i % len(rows)])
+        copy = i // len(rows)
+        if copy:
+            row["Code"] = f"{row['Code']}-{copy}"
+            row["Description"] = f"{row['Description']} {BRAND_VARIANTS[(copy - 1) % len(BRAND_VARIANTS)]}"
+        records.append(row)
+    return records
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    if len(word) < 4:
+        return word + "x"
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.choice(("swap", "drop", "replace"))
+    if kind == "swap":
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if kind == "drop":
+        return word[:i] + word[i + 1:]
+    return word[:i] + rng.choice("aeiou") + word[i + 1:]
+
+
+def patient_queries(records: list[dict], count: int, rng: random.Random) -> list[tuple[str, dict]]:
+    mix = [("exact_id", 40), ("partial_name", 35), ("full_name", 10), ("miss", 15)]
+    queries = []
+    for kind in rng.choices([k for k, _ in mix], [w for _, w in mix], k=count):
+        r = rng.choice(records)
+        if kind == "exact_id":
+            field = rng.choice(ID_FIELDS)
+            queries.append((kind, {field: r[field]}))
+        elif kind == "partial_name":
+            queries.append((kind, {"patient_name": rng.choice(r["patient_name"].split()).lower()}))
+        elif kind == "full_name":
+            queries.append((kind, {"patient_name": r["patient_name"]}))
+        else:
+            queries.append((kind, {rng.choice(("claim_id", "patient_name")): "zzq-0000"}))
+    return queries
+
+
+def drug_queries(records: list[dict], count: int, rng: random.Random) -> list[tuple[str, dict]]:
+    mix = [("code", 25), ("brand", 30), ("generic", 20), ("misspelled", 20), ("miss", 5)]
+    queries = []
+    for kind in rng.choices([k for k, _ in mix], [w for _, w in mix], k=count):
+        r = rng.choice(records)
+        brand = str(r.get("Description") or "").split()
+        generic = str(r.get("Scientific Name") or "").split()
+        if kind == "code":
+            queries.append((kind, {"drug_code": r["Code"]}))
+        elif kind == "brand" and brand:
+            queries.append((kind, {"drug_name": brand[0].lower()}))
+        elif kind == "generic" and generic:
+            queries.append((kind, {"drug_name": generic[0]}))
+        elif kind == "misspelled" and brand:
+            queries.append((kind, {"drug_name": misspell(brand[0].lower(), rng)}))
+        else:
+            queries.append(("miss", {"drug_name": "zzqx"}))
+    return queries
+
+
+def drug_rows(index: DrugCodeIndex, drug_code=None, drug_name=None) -> list[dict]:
+    # Same projection as agent._search_drug_codes
+    return [
+        {
+            "drug_code": m.get("Code", ""), "scientific_name": m.get("Scientific Name", ""),
+            "brand_name": m.get("Description", ""), "strength": m.get("Strength", ""), "route": m.get("Roa", ""),
+            "dosage_form": m.get("Dosage Form Package", ""), "unit_price_aed": m.get("Price", ""),
+            "package_size": m.get("Package Size", ""), "active": m.get("Active", ""),
+        }
+        for m in index.search(drug_code=drug_code, drug_name=drug_name)
+    ]
+
+
+def run(fn, inputs: list, warmup: int) -> tuple[dict, list]:
+    """Time fn over inputs; returns (stats, outputs)."""
+    for item in inputs[:warmup]:
+        fn(item)
+    samples, outputs = [], []
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for item in inputs:
+            t = time.perf_counter_ns()
+            outputs.append(fn(item))
+            samples.append(time.perf_counter_ns() - t)
+        total = time.perf_counter() - start
+    finally:
+        gc.enable()
+    samples.sort()
+    stats = {
+        "ops": len(samples),
+        "ops_per_s": len(samples) / total if total else 0.0,
+        "p50_us": samples[len(samples) // 2] / 1e3,
+        "p99_us": samples[min(int(len(samples) * 0.99), len(samples) - 1)] / 1e3,
+        "mean_us": sum(samples) / len(samples) / 1e3,
+    }
+    return stats, outputs
+
+
+def traced_peak_mb(fn) -> tuple[float, object]:
+    """Peak memory traced while fn runs, above what was allocated before it."""
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return peak / 2**20, result
+
+
+def bench_size(n: int, templates: list[dict], xlsx_rows: list[dict], args) -> dict:
+    rng = random.Random(args.seed)
+
+    def build_patients():
+        records = make_patients(templates, n, rng)
+        return records, PatientIndex(records)
+
+    def build_drugs():
+        records = make_drugs(xlsx_rows, n)
+        return records, DrugCodeIndex(records)
+
+    build_mb, (patients, patient_index) = traced_peak_mb(build_patients)
+    drug_mb, (drugs, drug_index) = traced_peak_mb(build_drugs)
+
+    p_queries = patient_queries(patients, args.queries, rng)
+    d_queries = drug_queries(drugs, args.queries, rng)
+
+    def lookup_database(query):
+        matches = patient_index.lookup(limit=3, **query[1])
+        return matches, format_records(matches, args.format) if matches else ""
+
+    def lookup_drug_code(query):
+        rows = drug_rows(drug_index, **query[1])
+        return rows, format_table(rows, args.format) if rows else ""
+
+    ops, found = {}, {}
+    for name, fn, queries in (
+        ("lookup_database", lookup_database, p_queries),
+        ("lookup_drug_code", lookup_drug_code, d_queries),
+    ):
+        stats, outputs = run(fn, queries, args.warmup)
+        stats["hit_rate"] = sum(1 for rows, _ in outputs if rows) / len(outputs)
+        stats["hit_rate_by_kind"] = {
+            kind: round(sum(1 for (k, _), (rows, _) in zip(queries, outputs) if k == kind and rows)
+                        / max(sum(1 for k, _ in queries if k == kind), 1), 3)
+            for kind in sorted({k for k, _ in queries})
+        }
+        stats["result_bytes_mean"] = sum(len(text.encode()) for _, text in outputs) / len(outputs)
+        stats["query_peak_mb"], _ = traced_peak_mb(lambda: [fn(q) for q in queries])
+        ops[name] = stats
+        found[name] = [rows for rows, _ in outputs if rows]
+
+    for fmt in FORMATS:
+        ops[f"serialize_patients_{fmt}"], _ = run(
+            lambda rows: format_records(rows, fmt), found["lookup_database"], args.warmup
+        )
+        ops[f"serialize_drugs_{fmt}"], _ = run(lambda rows: format_table(rows, fmt), found["lookup_drug_code"], args.warmup)
+
+    return {"rows": n, "patient_build_peak_mb": build_mb, "drug_build_peak_mb": drug_mb, "ops": ops}
+
+
+def git_revision() -> str:
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", "src"], cwd=REPO_DIR, capture_output=True, text=True)
+        return rev + ("-dirty" if dirty.stdout.strip() else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> int:
+    """Print p99 and throughput ratios against a baseline run; count p99 regressions."""
+    print(f"\nvs {baseline['revision']} (p99 regression threshold {threshold:.2f}x)")
+    if baseline["params"] != current["params"]:
+        print(f"warning: baseline ran with {baseline['params']}, this run with {current['params']}")
+    print(f"{'rows':>8} {'op':<28} {'p99 before':>11} {'p99 now':>9} {'ratio':>7} {'ops/s ratio':>12}")
+    base_sizes = {s["rows"]: s for s in baseline["sizes"]}
+    regressions = 0
+    for size in current["sizes"]:
+        base = base_sizes.get(size["rows"])
+        if base is None:
+            continue
+        for op, stats in size["ops"].items():
+            before = base["ops"].get(op)
+            if before is None:
+                continue
+            ratio = stats["p99_us"] / before["p99_us"] if before["p99_us"] else 1.0
+            flag = "  REGRESSION" if ratio > threshold else ""
+            regressions += bool(flag)
+            print(
+                f"{size['rows']:>8,} {op:<28} {before['p99_us']:>9.1f}us {stats['p99_us']:>7.1f}us {ratio:>6.2f}x "
+                f"{stats['ops_per_s'] / before['ops_per_s']:>11.2f}x{flag}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=5_000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--format", default="lines", choices=FORMATS, help="TOOL_RESULT_FORMAT for the tool ops")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--output", help="JSON results path (default data/bench/tools-<revision>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier results JSON to compare p99s against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="p99 ratio counted as a regression")
+    args = parser.parse_args()
+
+    with open(os.path.join(DATA_DIR, "db.json")) as f:
+        templates = json.load(f)
+    xlsx_rows = list(DrugCodeIndex.attach(os.path.join(DATA_DIR, "Claim Drug Code List.xlsx")).records)
+
+    revision = git_revision()
+    results = {
+        "revision": revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": {k: getattr(args, k) for k in ("queries", "warmup", "format", "seed")},
+        "sizes": [],
+    }
+
+    print(f"{'rows':>8} {'op':<28} {'ops/s':>10} {'p50 us':>9} {'p99 us':>9} {'hit':>5} {'peak MB':>8}")
+    for n in args.sizes:
+        size = bench_size(n, templates, xlsx_rows, args)
+        results["sizes"].append(size)
+        for op, stats in size["ops"].items():
+            hit = f"{stats['hit_rate']:.0%}" if "hit_rate" in stats else ""
+            peak = f"{stats['query_peak_mb']:.2f}" if "query_peak_mb" in stats else ""
+            print(f"{n:>8,} {op:<28} {stats['ops_per_s']:>10,.0f} {stats['p50_us']:>9.1f} {stats['p99_us']:>9.1f} {hit:>5} {peak:>8}")
+        print(f"{n:>8,} {'build (patients / drugs)':<28} {'':>10} {'':>9} {'':>9} {'':>5} "
+              f"{size['patient_build_peak_mb']:.1f} / {size['drug_build_peak_mb']:.1f}")
+
+    output = args.output or os.path.join(DATA_DIR, "bench", f"tools-{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nwrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
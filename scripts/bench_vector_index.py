@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Recall and latency of the local vector index: IVF vs brute force.
+
+Queries are built from record fields the way callers phrase them (drug,
+denial reason, payer, patient name). Brute force over the full matrix is
+the ground truth; recall@k is the share of its top-k that IVF returns.
+Besides the real records, the matrix is grown to --scale rows with
+perturbed copies so the IVF trade-off is visible at a realistic size.
+
+Usage:
+    python scripts/bench_vector_index.py                        # hashing embedder
+    python scripts/bench_vector_index.py --embedder sentence-transformers
+    python scripts/bench_vector_index.py --scale 200000 --nprobe 1 4 16
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from vector_index import DEFAULT_SOURCES, LocalVectorIndex, _normalize_rows, get_embedder  # noqa: E402
+
+QUERY_FIELDS = [
+    ("drug_brand_name", "denial_reason", "pbm_name"),
+    ("drug_generic_name", "rejection_reason", "insurance_plan"),
+    ("patient_name", "drug_generic_name"),
+    ("drug_name", "call_outcome"),
+    ("diagnosis", "claim_status"),
+]
+
+
+def make_queries(sources, n: int, seed: int) -> list[str]:
+    import json
+
+    records = []
+    for path in sources:
+        with open(path) as f:
+            records.extend(json.load(f))
+    rng = random.Random(seed)
+    queries = []
+    while len(queries) < n:
+        record = rng.choice(records)
+        fields = rng.choice(QUERY_FIELDS)
+        words = [str(record[f]) for f in fields if record.get(f)]
+        if len(words) >= 2:
+            queries.append(" ".join(words))
+    return queries
+
+
+def grow(embeddings: np.ndarray, rows: int, seed: int) -> np.ndarray:
+    """Perturbed copies of the real rows, normalized, up to `rows` rows."""
+    rng = np.random.default_rng(seed)
+    base = embeddings[rng.integers(len(embeddings), size=rows - len(embeddings))]
+    noise = rng.normal(scale=0.5 / np.sqrt(embeddings.shape[1]), size=base.shape).astype(np.float32)
+    return np.vstack([embeddings, _normalize_rows(base + noise)])
+
+
+def evaluate(index: LocalVectorIndex, vectors: np.ndarray, top_k: int, nprobes: list[int]) -> None:
+    def run(nprobe):
+        start = time.perf_counter()
+        results = [[pos for pos, _ in index.search_vector(v, top_k, nprobe)] for v in vectors]
+        return results, (time.perf_counter() - start) / len(vectors)
+
+    truth, brute_s = run(0)
+    print(f"  {'method':<14} {'recall@' + str(top_k):>9} {'ms/query':>9}")
+    print(f"  {'brute force':<14} {1.0:>9.3f} {brute_s * 1e3:>9.3f}")
+    for nprobe in nprobes:
+        found, ivf_s = run(nprobe)
+        recall = np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(truth, found) if a])
+        print(f"  {'ivf nprobe=' + str(nprobe):<14} {recall:>9.3f} {ivf_s * 1e3:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embedder", default="hashing", choices=["hashing", "sentence-transformers"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--scale", type=int, default=100_000)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    embedder = get_embedder(args.embedder)
+    start = time.perf_counter()
+    real = LocalVectorIndex.build(DEFAULT_SOURCES, embedder, nlist=0)
+    print(f"embedded {len(real)} records with {embedder.name} in {time.perf_counter() - start:.2f}s")
+
+    queries = make_queries(DEFAULT_SOURCES, args.queries, args.seed)
+    start = time.perf_counter()
+    vectors = embedder.encode(queries)
+    print(f"query embedding: {(time.perf_counter() - start) / len(queries) * 1e3:.3f} ms/query\n")
+
+    for rows in (len(real), args.scale):
+        embeddings = real.embeddings if rows == len(real) else grow(real.embeddings, rows, args.seed)
+        nlist = max(int(np.sqrt(rows)), 1)
+        start = time.perf_counter()
+        index = LocalVectorIndex([""] * rows, embeddings, embedder, nlist=nlist)
+        print(f"{rows} rows, {nlist} IVF lists (built in {time.perf_counter() - start:.2f}s)")
+        evaluate(index, vectors, args.top_k, args.nprobe)
+        print()
+
+
+if __name__ == "__main__":
+    main()
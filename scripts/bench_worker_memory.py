@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Per-worker memory of the patient and drug tables, in-process vs shared snapshot.
+
+Starts N worker processes (one per concurrent call, as AgentServer does),
+has each load the tables, run a few lookups and report its memory from
+/proc while all N are alive. Linux only.
+
+  in-process  every worker holds its own lists of dicts + indexes (old behaviour)
+  shared      every worker attaches to the mmap'd snapshots (src/snapshot.py)
+
+RSS counts shared page-cache pages in full in every process; PSS splits them
+between the processes mapping them, so PSS x N is the real node footprint.
+
+Usage:
+    python scripts/bench_worker_memory.py                  # 1, 8, 32 workers
+    python scripts/bench_worker_memory.py --sessions 1 4
+"""
+import os
+import sys
+import gc
+import json
+import argparse
+import multiprocessing as mp
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+sys.path.insert(0, SRC_DIR)
+
+DRUG_QUERIES = ["insulin", "panadol", "clopidogrel", "amoxicillin 500", "metformin", "zz"]
+NAME_QUERIES = ["fatima", "al mansoori", "ahmed"]
+
+
+def _memory_mb() -> dict[str, float]:
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                values[key] = int(rest.split()[0]) / 1024
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                values["Pss"] = int(line.split()[1]) / 1024
+    return values
+
+
+def _worker(mode, patients_path, xlsx_path, results, done):
+    from drug_index import DrugCodeIndex
+    from patient_index import PatientIndex
+
+    if mode == "in-process":
+        with open(patients_path, "r") as f:
+            patients = PatientIndex(json.load(f))
+        drugs = DrugCodeIndex(list(DrugCodeIndex.attach(xlsx_path).records))
+    else:
+        patients = PatientIndex.attach(patients_path)
+        drugs = DrugCodeIndex.attach(xlsx_path)
+    gc.collect()
+
+    # A call's worth of lookups, so the pages a session touches are resident
+    for name in NAME_QUERIES:
+        patients.lookup(patient_name=name, limit=3)
+    for name in DRUG_QUERIES:
+        drugs.search(drug_name=name)
+
+    results.put(_memory_mb())
+    done.wait()
+
+
+def run(mode, sessions, patients_path, xlsx_path):
+    ctx = mp.get_context("spawn")
+    results, done = ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=_worker, args=(mode, patients_path, xlsx_path, results, done)) for _ in range(sessions)]
+    for p in procs:
+        p.start()
+    samples = [results.get() for _ in procs]
+    done.set()
+    for p in procs:
+        p.join()
+    return {key: sum(s[key] for s in samples) / len(samples) for key in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--patients", default=os.path.join(DATA_DIR, "db.json"))
+    parser.add_argument("--xlsx", default=os.path.join(DATA_DIR, "Claim Drug Code List.xlsx"))
+    args = parser.parse_args()
+
+    # Build the snapshots up front so no worker pays for it inside the measurement
+    from drug_index import DrugCodeIndex
+    from patient_index import PatientIndex
+    PatientIndex.attach(args.patients)
+    DrugCodeIndex.attach(args.xlsx)
+
+    print(f"{'mode':<11} {'workers':>7} {'RSS MB':>8} {'anon MB':>8} {'file MB':>8} {'PSS MB':>8} {'node PSS MB':>12}")
+    for sessions in args.sessions:
+        for mode in ("in-process", "shared"):
+            m = run(mode, sessions, args.patients, args.xlsx)
+            print(
+                f"{mode:<11} {sessions:>7} {m['VmRSS']:>8.1f} {m['RssAnon']:>8.1f} "
+                f"{m['RssFile']:>8.1f} {m['Pss']:>8.1f} {m['Pss'] * sessions:>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Offline retrieval evaluation: vector-only vs BM25-only vs hybrid (RRF).
+
+Runs against the local backend (RAG_BACKEND=local), so no network is
+needed. For each record it builds the queries a caller and the LLM would
+send: the caller's first readout (claim ID, NDC code, Emirates ID, denial
+code + name, or a description), then the details the LLM retries with
+when the record is not in the results.
+
+  hit@k             share of first queries with the record in the top k
+  calls/resolved    tool calls until the record came back, averaged over
+                    the records found within --max-calls (rag.py gives up
+                    after 3 empty lookups)
+
+Usage:
+    python scripts/eval_hybrid_retrieval.py                  # hashing embedder
+    python scripts/eval_hybrid_retrieval.py --embedder sentence-transformers
+"""
+import os
+import sys
+import json
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+def caller_queries(record: dict, rng: random.Random) -> list[str]:
+    """First readout plus the retries, for a db.json or pharma.json record."""
+    if "claim_id" in record:
+        readouts = [
+            f"claim {record['claim_id']} was denied",
+            f"NDC {record['ndc_code']}",
+            f"emirates id {record['emirates_id']}",
+            f"denial code {record['denial_code']} for {record['patient_name']}",
+            f"{record['patient_name']} {record['drug_brand_name']} for {record['diagnosis'].lower()}",
+        ]
+    else:
+        readouts = [
+            f"NDC {record['ndc_code']}",
+            f"{record['drug_name']} rejected {record['rejection_reason'].lower()} {record['pbm_name']}",
+            f"pharmacy {record['pharmacy_id']} {record['insurance_plan']} patient age {record['patient_age']} {record['drug_name']}",
+        ]
+    rng.shuffle(readouts)
+    return readouts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embedder", default="hashing", choices=["hashing", "sentence-transformers"])
+    parser.add_argument("--top-k", type=int, default=3, help="results per tool call (agent default 3)")
+    parser.add_argument("--max-calls", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    os.environ.update({"RAG_BACKEND": "local", "LOCAL_EMBEDDER": args.embedder, "PINECONE_CACHE_SIZE": "0"})
+    os.environ.setdefault("GROQ_API_KEY", "offline")
+    import rag
+    from vector_index import DEFAULT_SOURCES, record_text
+
+    bm25 = rag._get_bm25_index()
+    modes = {
+        "vector": lambda q, k: rag._vector_search(q, k, None),
+        "bm25": lambda q, k: bm25.search(q, k),
+        "hybrid": lambda q, k: rag._search_uncached(q, k, None),
+    }
+
+    records = []
+    for path in DEFAULT_SOURCES:
+        with open(path) as f:
+            records.extend(json.load(f))
+    rng = random.Random(args.seed)
+    cases = [(record_text(r), caller_queries(r, rng)) for r in records]
+
+    ks = sorted({1, args.top_k, 5})
+    print(f"{len(cases)} records, {rag._get_local_index().embedder.name}, top_k={args.top_k}, max {args.max_calls} calls")
+    print(f"{'mode':<8} " + " ".join(f"{'hit@' + str(k):>7}" for k in ks) + f" {'resolved':>9} {'calls/resolved':>15}")
+    for mode, search in modes.items():
+        hits = {k: 0 for k in ks}
+        resolved, calls = 0, 0
+        for target, queries in cases:
+            first = search(queries[0], max(ks))
+            for k in ks:
+                hits[k] += target in first[:k]
+            for attempt, query in enumerate(queries[:args.max_calls], start=1):
+                if target in search(query, args.top_k):
+                    resolved += 1
+                    calls += attempt
+                    break
+        n = len(cases)
+        print(
+            f"{mode:<8} " + " ".join(f"{hits[k] / n:>7.3f}" for k in ks)
+            + f" {resolved / n:>9.3f} {calls / max(resolved, 1):>15.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
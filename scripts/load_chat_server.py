@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Load test of the text chat server (playground/chat_server.py) against the
+Groq stand-in from scripts/sim_standins.py and the local search backend.
+
+Starts both, opens --hold idle sessions (held in memory, as a busy
+channel's quiet conversations would be), then runs --sessions
+conversations of --turns messages over WebSocket, --concurrency at a time.
+Each conversation's first message makes the model search the records, the
+others are answered directly. Reports:
+
+  sessions/s   conversations completed per second of wall clock
+  TTFT         message sent -> first reply token
+  token gap    between consecutive reply tokens of one turn
+  turn         message sent -> done
+
+plus the server's session count and resident memory.
+
+Usage:
+    python scripts/load_chat_server.py
+    python scripts/load_chat_server.py --sessions 2000 --concurrency 200 --hold 5000 --ttft-ms 300
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import contextlib
+import subprocess
+import multiprocessing
+
+import aiohttp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import sim_standins  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+SCRIPT = [
+    {"user": "I'm calling about Fatima Al Mansoori, is her Ozempic claim approved?",
+     "tools": [{"name": "pinecone_search", "arguments": {"query": "Fatima Al Mansoori Ozempic claim", "top_k": 3}}],
+     "reply": "I found Fatima Al Mansoori's record. Her Ozempic claim was denied pending prior authorization; "
+              "the insurer needs her latest HbA1c result before it can be approved."},
+    {"user": "What can we do in the meantime?",
+     "reply": "Her policy covers metformin and sitagliptin without prior authorization, so either can be "
+              "dispensed today while the Ozempic request is reviewed."},
+    {"user": "Thanks, that's all.",
+     "reply": "You're welcome. Is there anything else I can help you with today?"},
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port: int, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.1):
+            return
+        time.sleep(0.1)
+    raise SystemExit(f"nothing listening on port {port} after {timeout:.0f}s")
+
+
+def rss_mb(pid: int) -> float | None:
+    with contextlib.suppress(OSError):
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    return None
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+async def conversation(http: aiohttp.ClientSession, url: str, turns: int, results: dict) -> None:
+    """One session over one socket; records TTFT, token gaps and turn times."""
+    async with http.ws_connect(url) as ws:
+        await ws.receive_json()  # {"type": "session"}
+        for turn in SCRIPT[:turns]:
+            start = time.perf_counter()
+            await ws.send_json({"text": turn["user"]})
+            last = None
+            while True:
+                event = await ws.receive_json()
+                now = time.perf_counter()
+                if event["type"] == "token":
+                    if last is None:
+                        results["ttft"].append(now - start)
+                    else:
+                        results["gap"].append(now - last)
+                    last = now
+                elif event["type"] == "error":
+                    results["errors"] += 1
+                elif event["type"] == "done":
+                    results["turn"].append(now - start)
+                    break
+    results["sessions"] += 1
+
+
+async def load(base: str, args) -> dict:
+    results = {"ttft": [], "gap": [], "turn": [], "sessions": 0, "errors": 0, "failed": 0}
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as http:
+        created = asyncio.Semaphore(100)
+
+        async def hold():
+            async with created, http.post(f"{base}/api/chat/sessions") as resp:
+                resp.raise_for_status()
+
+        await asyncio.gather(*(hold() for _ in range(args.hold)))
+
+        slots = asyncio.Semaphore(args.concurrency)
+        ws_url = base.replace("http://", "ws://") + "/api/chat/ws"
+
+        async def one():
+            async with slots:
+                try:
+                    await conversation(http, ws_url, args.turns, results)
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                    results["failed"] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.sessions)))
+        results["wall"] = time.perf_counter() - start
+        async with http.get(f"{base}/api/chat/stats") as resp:
+            results["stats"] = await resp.json()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500, help="conversations to run")
+    parser.add_argument("--turns", type=int, default=len(SCRIPT), choices=range(1, len(SCRIPT) + 1),
+                        help="messages per conversation")
+    parser.add_argument("--concurrency", type=int, default=100, help="conversations at once")
+    parser.add_argument("--hold", type=int, default=2000, help="idle sessions opened first")
+    parser.add_argument("--ttft-ms", type=float, default=200, help="Groq stand-in time to first token")
+    parser.add_argument("--tokens-per-s", type=float, default=250, help="Groq stand-in token rate")
+    args = parser.parse_args()
+
+    llm_port, chat_port = free_port(), free_port()
+    llm = multiprocessing.Process(
+        target=sim_standins.serve, args=(llm_port, {"sim-0": SCRIPT}, 0.0, args.ttft_ms / 1e3, args.tokens_per_s, 0.0),
+        daemon=True,
+    )
+    llm.start()
+    env = {
+        **os.environ,
+        "CHAT_PORT": str(chat_port),
+        "GROQ_API_KEY": "sim-0",
+        "GROQ_BASE_URL": f"http://127.0.0.1:{llm_port}/openai/v1",
+        "RAG_BACKEND": "local",
+        "LOCAL_EMBEDDER": os.environ.get("LOCAL_EMBEDDER", "hashing"),
+    }
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "playground", "chat_server.py")], env=env)
+    try:
+        wait_for(llm_port)
+        wait_for(chat_port)
+        idle_rss = rss_mb(server.pid)
+        results = asyncio.run(load(f"http://127.0.0.1:{chat_port}", args))
+        loaded_rss = rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+        llm.terminate()
+
+    stats = results["stats"]
+    print(f"\n{args.sessions} conversations x {args.turns} messages, {args.concurrency} at once; "
+          f"LLM TTFT {args.ttft_ms:.0f}ms, {args.tokens_per_s:.0f} tokens/s")
+    print(f"completed {results['sessions']}, failed {results['failed']}, error events {results['errors']}")
+    print(f"sessions/s  {results['sessions'] / results['wall']:.1f} ({results['wall']:.1f}s)")
+    for name, key in (("TTFT", "ttft"), ("token gap", "gap"), ("turn", "turn")):
+        values = results[key]
+        if values:
+            print(f"{name:<10}  p50 {percentile(values, 0.5) * 1e3:7.1f}ms  p95 {percentile(values, 0.95) * 1e3:7.1f}ms  "
+                  f"p99 {percentile(values, 0.99) * 1e3:7.1f}ms")
+    rss = f"{idle_rss:.0f} -> {loaded_rss:.0f} MB" if idle_rss and loaded_rss else "n/a"
+    print(f"server      {stats['sessions']} sessions held, {stats['turns_done']} turns, RSS {rss}")
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for Deepgram, Groq and ElevenLabs, speaking just enough of
+each wire protocol for the agent's LiveKit plugins.
+
+  /v1/listen                 Deepgram live STT (websocket). Detects the
+                             caller's speech by energy and, --stt-delay-ms
+                             after it stops, sends the next scripted
+                             transcript as a final result. With
+                             interim_results, a growing prefix of it every
+                             INTERIM_EVERY_S of speech. --stt-drop-s closes
+                             each stream after that much audio, to exercise
+                             reconnects (src/stt.py).
+  /openai/v1/chat/completions
+                             Groq (OpenAI-compatible, SSE). After --ttft-ms,
+                             streams the scripted tool calls for the turn, or
+                             the scripted reply at --tokens-per-s.
+  /v1/text-to-speech/{voice}/multi-stream-input
+                             ElevenLabs streaming TTS (websocket). After
+                             --tts-ttfb-ms, returns silence for each text
+                             chunk (MP3 frames or raw PCM, per output_format).
+  /v1/text-to-speech/{voice}/stream
+                             ElevenLabs HTTP streaming TTS (src/tts.py). After
+                             --tts-ttfb-ms, streams the silence in chunks,
+                             TTS_SPEEDUP times faster than real time.
+
+With --connect-ms, the first request on each new connection waits that
+long, standing in for the DNS, TCP and TLS round trips to the real APIs.
+
+Each simulated call authenticates with its own API key, "sim-<n>", which
+selects its script. scripts/simulate_calls.py starts this in a subprocess;
+run it directly to poke at it with a single built-in script.
+
+Usage:
+    python scripts/sim_standins.py --port 8787
+"""
+import json
+import time
+import uuid
+import base64
+import asyncio
+import weakref
+import argparse
+
+import numpy as np
+from aiohttp import WSMsgType, web
+
+SECONDS_PER_CHAR = 0.065  # speaking rate of the synthesized replies
+ENERGY_THRESHOLD = 500    # int16 RMS separating caller speech from silence
+TTS_SPEEDUP = 4.0         # synthesis speed of the HTTP TTS stream, x real time
+INTERIM_EVERY_S = 1.0     # speech between two interim STT results
+
+
+def _call_key(request: web.Request) -> str:
+    auth = request.headers.get("Authorization", "")
+    return auth.split()[-1] if auth else request.headers.get("xi-api-key", "")
+
+
+class _Silence:
+    """Silent audio in the output_format ElevenLabs was asked for."""
+
+    def __init__(self):
+        self._mp3_frames: dict[int, list[bytes]] = {}
+
+    def _mp3(self, sample_rate: int, bitrate: int) -> list[bytes]:
+        if sample_rate not in self._mp3_frames:
+            import av
+
+            codec = av.CodecContext.create("libmp3lame", "w")
+            codec.sample_rate, codec.layout, codec.format, codec.bit_rate = sample_rate, "mono", "s32p", bitrate
+            frame = av.AudioFrame.from_ndarray(np.zeros((1, sample_rate), dtype=np.int32), format="s32p", layout="mono")
+            frame.sample_rate = sample_rate
+            packets = [bytes(p) for p in codec.encode(frame)] + [bytes(p) for p in codec.encode(None)]
+            # Drop the encoder's start/end padding frames
+            self._mp3_frames[sample_rate] = packets[2:-2] or packets
+        return self._mp3_frames[sample_rate]
+
+    def audio(self, output_format: str, seconds: float) -> bytes:
+        kind, rate, *rest = output_format.split("_")
+        rate = int(rate)
+        if kind == "pcm":
+            return bytes(2 * int(rate * seconds))
+        frames = self._mp3(rate, int(rest[0]) * 1000 if rest else 32000)
+        count = max(1, round(seconds * rate / 1152))
+        return b"".join(frames[i % len(frames)] for i in range(count))
+
+
+class StandIns:
+    def __init__(self, scripts: dict[str, list[dict]], stt_delay_s: float, ttft_s: float, tokens_per_s: float,
+                 tts_ttfb_s: float, connect_s: float = 0.0, stt_drop_s: float = 0.0):
+        self.scripts = scripts
+        self.stt_delay_s = stt_delay_s
+        self.ttft_s = ttft_s
+        self.tokens_per_s = tokens_per_s
+        self.tts_ttfb_s = tts_ttfb_s
+        self.connect_s = connect_s
+        self.stt_drop_s = stt_drop_s
+        self.silence = _Silence()
+        self._connections = weakref.WeakSet()
+
+    @web.middleware
+    async def _handshake(self, request: web.Request, handler):
+        if self.connect_s and request.transport not in self._connections:
+            self._connections.add(request.transport)
+            await asyncio.sleep(self.connect_s)
+        return await handler(request)
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._handshake])
+        app.add_routes([
+            web.get("/v1/listen", self.deepgram),
+            web.post("/openai/v1/chat/completions", self.groq),
+            web.get("/v1/text-to-speech/{voice}/multi-stream-input", self.elevenlabs),
+            web.post("/v1/text-to-speech/{voice}/stream", self.elevenlabs_http),
+        ])
+        return app
+
+    def _turns(self, key: str) -> list[dict]:
+        return self.scripts.get(key) or next(iter(self.scripts.values()))
+
+    # -- Deepgram ---------------------------------------------------------
+
+    async def deepgram(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        turns = self._turns(_call_key(request))
+        sample_rate = int(request.query.get("sample_rate", 16000))
+        channels = int(request.query.get("channels", 1))
+        interim = request.query.get("interim_results") == "true"
+        state = {"turn": 0, "speaking": False, "silence_s": 0.0, "audio_s": 0.0, "interims": 0}
+        pending: set[asyncio.Task] = set()
+
+        async def send_result(transcript: str, start: float, end: float, final: bool):
+            await asyncio.sleep(self.stt_delay_s)
+            words = transcript.split()
+            step = (end - start) / max(len(words), 1)
+            await ws.send_json({
+                "type": "Results", "channel_index": [0, 1], "start": start, "duration": end - start,
+                "is_final": final, "speech_final": final,
+                "channel": {"alternatives": [{
+                    "transcript": transcript, "confidence": 0.98,
+                    "words": [
+                        {"word": w.lower().strip(".,?!"), "punctuated_word": w, "start": start + i * step,
+                         "end": start + (i + 1) * step, "confidence": 0.98}
+                        for i, w in enumerate(words)
+                    ],
+                }]},
+                "metadata": {"request_id": str(uuid.uuid4())},
+            })
+
+        def schedule(transcript: str, end: float, final: bool):
+            task = asyncio.create_task(send_result(transcript, state["speech_start"], end, final))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        def end_utterance(end: float):
+            state["speaking"] = False
+            turn = turns[min(state["turn"], len(turns) - 1)]
+            state["turn"] += 1
+            schedule(turn["user"], end, True)
+
+        async for msg in ws:
+            if msg.type == WSMsgType.TEXT:
+                if json.loads(msg.data).get("type") == "CloseStream":
+                    # Like Deepgram, finalize what was heard before closing
+                    if state["speaking"]:
+                        end_utterance(state["audio_s"] - state["silence_s"])
+                    await asyncio.gather(*pending, return_exceptions=True)
+                    break
+                continue
+            if msg.type != WSMsgType.BINARY:
+                continue
+            samples = np.frombuffer(msg.data, dtype=np.int16)
+            chunk_s = len(samples) / channels / sample_rate
+            state["audio_s"] += chunk_s
+            loud = len(samples) and np.sqrt(np.mean(samples.astype(np.float32) ** 2)) > ENERGY_THRESHOLD
+            if loud:
+                if not state["speaking"]:
+                    state["speaking"], state["speech_start"], state["interims"] = True, state["audio_s"] - chunk_s, 0
+                state["silence_s"] = 0.0
+                # An interim result, one more word of the transcript, per INTERIM_EVERY_S of speech
+                if interim and state["audio_s"] - state["speech_start"] >= (state["interims"] + 1) * INTERIM_EVERY_S:
+                    state["interims"] += 1
+                    words = turns[min(state["turn"], len(turns) - 1)]["user"].split()
+                    schedule(" ".join(words[:min(state["interims"], len(words))]), state["audio_s"], False)
+            elif state["speaking"]:
+                state["silence_s"] += chunk_s
+                # Deepgram's endpointing: a short silence closes the utterance
+                if state["silence_s"] >= 0.1:
+                    end_utterance(state["audio_s"] - state["silence_s"])
+            if self.stt_drop_s and state["audio_s"] >= self.stt_drop_s:
+                await ws.close(code=1011, message=b"stand-in drop")
+                break
+        for task in list(pending):
+            task.cancel()
+        return ws
+
+    # -- Groq ---------------------------------------------------------------
+
+    async def groq(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        turns = self._turns(_call_key(request))
+        messages = body.get("messages", [])
+        user_turns = sum(1 for m in messages if m.get("role") == "user")
+        turn = turns[min(max(user_turns - 1, 0), len(turns) - 1)]
+        after_tools = bool(messages) and messages[-1].get("role") == "tool"
+
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        completion_id, created = f"chatcmpl-{uuid.uuid4().hex[:12]}", int(time.time())
+
+        async def send(delta: dict, finish_reason: str | None = None, usage: dict | None = None):
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": body.get("model"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if usage is None else [],
+            }
+            if usage is not None:
+                chunk["usage"] = usage
+            await resp.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages) // 4
+        await asyncio.sleep(self.ttft_s)
+        if turn.get("tools") and not after_tools:
+            calls = [
+                {"index": i, "id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+                 "function": {"name": t["name"], "arguments": json.dumps(t["arguments"])}}
+                for i, t in enumerate(turn["tools"])
+            ]
+            await send({"role": "assistant", "tool_calls": calls})
+            await send({}, "tool_calls")
+            completion_tokens = 20 * len(calls)
+        else:
+            tokens = [w + " " for w in turn["reply"].split()]
+            await send({"role": "assistant", "content": ""})
+            for token in tokens:
+                await send({"content": token})
+                await asyncio.sleep(1 / self.tokens_per_s)
+            await send({}, "stop")
+            completion_tokens = len(tokens)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send({}, usage={"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                  "total_tokens": prompt_tokens + completion_tokens})
+        # [DONE] and the end of the body in one write: the client stops reading
+        # at [DONE], and keeps the connection only if the body is complete
+        await resp.write_eof(b"data: [DONE]\n\n")
+        return resp
+
+    # -- ElevenLabs -------------------------------------------------------
+
+    async def elevenlabs(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        output_format = request.query.get("output_format", "mp3_22050_32")
+        contexts: dict[str, dict] = {}
+        send_lock = asyncio.Lock()
+
+        async def send(payload: dict):
+            async with send_lock:
+                if not ws.closed:
+                    await ws.send_json(payload)
+
+        async def synthesize(context_id: str, queue: asyncio.Queue):
+            first = True
+            while True:
+                text = await queue.get()
+                if text is None:
+                    break
+                if first:
+                    await asyncio.sleep(self.tts_ttfb_s)
+                    first = False
+                audio = self.silence.audio(output_format, len(text) * SECONDS_PER_CHAR)
+                await send({"audio": base64.b64encode(audio).decode(), "contextId": context_id, "isFinal": None})
+            await send({"contextId": context_id, "isFinal": True})
+
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            data = json.loads(msg.data)
+            context_id = data.get("context_id", "")
+            ctx = contexts.get(context_id)
+            if ctx is None:
+                queue = asyncio.Queue()
+                ctx = contexts[context_id] = {"queue": queue, "task": asyncio.create_task(synthesize(context_id, queue))}
+            if data.get("close_context"):
+                ctx["queue"].put_nowait(None)
+            elif data.get("text", "").strip():
+                ctx["queue"].put_nowait(data["text"])
+        for ctx in contexts.values():
+            ctx["task"].cancel()
+        return ws
+
+    async def elevenlabs_http(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        output_format = request.query.get("output_format", "mp3_44100_128")
+        seconds = len(body.get("text", "")) * SECONDS_PER_CHAR
+        audio = self.silence.audio(output_format, seconds)
+        resp = web.StreamResponse(headers={"Content-Type": "audio/mpeg" if output_format.startswith("mp3") else
+                                           "application/octet-stream"})
+        await resp.prepare(request)
+        await asyncio.sleep(self.tts_ttfb_s)
+        # Quarter-second chunks, each taking a quarter second / TTS_SPEEDUP to "synthesize"
+        step = max(1, int(len(audio) * 0.25 / seconds)) if seconds else len(audio) or 1
+        for i in range(0, len(audio), step):
+            await resp.write(audio[i:i + step])
+            await asyncio.sleep(0.25 / TTS_SPEEDUP)
+        await resp.write_eof()
+        return resp
+
+
+def serve(port: int, scripts: dict[str, list[dict]], stt_delay_s: float, ttft_s: float, tokens_per_s: float,
+          tts_ttfb_s: float, connect_s: float = 0.0, stt_drop_s: float = 0.0) -> None:
+    standins = StandIns(scripts, stt_delay_s, ttft_s, tokens_per_s, tts_ttfb_s, connect_s, stt_drop_s)
+    web.run_app(standins.app(), host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--stt-delay-ms", type=float, default=250)
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--tokens-per-s", type=float, default=250)
+    parser.add_argument("--tts-ttfb-ms", type=float, default=200)
+    parser.add_argument("--connect-ms", type=float, default=0, help="delay on each new connection")
+    parser.add_argument("--stt-drop-s", type=float, default=0,
+                        help="close each STT stream after this much audio (0: never)")
+    args = parser.parse_args()
+    script = [
+        {"user": "I'm calling about Fatima Al Mansoori.",
+         "tools": [{"name": "lookup_database", "arguments": {"patient_name": "Fatima Al Mansoori"}}],
+         "reply": "I found Fatima Al Mansoori's record. How can I help with her claim?"},
+    ]
+    print(f"stand-ins on http://127.0.0.1:{args.port}", flush=True)
+    serve(args.port, {"sim-0": script}, args.stt_delay_ms / 1e3, args.ttft_ms / 1e3, args.tokens_per_s,
+          args.tts_ttfb_ms / 1e3, args.connect_ms / 1e3, args.stt_drop_s)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Offline load test of the voice pipeline: N concurrent simulated calls
+through the real pharmacy AgentSession (tools, prompt, LiveKit plugins),
+with Deepgram, Groq and ElevenLabs replaced by local stand-ins
+(scripts/sim_standins.py, run in a subprocess so their CPU is not counted).
+
+Each call follows a script built from a data/db.json record: the caller
+names the patient (lookup_database), asks about the drug
+(lookup_drug_code), asks about the denial (pinecone_search over the local
+RAG backend) and says goodbye. The caller speaks in real time (a voiced
+noise burst, 0.3s per word), waits for the agent to finish talking, and
+answers after --think-ms. The agent's audio is played out in real time
+into a silent sink.
+
+The caller's audio is not real speech, so Silero cannot hear it; calls use
+an energy-threshold VAD with Silero's default timings instead, and the
+Silero inference cost per call is not part of the CPU figures.
+
+Reports the per-stage turn latency distributions from turn_metrics.py
+(end of speech -> playout start is the one callers feel), plus this
+process's CPU and peak RSS while the calls run, as a worker would see them.
+
+Usage:
+    python scripts/simulate_calls.py                          # 4 calls
+    python scripts/simulate_calls.py --calls 20 --ttft-ms 600 --output sim.json
+    python scripts/simulate_calls.py --connect-ms 150 --cold     # vs. without --cold
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import multiprocessing as mp
+
+import numpy as np
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(SCRIPTS_DIR, "..", "src")
+DATA_DIR = os.path.join(SCRIPTS_DIR, "..", "data")
+sys.path.insert(0, SRC_DIR)
+
+import sim_standins  # noqa: E402
+
+SAMPLE_RATE = 16000
+FRAME_S = 0.02
+SECONDS_PER_WORD = 0.3
+
+
+def call_script(record: dict) -> list[dict]:
+    """The caller's turns, the tool calls the LLM makes for each and its reply."""
+    name, brand = record["patient_name"], record["drug_brand_name"]
+    return [
+        {"user": f"Hi, I'm calling about a claim for {name}, Emirates ID {record['emirates_id']}.",
+         "tools": [{"name": "lookup_database", "arguments": {"emirates_id": record["emirates_id"]}}],
+         "reply": f"I found {name}'s record. The {brand} claim is {record['claim_status'].lower()}. "
+                  "What would you like to know about it?"},
+        {"user": f"Is {brand} covered on the plan?",
+         "tools": [{"name": "lookup_drug_code", "arguments": {"drug_name": brand}}],
+         "reply": f"{brand} is on the drug code list. Under the {record['insurance_plan']} plan the copay is "
+                  f"{record['copay_percentage']} percent, and prior authorization is "
+                  f"{'required' if record['pa_required'] else 'not required'}."},
+        {"user": f"Why was it denied with code {record['denial_code']}?",
+         "tools": [{"name": "pinecone_search", "arguments": {"query": f"denial code {record['denial_code']} {brand}"}}],
+         "reply": f"The denial reason is {record['denial_reason']}. The recommended resolution is to "
+                  f"{record['recommended_resolution'].lower()}."},
+        {"user": "Okay, thank you. Goodbye.",
+         "reply": "Thank you for calling. Goodbye."},
+    ]
+
+
+def _memory_mb() -> tuple[float, float]:
+    """Current and peak RSS of this process."""
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                values[key] = int(rest.split()[0]) / 1024
+    return values["VmRSS"], values["VmHWM"]
+
+
+def _build_plugins():
+    """Classes subclassing the LiveKit interfaces, defined once agent has been imported."""
+    from livekit import rtc
+    from livekit.agents import vad
+    from livekit.agents.voice import io
+
+    class EnergyVAD(vad.VAD):
+        """RMS threshold VAD with Silero's default timings (the simulated caller is not speech)."""
+
+        def __init__(self, threshold: float = sim_standins.ENERGY_THRESHOLD, min_speech_s: float = 0.05,
+                     min_silence_s: float = 0.55):
+            super().__init__(capabilities=vad.VADCapabilities(update_interval=0.032))
+            self.threshold, self.min_speech_s, self.min_silence_s = threshold, min_speech_s, min_silence_s
+
+        def stream(self) -> "EnergyVADStream":
+            return EnergyVADStream(self)
+
+    class EnergyVADStream(vad.VADStream):
+        async def _main_task(self) -> None:
+            opts: EnergyVAD = self._vad
+            speaking, speech_s, silence_s, samples, frames = False, 0.0, 0.0, 0, []
+            async for frame in self._input_ch:
+                if isinstance(frame, self._FlushSentinel):
+                    speaking, speech_s, silence_s, frames = False, 0.0, 0.0, []
+                    continue
+                start = time.perf_counter()
+                pcm = np.frombuffer(frame.data, dtype=np.int16).astype(np.float32)
+                loud = bool(len(pcm)) and float(np.sqrt(np.mean(pcm * pcm))) > opts.threshold
+                samples += frame.samples_per_channel
+                if loud:
+                    speech_s, silence_s = speech_s + frame.duration, 0.0
+                else:
+                    silence_s += frame.duration
+                if speaking or loud:
+                    frames.append(frame)
+
+                def event(kind, **extra):
+                    return vad.VADEvent(
+                        type=kind, samples_index=samples, timestamp=samples / frame.sample_rate,
+                        speech_duration=speech_s, silence_duration=silence_s,
+                        inference_duration=time.perf_counter() - start, **extra,
+                    )
+
+                self._event_ch.send_nowait(event(
+                    vad.VADEventType.INFERENCE_DONE, frames=[frame], probability=float(loud), speaking=speaking,
+                    raw_accumulated_speech=speech_s if loud else 0.0, raw_accumulated_silence=silence_s,
+                ))
+                if not speaking and speech_s >= opts.min_speech_s:
+                    speaking = True
+                    self._event_ch.send_nowait(event(vad.VADEventType.START_OF_SPEECH, frames=list(frames), speaking=True))
+                elif speaking and silence_s >= opts.min_silence_s:
+                    self._event_ch.send_nowait(event(vad.VADEventType.END_OF_SPEECH, frames=frames, speaking=False))
+                    speaking, speech_s, frames = False, 0.0, []
+                elif not speaking and not loud:
+                    speech_s, frames = 0.0, []
+
+    class CallerAudio(io.AudioInput):
+        """A microphone: 20ms frames in real time, silence unless `speak` queued a burst."""
+
+        def __init__(self, seed: int):
+            super().__init__(label="Simulated caller")
+            self._rng = np.random.default_rng(seed)
+            self._pending: list[bytes] = []
+            self._spoken: asyncio.Event | None = None
+            self._next = 0.0
+            self._closed = False
+            self._silence = bytes(2 * int(SAMPLE_RATE * FRAME_S))
+
+        def speak(self, seconds: float) -> asyncio.Event:
+            n = int(SAMPLE_RATE * FRAME_S)
+            t = np.arange(int(seconds / FRAME_S) * n) / SAMPLE_RATE
+            voiced = 4000 * np.sin(2 * np.pi * 140 * t) + self._rng.normal(0, 1500, len(t))
+            pcm = np.clip(voiced, -32768, 32767).astype(np.int16).tobytes()
+            self._pending = [pcm[i:i + 2 * n] for i in range(0, len(pcm), 2 * n)]
+            self._spoken = asyncio.Event()
+            return self._spoken
+
+        def close(self) -> None:
+            self._closed = True
+
+        async def __anext__(self) -> rtc.AudioFrame:
+            if self._closed:
+                raise StopAsyncIteration
+            now = time.monotonic()
+            self._next = max(self._next + FRAME_S, now) if self._next else now
+            await asyncio.sleep(self._next - now)
+            if self._pending:
+                data = self._pending.pop(0)
+                if not self._pending and self._spoken is not None:
+                    self._spoken.set()
+            else:
+                data = self._silence
+            return rtc.AudioFrame(data, SAMPLE_RATE, 1, len(data) // 2)
+
+    class PlayoutSink(io.AudioOutput):
+        """Discards the agent's audio but reports playback in real time, like a caller's speaker."""
+
+        def __init__(self):
+            super().__init__(label="Simulated playout", capabilities=io.AudioOutputCapabilities(pause=False))
+            self._pushed = 0.0
+            self._started = 0.0
+            self._flush_task: asyncio.Task | None = None
+            self._interrupted = asyncio.Event()
+
+        async def capture_frame(self, frame: rtc.AudioFrame) -> None:
+            await super().capture_frame(frame)
+            if self._flush_task and not self._flush_task.done():
+                await self._flush_task
+            if not self._pushed:
+                self._started = time.monotonic()
+                self.on_playback_started(created_at=time.time())
+            self._pushed += frame.duration
+
+        def flush(self) -> None:
+            super().flush()
+            if self._pushed:
+                self._interrupted.clear()
+                self._flush_task = asyncio.create_task(self._play_out())
+
+        def clear_buffer(self) -> None:
+            if self._pushed:
+                self._interrupted.set()
+
+        async def _play_out(self) -> None:
+            remaining = self._started + self._pushed - time.monotonic()
+            try:
+                await asyncio.wait_for(self._interrupted.wait(), max(remaining, 0))
+                interrupted = True
+            except asyncio.TimeoutError:
+                interrupted = False
+            played = min(time.monotonic() - self._started, self._pushed) if interrupted else self._pushed
+            self.on_playback_finished(playback_position=played, interrupted=interrupted)
+            self._pushed = 0.0
+
+    return EnergyVAD, CallerAudio, PlayoutSink
+
+
+async def run_call(n: int, script: list[dict], agent, plugins, args) -> dict:
+    import aiohttp
+    import provider_clients
+    from turn_metrics import TurnTracker
+
+    EnergyVAD, CallerAudio, PlayoutSink = plugins
+    key = f"sim-{n}"
+    if args.cold:
+        # As before the shared clients: a connection pool per job, opened by the first request
+        http = aiohttp.ClientSession()
+        stt, chat_llm, tts = agent.make_stt(key, http), agent.make_llm(key), agent.make_tts(key, http)
+    else:
+        clients = provider_clients.shared()
+        stt = agent.make_stt(key, clients.http)
+        chat_llm = agent.make_llm(key, clients.openai_client(agent.GROQ_BASE_URL, key))
+        tts = agent.make_tts(key, clients.http)
+    session, pharmacy, _tools = agent.create_session(EnergyVAD(), stt=stt, chat_llm=chat_llm, tts=tts)
+    if not args.cold:
+        provider_clients.warm(session, agent.DEEPGRAM_URL)
+    tracker = TurnTracker(key)
+    tracker.attach(session)
+
+    caller = CallerAudio(seed=n)
+    session.input.audio = caller
+    session.output.audio = PlayoutSink()
+
+    listening = asyncio.Event()
+    speaking_at: list[float] = []
+
+    def on_agent_state(ev):
+        if ev.new_state == "speaking":
+            speaking_at.append(time.monotonic())
+        elif ev.new_state == "listening" and ev.old_state == "speaking":
+            listening.set()
+
+    session.on("agent_state_changed", on_agent_state)
+    started = time.monotonic()
+    await session.start(agent=pharmacy, record=False)
+
+    answered, first_turn_s = 0, None
+    try:
+        await asyncio.wait_for(listening.wait(), args.turn_timeout_s)  # the greeting
+        for turn in script:
+            await asyncio.sleep(args.think_ms / 1e3)
+            listening.clear()
+            spoken = caller.speak(len(turn["user"].split()) * SECONDS_PER_WORD)
+            await spoken.wait()
+            spoke_at = time.monotonic()
+            await asyncio.wait_for(listening.wait(), args.turn_timeout_s)
+            if first_turn_s is None:
+                first_turn_s = next((t for t in speaking_at if t > spoke_at), spoke_at) - spoke_at
+            answered += 1
+    except asyncio.TimeoutError:
+        print(f"call {n}: no reply to turn {answered + 1} within {args.turn_timeout_s}s", flush=True)
+    finally:
+        tracker.close()
+        caller.close()
+        await session.aclose()
+        if args.cold:
+            await http.close()
+    return {
+        "call": n, "turns": len(script), "answered": answered,
+        # Session start -> greeting audio, and the caller's first end of speech -> reply audio
+        "greeting_s": speaking_at[0] - started if speaking_at else None,
+        "first_turn_s": first_turn_s,
+    }
+
+
+async def sample_resources(stop: asyncio.Event, samples: list, interval: float = 0.5):
+    """CPU % of this process and loop lag, every `interval` seconds."""
+    last_cpu, last_wall = sum(os.times()[:2]), time.monotonic()
+    while not stop.is_set():
+        due = time.monotonic() + interval
+        await asyncio.sleep(interval)
+        lag = time.monotonic() - due
+        cpu, wall = sum(os.times()[:2]), time.monotonic()
+        rss, _ = _memory_mb()
+        samples.append({"cpu_pct": 100 * (cpu - last_cpu) / (wall - last_wall), "rss_mb": rss, "loop_lag_ms": lag * 1e3})
+        last_cpu, last_wall = cpu, wall
+
+
+def _percentiles(values: list[float]) -> dict:
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(int(len(ordered) * q), len(ordered) - 1)]  # noqa: E731
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1]} if ordered else {}
+
+
+async def main_async(args, scripts: dict[str, list[dict]]):
+    import agent
+    import rag
+    import turn_metrics
+    import provider_clients
+    from livekit.agents.utils import http_context
+
+    if not args.cold:
+        # What the worker's prewarm does before a process takes a job
+        rag.warm()
+
+    plugins = _build_plugins()
+    _, rss_before_peak = _memory_mb()
+    rss_before, _ = _memory_mb()
+    stop, samples = asyncio.Event(), []
+    sampler = asyncio.create_task(sample_resources(stop, samples))
+    cpu_start, wall_start = sum(os.times()[:2]), time.monotonic()
+
+    async def staggered(n: int):
+        await asyncio.sleep(n * args.ramp_s)
+        return await run_call(n, scripts[f"sim-{n}"], agent, plugins, args)
+
+    async with http_context.open():
+        calls = await asyncio.gather(*(staggered(n) for n in range(args.calls)))
+        await provider_clients.aclose()
+    cpu_s, wall_s = sum(os.times()[:2]) - cpu_start, time.monotonic() - wall_start
+    stop.set()
+    await sampler
+    _, peak_rss = _memory_mb()
+
+    stages = turn_metrics.percentiles()
+    cpu = _percentiles([s["cpu_pct"] for s in samples])
+    lag = _percentiles([s["loop_lag_ms"] for s in samples])
+    answered = sum(c["answered"] for c in calls)
+
+    print(f"\n{args.calls} calls, {answered}/{sum(c['turns'] for c in calls)} turns answered in {wall_s:.1f}s")
+    print(f"stand-ins: STT +{args.stt_delay_ms:.0f}ms, LLM TTFT {args.ttft_ms:.0f}ms at {args.tokens_per_s:.0f} tok/s, "
+          f"TTS TTFB {args.tts_ttfb_ms:.0f}ms, connect {args.connect_ms:.0f}ms\n")
+    print(f"{'stage':<15} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for stage, p in stages.items():
+        print(f"{stage:<15} {p['n']:>5} {p['p50']:>8.0f} {p['p95']:>8.0f} {p['p99']:>8.0f}")
+    greeting = _percentiles([c["greeting_s"] * 1e3 for c in calls if c["greeting_s"] is not None])
+    first_turn = _percentiles([c["first_turn_s"] * 1e3 for c in calls if c["first_turn_s"] is not None])
+    print(f"\n{'cold' if args.cold else 'warm'} worker, first turn of each call:")
+    print(f"  greeting audio    p50 {greeting.get('p50', 0):>6.0f}ms  max {greeting.get('max', 0):>6.0f}ms  (from session start)")
+    print(f"  first reply audio p50 {first_turn.get('p50', 0):>6.0f}ms  max {first_turn.get('max', 0):>6.0f}ms  (from end of speech)")
+    print(f"\nworker CPU: {100 * cpu_s / wall_s:.0f}% mean, {cpu.get('p95', 0):.0f}% p95 "
+          f"({100 * cpu_s / wall_s / args.calls:.1f}% per call)")
+    print(f"worker RSS: {rss_before:.0f} MB before calls, {peak_rss:.0f} MB peak "
+          f"({(peak_rss - rss_before_peak) / args.calls:.1f} MB per call above the pre-call peak)")
+    print(f"event loop lag: p95 {lag.get('p95', 0):.1f}ms, max {lag.get('max', 0):.1f}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "params": {k: v for k, v in vars(args).items() if k != "output"},
+                "calls": calls, "stages_ms": stages, "greeting_ms": greeting, "first_turn_ms": first_turn,
+                "cpu": {"mean_pct": 100 * cpu_s / wall_s, **{f"{k}_pct": v for k, v in cpu.items()}},
+                "rss_mb": {"before": rss_before, "peak": peak_rss},
+                "loop_lag_ms": lag, "samples": samples,
+            }, f, indent=2)
+        print(f"wrote {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=4)
+    parser.add_argument("--ramp-s", type=float, default=0.5, help="delay between call starts")
+    parser.add_argument("--think-ms", type=float, default=400, help="caller pause before answering")
+    parser.add_argument("--stt-delay-ms", type=float, default=250)
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--tokens-per-s", type=float, default=250)
+    parser.add_argument("--tts-ttfb-ms", type=float, default=200)
+    parser.add_argument("--connect-ms", type=float, default=0,
+                        help="stand-in handshake cost of each new connection (DNS, TCP, TLS)")
+    parser.add_argument("--cold", action="store_true",
+                        help="no worker warm-up: per-call connection pools, search indexes loaded on first use")
+    parser.add_argument("--turn-timeout-s", type=float, default=30)
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--seed", type=int, default=3)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    with open(os.path.join(DATA_DIR, "db.json")) as f:
+        records = json.load(f)
+    rng = random.Random(args.seed)
+    scripts = {f"sim-{n}": call_script(rng.choice(records)) for n in range(args.calls)}
+
+    standins = mp.get_context("spawn").Process(
+        target=sim_standins.serve,
+        args=(args.port, scripts, args.stt_delay_ms / 1e3, args.ttft_ms / 1e3, args.tokens_per_s,
+              args.tts_ttfb_ms / 1e3, args.connect_ms / 1e3),
+        daemon=True,
+    )
+    standins.start()
+
+    base = f"http://127.0.0.1:{args.port}"
+    os.environ.update({
+        "DEEPGRAM_URL": f"{base}/v1/listen", "GROQ_BASE_URL": f"{base}/openai/v1", "ELEVEN_BASE_URL": f"{base}/v1",
+        "DEEPGRAM_API_KEY": "sim", "GROQ_API_KEY": "sim", "ELEVEN_API_KEY": "sim",
+        "RAG_BACKEND": "local", "LOCAL_EMBEDDER": os.environ.get("LOCAL_EMBEDDER", "hashing"),
+    })
+    try:
+        asyncio.run(main_async(args, scripts))
+    finally:
+        standins.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,21 @@
+import asyncio
 import logging
 import sys
 import os
+import tempfile
+import time
 from dotenv import load_dotenv
-from system_prompt import SYSTEM_PROMPT
-import json
-import openpyxl
-from rag import pinecone_search as _rag_pinecone_search
+from system_prompt import CallFacts, build_system_prompt
+from drug_index import DrugCodeIndex
+from patient_index import PatientIndex
+from patient_store import open_patient_store
+from drug_prefetch import DrugCodePrefetcher
+from tool_format import FORMATS, format_records, format_table, parse_groups
+from turn_metrics import TurnTracker, flush_tracing, format_percentiles
+from rag import pinecone_search_async as _rag_pinecone_search, warm as _warm_search
+import provider_clients
+from audio_cache import AudioCache, match_phrase
+from coverage_rules import check_coverage as _check_coverage, format_verdict
 
 load_dotenv()
 
@@ -42,10 +52,14 @@ _REQUIRED_KEYS = [
     ("DEEPGRAM_API_KEY", "STT (speech-to-text)"),
     ("ELEVEN_API_KEY", "TTS (text-to-speech)"),
     ("GROQ_API_KEY", "LLM"),
-    ("PINECONE_API_KEY", "RAG search"),
-    ("PINECONE_HOST", "RAG search"),
-    ("PINECONE_NAMESPACE", "RAG search"),
 ]
+# The local RAG backend searches data/*.json in-process and needs no Pinecone keys
+if config("RAG_BACKEND", default="pinecone") == "pinecone":
+    _REQUIRED_KEYS += [
+        ("PINECONE_API_KEY", "RAG search"),
+        ("PINECONE_HOST", "RAG search"),
+        ("PINECONE_NAMESPACE", "RAG search"),
+    ]
 
 
 def _validate_env():
@@ -61,69 +75,72 @@ def _validate_env():
         raise SystemExit(1)
 
 
-server = AgentServer()
+# Turn latency histograms (see turn_metrics.py) are served on
+# :METRICS_PORT/metrics. Job processes write them to a shared multiprocess
+# directory so the endpoint covers every call on the worker.
+METRICS_PORT = config("METRICS_PORT", default=0, cast=int) or None
+METRICS_MULTIPROC_DIR = config(
+    "PROMETHEUS_MULTIPROC_DIR", default=os.path.join(tempfile.gettempdir(), "pharma-agent-metrics")
+)
+
+server = AgentServer(
+    prometheus_port=METRICS_PORT,
+    prometheus_multiproc_dir=METRICS_MULTIPROC_DIR if METRICS_PORT else None,
+)
 
 
 def prewarm(proc):
-    """Prewarm VAD for faster startup."""
+    """Load the VAD model and the search indexes before the process takes a job.
+
+    Provider connections need the job's event loop; the entrypoint opens them
+    first thing (provider_clients.warm)."""
+    start = time.perf_counter()
     proc.userdata["vad"] = silero.VAD.load()
+    _warm_search()
+    print(f"[PHARMA] >>> Process prewarmed in {(time.perf_counter() - start) * 1e3:.0f}ms", flush=True)
 
 
 server.setup_fnc = prewarm
 
-# Load the database once
+# Load the database once. With the default json backend, rows and lookup
+# indexes live in a memory-mapped snapshot next to the source (built on first
+# use), so every worker process on the node shares the same read-only pages.
+# PATIENT_BACKEND=sqlite serves lookups from an indexed SQLite file instead.
 DB_PATH = "data/db.json"
+PATIENT_BACKEND = config("PATIENT_BACKEND", default="json")
+PATIENT_SQLITE_PATH = config("PATIENT_SQLITE_PATH", default="data/patients.sqlite")
 try:
-    with open(DB_PATH, "r") as f:
-        PATIENT_DB = json.load(f)
-    print(f"[PHARMA] >>> Loaded {len(PATIENT_DB)} records from {DB_PATH}", flush=True)
+    PATIENT_STORE = open_patient_store(PATIENT_BACKEND, DB_PATH, PATIENT_SQLITE_PATH)
+    print(f"[PHARMA] >>> Loaded {len(PATIENT_STORE)} records ({PATIENT_BACKEND} backend)", flush=True)
 except Exception as e:
     print(f"[PHARMA] >>> ERROR loading DB: {e}", flush=True)
-    PATIENT_DB = []
+    PATIENT_STORE = PatientIndex([])
+
+# How tool results are serialized into the LLM context (see tool_format.py)
+TOOL_RESULT_FORMAT = config("TOOL_RESULT_FORMAT", default="lines")
+if TOOL_RESULT_FORMAT not in FORMATS:
+    print(f"[PHARMA] >>> WARNING: unknown TOOL_RESULT_FORMAT {TOOL_RESULT_FORMAT!r}, using 'lines'", flush=True)
+    TOOL_RESULT_FORMAT = "lines"
 
-# Load the drug code Excel file once
+# Load the drug code Excel file once (same shared snapshot scheme)
 DRUG_CODE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "Claim Drug Code List.xlsx")
-DRUG_CODE_DB = []
 try:
-    wb = openpyxl.load_workbook(DRUG_CODE_PATH, read_only=True, data_only=True)
-    ws = wb.active
-    headers = [cell.value for cell in ws[1]]
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, values_only=True):
-        record = dict(zip(headers, row))
-        DRUG_CODE_DB.append(record)
-    wb.close()
-    print(f"[PHARMA] >>> Loaded {len(DRUG_CODE_DB)} drug codes from {DRUG_CODE_PATH}", flush=True)
+    DRUG_CODE_INDEX = DrugCodeIndex.attach(DRUG_CODE_PATH)
+    print(f"[PHARMA] >>> Loaded {len(DRUG_CODE_INDEX)} drug codes from {DRUG_CODE_PATH}", flush=True)
 except Exception as e:
     print(f"[PHARMA] >>> ERROR loading drug code list: {e}", flush=True)
-    DRUG_CODE_DB = []
-
+    DRUG_CODE_INDEX = DrugCodeIndex([])
+DRUG_CODE_DB = DRUG_CODE_INDEX.records
 
 def _search_drug_codes(drug_code: str | None = None, drug_name: str | None = None, max_results: int = 5) -> list[dict]:
-    """Search the in-memory drug code database by code or name (brand/scientific)."""
-    matches = []
-    for record in DRUG_CODE_DB:
-        # Exact match on drug code
-        if drug_code:
-            code_val = str(record.get("Code", "")).strip()
-            if drug_code.strip().lower() == code_val.lower():
-                matches.append(record)
-                continue
+    """Search the drug code database by code or name (brand/scientific).
 
-        # Partial case-insensitive match on name fields
-        if drug_name:
-            search_term = drug_name.strip().lower()
-            scientific = str(record.get("Scientific Name", "")).lower()
-            brand = str(record.get("Description", "")).lower()
-            if search_term in scientific or search_term in brand:
-                matches.append(record)
-                continue
-
-        if len(matches) >= max_results:
-            break
+    Results are ranked: exact code, then name prefix, whole word, substring."""
+    matches = DRUG_CODE_INDEX.search(drug_code=drug_code, drug_name=drug_name, max_results=max_results)
 
     # Format results for the agent
     results = []
-    for m in matches[:max_results]:
+    for m in matches:
         results.append({
             "drug_code": m.get("Code", ""),
             "scientific_name": m.get("Scientific Name", ""),
@@ -137,158 +154,299 @@ def _search_drug_codes(drug_code: str | None = None, drug_name: str | None = Non
         })
     return results
 
-@server.rtc_session(agent_name="pharmacy-agent")
-async def pharmacy_agent(ctx: JobContext):
-    print(f"[PHARMA] >>> Entrypoint called for room {ctx.room.name}", flush=True)
-    logger.info(f"Starting agent for room {ctx.room.name}")
 
-    try:
-        initial_ctx = llm.ChatContext()
-        
-        # Use shared system prompt from rag.py
-        initial_ctx.add_message(
-            content=SYSTEM_PROMPT,
-            role="system",
+class PharmacyTools:
+    def __init__(self):
+        # Drug codes for the patient's prescription and alternatives are
+        # resolved in the background as soon as the record is found
+        self.drug_prefetch = DrugCodePrefetcher(_search_drug_codes)
+        # The member this call is about, once a lookup settles on one record
+        self.facts = CallFacts()
+
+    @llm.function_tool(
+        description="Semantic search over the insurance and pharmacy database. Use this to find similar past cases, check general policy rules, or search when you don't have an exact identifier. Returns patient records including policy details, medication coverage, claim status, denial codes, dispensing history, and alternative drug availability."
+    )
+    async def pinecone_search(self, query: str, top_k: int = 3):
+        logger.info(f"Searching Pinecone for: {query}")
+        try:
+            results = await _rag_pinecone_search(query, top_k)
+        except Exception as e:
+            logger.exception("RAG pinecone_search failed")
+            print(f"[PHARMA] >>> RAG ERROR: {e}", flush=True)
+            return f"Search failed: {e}. Please try rephrasing or ask without database lookup."
+        if not results:
+            return "No relevant records found."
+        return "\n\n".join(results)
+
+    @llm.function_tool(
+        description="Look up a specific patient record by Emirates ID, Policy Number, Member Card Number, Claim ID, Patient ID, or Patient Name. Use this FIRST when you have a specific identifier. Returns: patient identity, insurance policy details (plan, copay, limits, active status), prescription details, dispensing history (prior dispenses, already dispensed this cycle), claim status, denial code and reason, recommended resolution, inventory status, and alternative drugs with availability. To re-check one part of a record already found, pass fields with only the groups you need (identity, policy, prescription, claim, inventory)."
+    )
+    async def lookup_database(
+        self,
+        emirates_id: str | None = None,
+        policy_number: str | None = None,
+        member_card_number: str | None = None,
+        claim_id: str | None = None,
+        patient_id: str | None = None,
+        patient_name: str | None = None,
+        fields: str | None = None,
+    ):
+        """
+        Retrieves a patient record from the local database by exact match on identifiers.
+        member_card_number is treated as a policy number lookup.
+        For patient_name, performs a case-insensitive partial match.
+        fields optionally limits the result to comma-separated groups:
+        identity, policy, prescription, claim, inventory (default: all).
+        """
+        # member_card_number maps to policy_number in the DB
+        effective_policy = policy_number or member_card_number
+
+        logger.info(
+            f"DB Lookup: eid={emirates_id}, pol={effective_policy}, clm={claim_id}, pid={patient_id}, name={patient_name}"
         )
 
-        class PharmacyTools:
-            @llm.function_tool(
-                description="Semantic search over the insurance and pharmacy database. Use this to find similar past cases, check general policy rules, or search when you don't have an exact identifier. Returns patient records including policy details, medication coverage, claim status, denial codes, dispensing history, and alternative drug availability."
-            )
-            async def pinecone_search(self, query: str, top_k: int = 3):
-                logger.info(f"Searching Pinecone for: {query}")
-                try:
-                    results = _rag_pinecone_search(query, top_k)
-                except Exception as e:
-                    logger.exception("RAG pinecone_search failed")
-                    print(f"[PHARMA] >>> RAG ERROR: {e}", flush=True)
-                    return f"Search failed: {e}. Please try rephrasing or ask without database lookup."
-                if not results:
-                    return "No relevant records found."
-                return "\n\n".join(results)
-
-            @llm.function_tool(
-                description="Look up a specific patient record by Emirates ID, Policy Number, Member Card Number, Claim ID, Patient ID, or Patient Name. Use this FIRST when you have a specific identifier. Returns: patient identity, insurance policy details (plan, copay, limits, active status), prescription details, dispensing history (prior dispenses, already dispensed this cycle), claim status, denial code and reason, recommended resolution, inventory status, and alternative drugs with availability."
-            )
-            async def lookup_database(
-                self,
-                emirates_id: str | None = None,
-                policy_number: str | None = None,
-                member_card_number: str | None = None,
-                claim_id: str | None = None,
-                patient_id: str | None = None,
-                patient_name: str | None = None,
-            ):
-                """
-                Retrieves a patient record from the local database by exact match on identifiers.
-                member_card_number is treated as a policy number lookup.
-                For patient_name, performs a case-insensitive partial match.
-                """
-                # member_card_number maps to policy_number in the DB
-                effective_policy = policy_number or member_card_number
-
-                logger.info(
-                    f"DB Lookup: eid={emirates_id}, pol={effective_policy}, clm={claim_id}, pid={patient_id}, name={patient_name}"
-                )
-                
-                matches = []
-                for record in PATIENT_DB:
-                    # check EMIRATES ID
-                    if emirates_id and record.get("emirates_id") == emirates_id:
-                        matches.append(record)
-                        continue
-                    
-                    # check POLICY NUMBER / MEMBER CARD NUMBER
-                    if effective_policy and record.get("policy_number") == effective_policy:
-                        matches.append(record)
-                        continue
-
-                    # check CLAIM ID
-                    if claim_id and record.get("claim_id") == claim_id:
-                        matches.append(record)
-                        continue
-
-                    # check PATIENT ID
-                    if patient_id and record.get("patient_id") == patient_id:
-                        matches.append(record)
-                        continue
-
-                    # check NAME (partial match)
-                    if patient_name:
-                        rec_name = record.get("patient_name", "").lower()
-                        if patient_name.lower() in rec_name:
-                            matches.append(record)
-                            continue
-
-                if not matches:
-                    return "No records found matching the provided details."
-
-                # Return JSON string of matches (limit to top 3 to avoid context overflow)
-                return json.dumps(matches[:3], indent=2)
-
-            @llm.function_tool(
-                description="Look up a drug by its drug code (e.g. '0005-116801-1161') or by drug name (brand or scientific/generic name). Returns the official drug code, scientific name, brand name, strength, route, dosage form, unit price in AED, and active/discontinued status. Use this when a caller mentions a medication by name and you need to verify its drug code, price, or availability."
-            )
-            async def lookup_drug_code(
-                self,
-                drug_code: str | None = None,
-                drug_name: str | None = None,
-            ):
-                """
-                Searches the drug code database.
-                Provide either drug_code for exact code lookup, or drug_name for partial name search.
-                """
-                logger.info(f"Drug code lookup: code={drug_code}, name={drug_name}")
+        matches = PATIENT_STORE.lookup(
+            emirates_id=emirates_id,
+            policy_number=effective_policy,
+            claim_id=claim_id,
+            patient_id=patient_id,
+            patient_name=patient_name,
+            limit=3,
+        )
 
-                if not drug_code and not drug_name:
-                    return "Please provide either a drug code or a drug name to search."
+        if not matches:
+            return "No records found matching the provided details."
+
+        try:
+            groups = parse_groups(fields)
+        except ValueError as e:
+            return str(e)
+
+        self.drug_prefetch.prefetch(matches)
+        if len(matches) == 1:
+            self.facts.add(matches[0])
+
+        # Compact projection of the matches (limited to top 3 to avoid context overflow)
+        return format_records(matches, TOOL_RESULT_FORMAT, groups)
+
+    @llm.function_tool(
+        description="Evaluate a patient's prescription claim in one step: policy status, remaining benefit, prior authorization, dispensing cycle, claim status and denial resolution, and the alternatives in stock. Identify the patient by Emirates ID, Policy Number, Member Card Number, Claim ID or Patient ID. Use this right after the patient is identified instead of reasoning over the raw record."
+    )
+    async def check_coverage(
+        self,
+        emirates_id: str | None = None,
+        policy_number: str | None = None,
+        member_card_number: str | None = None,
+        claim_id: str | None = None,
+        patient_id: str | None = None,
+    ):
+        """Coverage verdict for one patient record (coverage_rules.check_coverage)."""
+        matches = PATIENT_STORE.lookup(
+            emirates_id=emirates_id,
+            policy_number=policy_number or member_card_number,
+            claim_id=claim_id,
+            patient_id=patient_id,
+            limit=2,
+        )
+        if not matches:
+            return "No records found matching the provided details."
+        if len(matches) > 1:
+            return "Several members match. Ask the caller for the Emirates ID or policy number."
+        self.facts.add(matches[0])
+        return format_verdict(_check_coverage(matches[0]), TOOL_RESULT_FORMAT)
+
+    @llm.function_tool(
+        description="Look up a drug by its drug code (e.g. '0005-116801-1161') or by drug name (brand or scientific/generic name). Returns the official drug code, scientific name, brand name, strength, route, dosage form, unit price in AED, and active/discontinued status. Use this when a caller mentions a medication by name and you need to verify its drug code, price, or availability."
+    )
+    async def lookup_drug_code(
+        self,
+        drug_code: str | None = None,
+        drug_name: str | None = None,
+    ):
+        """
+        Searches the drug code database.
+        Provide either drug_code for exact code lookup, or drug_name for partial name search.
+        """
+        logger.info(f"Drug code lookup: code={drug_code}, name={drug_name}")
+
+        if not drug_code and not drug_name:
+            return "Please provide either a drug code or a drug name to search."
+
+        results = await self.drug_prefetch.lookup(drug_code=drug_code, drug_name=drug_name)
+
+        if not results:
+            return "No matching drugs found in the drug code database. Please verify the drug code or name."
+
+        return format_table(results, TOOL_RESULT_FORMAT)
+
+
+GREETING = "Hello! This is a pharmacy insurance approval agent. Please provide the patient's name or ID and the drug class you're inquiring about."
+
+# Lines the agent speaks verbatim (the greeting, and the fixed lines in
+# SYSTEM_PROMPT). `python src/agent.py warm-audio` pre-renders them into
+# the audio cache, and tts_node plays them without a TTS round trip.
+FIXED_PHRASES = (
+    GREETING,
+    "One moment while I look that up.",
+    "Once you've updated the submission in the E-Claim system, we will re-examine it on our end.",
+    "Would you like me to check any other medications for this member?",
+    "Thank you for calling. Goodbye.",
+)
 
-                results = _search_drug_codes(drug_code=drug_code, drug_name=drug_name)
+_phrase_caches: dict[tuple, AudioCache] = {}
+
+
+def phrase_cache(tts) -> AudioCache:
+    """The cached FIXED_PHRASES for this TTS's voice, model and sample rate, loaded once per process."""
+    key = (ELEVEN_VOICE_ID, getattr(tts, "model", ""), tts.sample_rate)
+    if key not in _phrase_caches:
+        cache = _phrase_caches[key] = AudioCache(*key)
+        found = cache.load(FIXED_PHRASES)
+        print(f"[PHARMA] >>> Audio cache: {found}/{len(FIXED_PHRASES)} fixed phrases pre-rendered", flush=True)
+    return _phrase_caches[key]
+
+
+# The chat context's system message, rebuilt for the call's stage on every LLM request
+SYSTEM_MESSAGE_ID = "pharmacy-system-prompt"
+
+
+class PharmacyAgent(Agent):
+    def __init__(self, *, facts: CallFacts | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self.facts = facts
+
+    async def on_enter(self) -> None:
+        """Greet immediately via direct TTS - publishes audio track for playground."""
+        print("[PHARMA] >>> on_enter called, saying greeting", flush=True)
+        self.session.say(GREETING)
+
+    async def tts_node(self, text, model_settings):
+        """Play replies that are exactly a pre-rendered phrase from the audio cache."""
+        cache = phrase_cache(self.session.tts)
+        pcm, text = await match_phrase(cache, text)
+        if pcm is not None:
+            async for frame in cache.frames(pcm):
+                yield frame
+            return
+        async for frame in Agent.default.tts_node(self, text, model_settings):
+            yield frame
+
+    async def llm_node(self, chat_ctx, tools, model_settings):
+        """Send the system prompt sections for the call's stage (system_prompt.build_system_prompt)."""
+        index = chat_ctx.index_by_id(SYSTEM_MESSAGE_ID)
+        if index is not None:
+            chat_ctx = chat_ctx.copy()
+            chat_ctx.items[index] = llm.ChatMessage(
+                id=SYSTEM_MESSAGE_ID, role="system", content=[build_system_prompt(self.facts)],
+            )
+        async for chunk in Agent.default.llm_node(self, chat_ctx, tools, model_settings):
+            yield chunk
+
+
+# Provider endpoints are configurable so the call simulator
+# (scripts/simulate_calls.py) can point them at local stand-ins
+DEEPGRAM_URL = config("DEEPGRAM_URL", default="https://api.deepgram.com/v1/listen")
+GROQ_BASE_URL = config("GROQ_BASE_URL", default="https://api.groq.com/openai/v1")
+ELEVEN_BASE_URL = config("ELEVEN_BASE_URL", default="https://api.elevenlabs.io/v1")
+ELEVEN_VOICE_ID = "i80JxxvpWr5Q7cTdT1Ik"
+
+
+def make_stt(api_key: str, http_session=None):
+    return deepgram.STT(
+        model="nova-3", language="en-US", api_key=api_key, base_url=DEEPGRAM_URL, http_session=http_session,
+    )
+
+
+def make_llm(api_key: str, client=None):
+    return openai.LLM(base_url=GROQ_BASE_URL, api_key=api_key, model="openai/gpt-oss-120b", client=client)
+
+
+def make_tts(api_key: str, http_session=None):
+    return elevenlabs.TTS(
+        api_key=api_key,
+        http_session=http_session,
+        voice_id=ELEVEN_VOICE_ID,
+        base_url=ELEVEN_BASE_URL,
+        # voice_settings=elevenlabs.VoiceSettings(
+        #     stability=0.5,
+        #     similarity_boost=0.75,
+        #     speed=0.8  # Adjust this between 0.7 and 1.2
+        # )
+    )
+
+
+def create_session(vad, *, stt=None, chat_llm=None, tts=None) -> tuple[AgentSession, PharmacyAgent, PharmacyTools]:
+    """The pharmacy AgentSession and agent, not yet started.
+
+    STT, LLM and TTS default to Deepgram, Groq and ElevenLabs with the keys
+    from .env, on the running loop's shared connections (provider_clients.py)."""
+    initial_ctx = llm.ChatContext()
+
+    # Shared with rag.py; PharmacyAgent.llm_node swaps in the sections for the call's stage
+    initial_ctx.add_message(
+        content=build_system_prompt(),
+        role="system",
+        id=SYSTEM_MESSAGE_ID,
+    )
+
+    pharmacy_tools = PharmacyTools()
+    clients = provider_clients.shared()
+    session = AgentSession(
+        stt=stt or make_stt(config("DEEPGRAM_API_KEY"), clients.http),
+        llm=chat_llm or make_llm(config("GROQ_API_KEY"), clients.openai_client(GROQ_BASE_URL, config("GROQ_API_KEY"))),
+        tts=tts or make_tts(config("ELEVEN_API_KEY"), clients.http),
+        vad=vad,
+        turn_detection="vad",
+        allow_interruptions=True,
+        tools=[
+            pharmacy_tools.pinecone_search, pharmacy_tools.lookup_database, pharmacy_tools.lookup_drug_code,
+            pharmacy_tools.check_coverage,
+        ],
+    )
+
+    agent = PharmacyAgent(
+        facts=pharmacy_tools.facts,
+        instructions="You are a professional pharmacy insurance approval agent. Verify drug coverage based on patient tiers.",
+        chat_ctx=initial_ctx,
+    )
+    return session, agent, pharmacy_tools
 
-                if not results:
-                    return "No matching drugs found in the drug code database. Please verify the drug code or name."
 
-                return json.dumps(results, indent=2)
+@server.rtc_session(agent_name="pharmacy-agent")
+async def pharmacy_agent(ctx: JobContext):
+    print(f"[PHARMA] >>> Entrypoint called for room {ctx.room.name}", flush=True)
+    logger.info(f"Starting agent for room {ctx.room.name}")
 
-        pharmacy_tools = PharmacyTools()
+    try:
         vad = ctx.proc.userdata.get("vad") or silero.VAD.load()
+        session, agent, pharmacy_tools = create_session(vad)
+        # Handshake with the providers while the room connection is set up
+        provider_clients.warm(session, DEEPGRAM_URL)
+        ctx.add_shutdown_callback(provider_clients.aclose)
+
+        async def _log_prefetch_stats():
+            stats = pharmacy_tools.drug_prefetch.stats()
+            print(
+                f"[PHARMA] >>> Drug code prefetch: {stats['prefetch_hits']}/{stats['lookups']} lookups hit "
+                f"({stats['prefetch_hit_rate']:.0%}), {stats['saved_ms']:.1f}ms saved",
+                flush=True,
+            )
 
-        session = AgentSession(
-            stt=deepgram.STT(
-                model="nova-3",
-                language="en-US",
-                api_key=config("DEEPGRAM_API_KEY"),
-            ),
-            llm=openai.LLM(
-                base_url="https://api.groq.com/openai/v1",
-                api_key=config("GROQ_API_KEY"),
-                model="openai/gpt-oss-120b",
-            ),
-            tts=elevenlabs.TTS(
-                api_key=config("ELEVEN_API_KEY"),
-                voice_id="i80JxxvpWr5Q7cTdT1Ik",
-                # voice_settings=elevenlabs.VoiceSettings(
-                #     stability=0.5,
-                #     similarity_boost=0.75,
-                #     speed=0.8  # Adjust this between 0.7 and 1.2
-                # )
-            ),
-            vad=vad,
-            turn_detection="vad",
-            allow_interruptions=True,
-            tools=[pharmacy_tools.pinecone_search, pharmacy_tools.lookup_database, pharmacy_tools.lookup_drug_code],
-        )
+        ctx.add_shutdown_callback(_log_prefetch_stats)
 
-        class PharmacyAgent(Agent):
-            async def on_enter(self) -> None:
-                """Greet immediately via direct TTS - publishes audio track for playground."""
-                print("[PHARMA] >>> on_enter called, saying greeting", flush=True)
-                self.session.say("Hello! This is a pharmacy insurance approval agent. Please provide the patient's name or ID and the drug class you're inquiring about.")
+        turn_tracker = TurnTracker(ctx.room.name)
+        turn_tracker.attach(session)
 
-        agent = PharmacyAgent(
-            instructions="You are a professional pharmacy insurance approval agent. Verify drug coverage based on patient tiers.",
-            chat_ctx=initial_ctx,
-        )
+        async def _log_turn_latency():
+            turn_tracker.close()
+            print(
+                f"[PHARMA] >>> Turn latency ({turn_tracker.turns} turns this call; worker window): "
+                f"{format_percentiles()}",
+                flush=True,
+            )
+            flush_tracing()
+
+        ctx.add_shutdown_callback(_log_turn_latency)
 
         room_opts = room_io.RoomOptions()
         if _HAS_NOISE_CANCELLATION:
@@ -312,12 +470,43 @@ async def pharmacy_agent(ctx: JobContext):
         raise
 
 
+async def warm_audio(force: bool = False) -> None:
+    """Synthesize FIXED_PHRASES into the audio cache, skipping cached ones unless `force`."""
+    from livekit.agents.utils import http_context
+
+    async with http_context.open():
+        tts = make_tts(config("ELEVEN_API_KEY"))
+        cache = phrase_cache(tts)
+        cached = set(cache.phrases())
+        for text in FIXED_PHRASES:
+            if text in cached and not force:
+                continue
+            start = time.perf_counter()
+            # The websocket stream, as on a call: same audio as a live reply
+            stream = tts.stream()
+            stream.push_text(text)
+            stream.end_input()
+            pcm = b"".join([bytes(ev.frame.data) async for ev in stream])
+            await stream.aclose()
+            cache.put(text, pcm)
+            print(
+                f"[PHARMA] >>> Cached {len(pcm) / 2 / tts.sample_rate:.1f}s in "
+                f"{(time.perf_counter() - start) * 1e3:.0f}ms: {text[:50]}",
+                flush=True,
+            )
+        await tts.aclose()
+    print(f"[PHARMA] >>> Audio cache: {len(cache.phrases())}/{len(FIXED_PHRASES)} phrases in {cache.directory}", flush=True)
+
+
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "download-files":
         print("Downloading Silero VAD model...", flush=True)
         silero.VAD.load()
         print("Done.", flush=True)
         sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "warm-audio":
+        asyncio.run(warm_audio(force="--force" in sys.argv))
+        sys.exit(0)
     _validate_env()
     print("[PHARMA] >>> Env validation OK (STT, TTS, LLM, RAG keys present)", flush=True)
     cli.run_app(server)
\ No newline at end of file
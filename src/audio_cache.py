@@ -0,0 +1,143 @@
+"""Disk cache of synthesized audio for the agent's fixed phrases.
+
+Entries are 16-bit mono WAV files named by a hash of (voice_id, model,
+sample_rate, text), so a change of voice or model never plays stale audio.
+The cache is filled ahead of time (`python src/agent.py warm-audio`) and read
+by PharmacyAgent.tts_node: a reply whose whole text is a cached phrase is
+played from memory instead of going to ElevenLabs. The directory is kept
+under AUDIO_CACHE_MAX_MB by evicting the least recently played entries.
+"""
+import os
+import hashlib
+import threading
+import wave
+from collections.abc import AsyncIterable, AsyncIterator
+
+from decouple import config
+from livekit import rtc
+
+AUDIO_CACHE_DIR = config(
+    "AUDIO_CACHE_DIR", default=os.path.join(os.path.dirname(__file__), "..", "data", "audio_cache")
+)
+AUDIO_CACHE_MAX_MB = config("AUDIO_CACHE_MAX_MB", default=64.0, cast=float)
+
+# Played back in 50ms frames, like a TTS stream
+_FRAME_S = 0.05
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+class AudioCache:
+    """Pre-rendered audio for one voice/model/sample rate, LRU-bounded on disk."""
+
+    def __init__(self, voice_id: str, model: str, sample_rate: int, directory: str = AUDIO_CACHE_DIR,
+                 max_bytes: int = int(AUDIO_CACHE_MAX_MB * 1024 * 1024)):
+        self.voice_id = voice_id
+        self.model = model
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self._pcm: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def path(self, text: str) -> str:
+        key = "\0".join((self.voice_id, self.model, str(self.sample_rate), normalize(text)))
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest()[:32] + ".wav")
+
+    def load(self, phrases) -> int:
+        """Read the cached phrases among `phrases` into memory; returns how many were found."""
+        for text in phrases:
+            try:
+                with wave.open(self.path(text), "rb") as f:
+                    if f.getframerate() != self.sample_rate or f.getnchannels() != 1 or f.getsampwidth() != 2:
+                        continue
+                    pcm = f.readframes(f.getnframes())
+            except FileNotFoundError:
+                continue
+            with self._lock:
+                self._pcm[normalize(text)] = pcm
+        return len(self._pcm)
+
+    def get(self, text: str) -> bytes | None:
+        """The PCM for `text` if it was loaded, marking the entry as recently played."""
+        pcm = self._pcm.get(normalize(text))
+        if pcm is not None:
+            self.hits += 1
+            try:
+                os.utime(self.path(text))
+            except OSError:
+                pass
+        return pcm
+
+    def put(self, text: str, pcm: bytes) -> str:
+        """Store the PCM for `text` and evict the oldest entries over the size limit."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(text)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with wave.open(tmp, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(self.sample_rate)
+            f.writeframes(pcm)
+        os.replace(tmp, path)
+        with self._lock:
+            self._pcm[normalize(text)] = pcm
+        self.evict()
+        return path
+
+    def evict(self) -> list[str]:
+        """Delete least recently played entries (by mtime) until the directory fits max_bytes."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".wav"):
+                st = os.stat(os.path.join(self.directory, name))
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+            removed.append(name)
+        return removed
+
+    async def frames(self, pcm: bytes) -> AsyncIterator[rtc.AudioFrame]:
+        step = 2 * int(self.sample_rate * _FRAME_S)
+        for i in range(0, len(pcm), step):
+            chunk = pcm[i:i + step]
+            yield rtc.AudioFrame(chunk, self.sample_rate, 1, len(chunk) // 2)
+
+    def phrases(self) -> list[str]:
+        return list(self._pcm)
+
+
+async def match_phrase(cache: AudioCache, text: AsyncIterable[str]) -> tuple[bytes | None, AsyncIterable[str]]:
+    """Read `text` only as long as it can still be a whole cached phrase.
+
+    Returns the cached PCM when the stream ends on a cached phrase. Otherwise
+    returns None and the text stream, with what was read put back in front.
+    Most replies leave every phrase within their first words, so they reach
+    TTS after a token or two of delay."""
+    phrases = cache.phrases()
+    it = aiter(text)
+    read: list[str] = []
+    while phrases:
+        try:
+            chunk = await anext(it)
+        except StopAsyncIteration:
+            return cache.get("".join(read)), _replay(read, it)
+        read.append(chunk)
+        sofar = normalize("".join(read))
+        phrases = [p for p in phrases if p.startswith(sofar)]
+    return None, _replay(read, it)
+
+
+async def _replay(read: list[str], rest: AsyncIterator[str]) -> AsyncIterator[str]:
+    for chunk in read:
+        yield chunk
+    async for chunk in rest:
+        yield chunk
@@ -0,0 +1,91 @@
+"""Lexical BM25 index over record text, fused with vector hits by reciprocal rank.
+
+Semantic search tends to miss exact tokens a caller reads out: NDC codes,
+claim and Emirates IDs, denial codes, drug names. BM25 over the same text
+Pinecone stores catches those, and `rrf_fuse` merges both rankings without
+having to calibrate their scores against each other.
+
+Compound codes are indexed whole and by part, so "30379-4527-01" matches
+whether it is typed with or without the dashes.
+"""
+import re
+import math
+
+import numpy as np
+
+_COMPOUND_RE = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+_PART_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for compound in _COMPOUND_RE.findall(text.lower()):
+        tokens.append(compound)
+        parts = _PART_RE.findall(compound)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 with per-posting weights precomputed, scored with NumPy."""
+
+    def __init__(self, texts: list[str], k1: float = 1.2, b: float = 0.75):
+        self.texts = texts
+        term_freqs = []
+        doc_freq: dict[str, int] = {}
+        for text in texts:
+            tf: dict[str, int] = {}
+            for token in tokenize(text):
+                tf[token] = tf.get(token, 0) + 1
+            term_freqs.append(tf)
+            for token in tf:
+                doc_freq[token] = doc_freq.get(token, 0) + 1
+
+        lengths = [sum(tf.values()) for tf in term_freqs]
+        avg_len = (sum(lengths) / len(lengths)) if lengths else 0.0
+        n = len(texts)
+
+        docs: dict[str, list[int]] = {}
+        weights: dict[str, list[float]] = {}
+        for pos, (tf, length) in enumerate(zip(term_freqs, lengths)):
+            norm = k1 * (1 - b + b * length / avg_len)
+            for token, count in tf.items():
+                idf = math.log(1 + (n - doc_freq[token] + 0.5) / (doc_freq[token] + 0.5))
+                docs.setdefault(token, []).append(pos)
+                weights.setdefault(token, []).append(idf * count * (k1 + 1) / (count + norm))
+
+        self._postings = {
+            token: (np.array(docs[token], dtype=np.int32), np.array(weights[token], dtype=np.float32))
+            for token in docs
+        }
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def search_positions(self, query: str, top_k: int = 5) -> list[tuple[int, float]]:
+        """(position, score) of the top_k documents, best first; only docs sharing a term."""
+        scores = np.zeros(len(self.texts), dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = self._postings.get(token)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        matched = np.flatnonzero(scores)
+        if not len(matched) or top_k <= 0:
+            return []
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(pos), float(scores[pos])) for pos in matched]
+
+    def search(self, query: str, top_k: int = 5) -> list[str]:
+        return [self.texts[pos] for pos, _ in self.search_positions(query, top_k)]
+
+
+def rrf_fuse(rankings: list[list[str]], top_k: int, k: int = 60) -> list[str]:
+    """Reciprocal rank fusion: score(d) = sum 1 / (k + rank). Ties keep first-seen order."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:top_k]
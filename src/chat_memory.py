@@ -0,0 +1,117 @@
+"""Token-budgeted chat history for rag.ChatSession.
+
+Every step of the tool loop resends the history, so an unbounded one makes
+each turn slower than the last. ChatMemory keeps the caller's last
+CHAT_KEEP_TURNS turns verbatim and the rest of the history under
+CHAT_TOKEN_BUDGET tokens:
+
+  1. A record retrieved again is sent once; later copies point back to it.
+  2. Over budget, the search results of older turns, oldest first, are
+     replaced by one summary line per record (its identifying fields).
+  3. Still over budget, the oldest turns are dropped whole.
+
+Turns are dropped whole, so a tool call never loses its result.
+"""
+import json
+from functools import lru_cache
+
+from decouple import config
+
+from tool_format import token_counter
+
+CHAT_TOKEN_BUDGET = config("CHAT_TOKEN_BUDGET", default=3000, cast=int)
+CHAT_KEEP_TURNS = config("CHAT_KEEP_TURNS", default=3, cast=int)
+
+# What a summary line keeps of a record: patient, policy and claim
+# identifiers (db.json) or the drug and outcome of a PBM call (pharma.json)
+SUMMARY_FIELDS = (
+    "patient_id", "patient_name", "emirates_id", "policy_number", "pbm_name", "claim_id", "claim_status",
+    "denial_code", "drug_brand_name", "drug_name", "ddc_code", "rejection_reason", "resolution_action",
+)
+# Per-message overhead of the chat format (role and separators)
+_MESSAGE_TOKENS = 4
+
+
+def summarize_record(text: str) -> str:
+    """One line of `SUMMARY_FIELDS` for a search result (a record's JSON text)."""
+    try:
+        record = json.loads(text)
+    except ValueError:
+        record = None
+    if isinstance(record, dict):
+        fields = [f"{k}={record[k]}" for k in SUMMARY_FIELDS if record.get(k) not in (None, "", [], {})]
+        if fields:
+            return "; ".join(fields)
+    return " ".join(text.split())[:160]
+
+
+class ChatMemory:
+    """The messages of one conversation, rendered to fit a token budget."""
+
+    def __init__(self, budget: int = CHAT_TOKEN_BUDGET, keep_turns: int = CHAT_KEEP_TURNS, count=None):
+        self.budget = budget
+        self.keep_turns = max(1, keep_turns)
+        # The same rendered message is counted once, not on every step
+        self._count = lru_cache(maxsize=4096)(count or token_counter()[1])
+        # One list per caller turn, starting at its user message: (message, records)
+        self._turns: list[list[tuple[dict, list[str] | None]]] = []
+
+    def append(self, message: dict, records: list[str] | None = None) -> None:
+        """Add a message; for a search result, `records` are the hits its content joins."""
+        if message["role"] == "user" or not self._turns:
+            self._turns.append([])
+        self._turns[-1].append((message, records))
+
+    def clear(self) -> None:
+        self._turns.clear()
+
+    def raw(self) -> list[dict]:
+        """Every message as appended, with no budget applied."""
+        return [message for turn in self._turns for message, _ in turn]
+
+    def tokens(self, messages: list[dict]) -> int:
+        total = 0
+        for m in messages:
+            total += _MESSAGE_TOKENS + self._count(m.get("content") or "")
+            for tc in m.get("tool_calls") or ():
+                total += self._count(tc["function"]["name"] + tc["function"]["arguments"])
+        return total
+
+    def messages(self) -> list[dict]:
+        """The history to send: deduplicated, then compacted from the oldest turn until it fits."""
+        old = max(0, len(self._turns) - self.keep_turns)
+        summarized = dropped = 0
+        while True:
+            rendered = self._render(dropped, summarized)
+            if self.tokens(rendered) <= self.budget:
+                return rendered
+            if summarized < old:
+                summarized += 1
+            elif dropped < old:
+                dropped += 1
+            else:
+                return rendered  # the recent turns alone exceed the budget
+
+    def _render(self, dropped: int, summarized: int) -> list[dict]:
+        out = []
+        shown: set[str] = set()
+        for i in range(dropped, len(self._turns)):
+            for message, records in self._turns[i]:
+                if not records:
+                    out.append(message)
+                    continue
+                if i < summarized:
+                    content = "Earlier search result, summarized:\n" + "\n".join(
+                        f"- {summarize_record(r)}" for r in records
+                    )
+                else:
+                    parts = []
+                    for r in records:
+                        if r in shown:
+                            parts.append(f"(retrieved again, shown above: {summarize_record(r)})")
+                        else:
+                            shown.add(r)
+                            parts.append(r)
+                    content = "\n---\n".join(parts)
+                out.append({**message, "content": content})
+        return out
@@ -0,0 +1,127 @@
+"""Coverage verdict for a patient record, computed instead of reasoned out by the LLM.
+
+`check_coverage` applies STEPS 2-6 of the system prompt's workflow to one
+db.json record and returns a compact verdict:
+
+  verdict       approved, pending (submitted, under review or appealed) or
+                blocked (at least one blocking reason)
+  blocking      what stops the claim: inactive policy, benefit below the
+                claim amount, prior authorization outstanding, already
+                dispensed this cycle, claim denied
+  resolution    the next step for the record's denial code (RESOLUTIONS)
+  alternatives  only the ones in stock or low on stock, when the drug is
+                blocked or out of stock
+  warnings      what does not block but the caller should hear: low
+                remaining benefit, policy ended or ending soon, drug out
+                of stock
+
+Tested in tests/test_coverage_rules.py.
+"""
+import json
+from datetime import date, timedelta
+
+# Next step per denial code (the claim codes the records carry)
+RESOLUTIONS = {
+    "27": "Confirm active policy, update insurer records",
+    "70": "Request formulary exception or switch alternative",
+    "75": "Document prior failed therapies, submit PA",
+    "76": "Appeal with medical necessity letter",
+    "79": "Submit PA form with clinical notes",
+    "96": "Verify billing code; submit appeal",
+    "CO4": "Attach ICD code justification from physician",
+    "M1": "Resubmit claim with complete patient data",
+}
+
+PENDING_STATUSES = ("Submitted", "Under Review", "Appealed")
+AVAILABLE = ("In Stock", "Low Stock")
+
+# Warn when the remaining benefit covers fewer than this many claims like this one
+LOW_BENEFIT_CLAIMS = 2
+# Warn when the policy ends within this many days
+POLICY_ENDING_DAYS = 30
+
+
+def _available_alternatives(record: dict) -> list[str]:
+    availability = record.get("alternative_availability") or {}
+    return [
+        drug for drug in record.get("alternative_drugs") or availability
+        if availability.get(drug) in AVAILABLE
+    ]
+
+
+def check_coverage(record: dict, today: date | None = None) -> dict:
+    """The coverage verdict for one patient record (see the module docstring)."""
+    today = today or date.today()
+    blocking, warnings = [], []
+    claim = float(record.get("total_claim_aed") or 0)
+    remaining = float(record.get("remaining_benefit_aed") or 0)
+    status = record.get("claim_status") or ""
+    code = str(record.get("denial_code") or "").strip().upper()
+
+    # STEP 2: policy and benefit
+    if not record.get("policy_active"):
+        blocking.append(f"policy not active (end date {record.get('policy_end_date')}), "
+                        "the member must contact the insurer to renew")
+    else:
+        end = record.get("policy_end_date")
+        if end and date.fromisoformat(end) < today:
+            warnings.append(f"policy ended on {end}, though it is marked active")
+        elif end and date.fromisoformat(end) - today <= timedelta(days=POLICY_ENDING_DAYS):
+            warnings.append(f"policy ends on {end}")
+    if remaining < claim:
+        blocking.append(f"remaining benefit {remaining:.2f} AED is below the claim of {claim:.2f} AED")
+    elif remaining < LOW_BENEFIT_CLAIMS * claim:
+        warnings.append(f"remaining benefit {remaining:.2f} AED covers fewer than {LOW_BENEFIT_CLAIMS} such claims")
+
+    # STEP 3d: prior authorization still outstanding
+    if record.get("requires_prior_auth") and record.get("pa_required"):
+        blocking.append("prior authorization required and not yet obtained, submit it through E-Claim (DHPO)")
+
+    # STEP 4: dispensing cycle
+    if record.get("already_dispensed_this_cycle"):
+        blocking.append(f"already dispensed this cycle (last on {record.get('last_dispensed_date')}), "
+                        "no refill before the next cycle")
+
+    # STEP 5: claim status
+    if status == "Denied":
+        blocking.append(f"claim denied: {record.get('denial_reason')}")
+
+    verdict = "blocked" if blocking else "pending" if status in PENDING_STATUSES else "approved"
+
+    # STEP 6: alternatives, only the ones the pharmacy can dispense
+    out_of_stock = record.get("primary_drug_inventory") == "Out of Stock"
+    if out_of_stock:
+        warnings.append(f"{record.get('drug_brand_name')} is out of stock")
+    alternatives = _available_alternatives(record) if verdict == "blocked" or out_of_stock else []
+
+    result = {
+        "patient_id": record.get("patient_id"),
+        "patient_name": record.get("patient_name"),
+        "drug": f"{record.get('drug_brand_name')} ({record.get('drug_generic_name')})",
+        "claim_id": record.get("claim_id"),
+        "claim_status": status,
+        "verdict": verdict,
+        "blocking": blocking,
+        "copay_aed": round(claim * float(record.get("copay_percentage") or 0) / 100, 2),
+    }
+    if code and status in ("Denied", "Appealed"):
+        result["resolution"] = RESOLUTIONS.get(code) or record.get("recommended_resolution") or ""
+    if alternatives:
+        result["alternatives"] = alternatives
+    if warnings:
+        result["warnings"] = warnings
+    return result
+
+
+def format_verdict(verdict: dict, fmt: str = "lines") -> str:
+    """The verdict as a tool result, in a TOOL_RESULT_FORMAT."""
+    if fmt == "pretty":
+        return json.dumps(verdict, indent=2)
+    if fmt == "json":
+        return json.dumps(verdict, separators=(",", ":"), ensure_ascii=False)
+    lines = []
+    for key, value in verdict.items():
+        if isinstance(value, list):
+            value = "; ".join(value) if value else "none"
+        lines.append(f"{key}: {value}")
+    return "\n".join(lines)
@@ -0,0 +1,241 @@
+"""Inverted index and ranked matching over the Claim Drug Code List.
+
+Run directly to compare the xlsx parse with attaching to the snapshot:
+    python src/drug_index.py
+"""
+import os
+import re
+import sys
+import time
+from bisect import bisect_left, bisect_right
+
+from snapshot import Snapshot, SnapshotWriter, open_snapshot, snapshot_path_for
+
+NAME_FIELDS = ("Scientific Name", "Description")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def parse_workbook(xlsx_path: str) -> list[dict]:
+    """Parse the active sheet of the drug code workbook into one dict per row."""
+    import openpyxl  # only needed when the snapshot is rebuilt
+
+    wb = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        headers = [cell.value for cell in ws[1]]
+        return [dict(zip(headers, row)) for row in ws.iter_rows(min_row=2, max_row=ws.max_row, values_only=True)]
+    finally:
+        wb.close()
+
+
+class DrugCodeIndex:
+    """Code, prefix, token and trigram indexes over the drug rows.
+
+    `search` returns the same set of rows as a linear scan (exact code match,
+    or substring of Scientific Name / Description) but ranked: exact code,
+    then name prefix, then whole-word token, then plain substring. Each tier
+    stops as soon as `max_results` rows have been collected.
+
+    Built in-process from a list of rows, or attached read-only to a shared
+    snapshot with `attach`.
+    """
+
+    SNAPSHOT_KIND = "drug-index-1"
+
+    def __init__(self, records: list[dict]):
+        self.records = records
+        self._codes: dict[str, list[int]] = {}
+        self._texts: list[str] = []
+        self._tokens: dict[str, list[int]] = {}
+
+        prefixes = []
+        for pos, record in enumerate(records):
+            code = str(record.get("Code", "")).strip().lower()
+            self._codes.setdefault(code, []).append(pos)
+
+            names = [str(record.get(field, "")).lower() for field in NAME_FIELDS]
+            self._texts.append("\n".join(names))
+            for name in names:
+                prefixes.append((name, pos))
+            for token in set(_TOKEN_RE.findall(" ".join(names))):
+                self._tokens.setdefault(token, []).append(pos)
+
+        # Trigrams over the token vocabulary (not the rows) keep the index small;
+        # a substring hit must sit inside some token that contains each query token
+        self._vocab = sorted(self._tokens)
+        self._vocab_grams: dict[str, list[int]] = {}
+        for i, token in enumerate(self._vocab):
+            for gram in _trigrams(token):
+                self._vocab_grams.setdefault(gram, []).append(i)
+
+        prefixes.sort()
+        self._prefix_keys = [name for name, _ in prefixes]
+        self._prefix_pos = [pos for _, pos in prefixes]
+
+        # Fallback for fragments too short for trigrams: all names in one buffer
+        # so the search runs at C speed in DB order; _starts maps hits to rows
+        self._starts = []
+        offset = 0
+        for text in self._texts:
+            self._starts.append(offset)
+            offset += len(text.encode("utf-8")) + 1
+        self._haystack = "\n".join(self._texts).encode("utf-8")
+        self._scan_limit = max(len(records) // 8, 1000)
+
+    @classmethod
+    def attach(cls, xlsx_path: str) -> "DrugCodeIndex":
+        """Attach to the shared snapshot of the workbook, building it first if stale."""
+
+        def build(writer: SnapshotWriter) -> None:
+            cls(parse_workbook(xlsx_path)).save(writer)
+
+        return cls.from_snapshot(open_snapshot(xlsx_path, cls.SNAPSHOT_KIND, build))
+
+    @classmethod
+    def from_snapshot(cls, snap: Snapshot) -> "DrugCodeIndex":
+        index = cls.__new__(cls)
+        index.records = snap.records("records")
+        index._codes = snap.multimap("codes")
+        index._texts = snap.strings("texts")
+        index._tokens = snap.multimap("tokens")
+        index._vocab = snap.strings("vocab")
+        index._vocab_grams = snap.multimap("vocab_grams")
+        index._prefix_keys = snap.strings("prefix_keys")
+        index._prefix_pos = snap.ints("prefix_pos")
+        index._starts = snap.ints("starts")
+        index._haystack = snap.haystack("haystack")
+        index._scan_limit = max(len(index.records) // 8, 1000)
+        return index
+
+    def save(self, writer: SnapshotWriter) -> None:
+        writer.add_records("records", self.records)
+        writer.add_multimap("codes", self._codes)
+        writer.add_strings("texts", self._texts)
+        writer.add_multimap("tokens", self._tokens)
+        writer.add_strings("vocab", self._vocab)
+        writer.add_multimap("vocab_grams", self._vocab_grams)
+        writer.add_strings("prefix_keys", self._prefix_keys)
+        writer.add_ints("prefix_pos", self._prefix_pos)
+        writer.add_ints("starts", self._starts, "Q")
+        writer.add_bytes("haystack", self._haystack)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _prefix_matches(self, term: str):
+        i = bisect_left(self._prefix_keys, term)
+        while i < len(self._prefix_keys) and self._prefix_keys[i].startswith(term):
+            yield self._prefix_pos[i]
+            i += 1
+
+    def _token_matches(self, term: str):
+        tokens = _TOKEN_RE.findall(term)
+        if not tokens:
+            return
+        word = re.compile(rf"(?<![a-z0-9]){re.escape(term)}(?![a-z0-9])")
+        postings = sorted((self._tokens.get(t, ()) for t in tokens), key=len)
+        candidates = postings[0]
+        if len(candidates) > self._scan_limit:
+            # Every query token is a whole token of a match; intersect them all
+            candidates = set(candidates).intersection(*postings[1:])
+            candidates = sorted(candidates)
+        for pos in candidates:
+            text = self._texts[pos]
+            if term in text and word.search(text):
+                yield pos
+
+    def _token_postings(self, fragment: str) -> list:
+        """Postings of every indexed token containing `fragment` (len >= 3)."""
+        vocab_ids = min((self._vocab_grams.get(g, ()) for g in _trigrams(fragment)), key=len)
+        return [self._tokens[self._vocab[v]] for v in vocab_ids if fragment in self._vocab[v]]
+
+    def _scan_haystack(self, term: str):
+        needle = term.encode("utf-8")
+        i = self._haystack.find(needle)
+        while i != -1:
+            pos = bisect_right(self._starts, i) - 1
+            yield pos
+            if pos + 1 >= len(self._starts):
+                return
+            i = self._haystack.find(needle, self._starts[pos + 1])
+
+    def _candidates(self, term: str):
+        """Rows that may contain `term`, in DB order, from the cheapest source."""
+        best = None
+        for fragment in _TOKEN_RE.findall(term):
+            if len(fragment) >= 3:
+                postings = self._token_postings(fragment)
+                size = sum(map(len, postings))
+                if best is None or size < best[0]:
+                    best = (size, postings)
+
+        # Short or very common fragments: a C-speed scan beats verifying rows
+        if best is None or best[0] > self._scan_limit:
+            return self._scan_haystack(term)
+        if len(best[1]) == 1:
+            return best[1][0]
+        return sorted(set().union(*best[1]))
+
+    def _substring_matches(self, term: str):
+        for pos in self._candidates(term):
+            text = self._texts[pos]
+            # Confirm the hit; only a term spanning a newline can match across names
+            if term in text and ("\n" not in term or any(term in name for name in text.split("\n"))):
+                yield pos
+
+    def search(
+        self,
+        drug_code: str | None = None,
+        drug_name: str | None = None,
+        max_results: int = 5,
+    ) -> list[dict]:
+        tiers = []
+        if drug_code:
+            tiers.append(self._codes.get(drug_code.strip().lower(), ()))
+        if drug_name:
+            term = drug_name.strip().lower()
+            tiers += [
+                self._prefix_matches(term),
+                self._token_matches(term),
+                self._substring_matches(term),
+            ]
+
+        seen: set[int] = set()
+        matches = []
+        for tier in tiers:
+            for pos in tier:
+                if len(matches) >= max_results:
+                    return matches
+                if pos not in seen:
+                    seen.add(pos)
+                    matches.append(self.records[pos])
+        return matches
+
+
+if __name__ == "__main__":
+    xlsx = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "data", "Claim Drug Code List.xlsx"
+    )
+
+    start = time.perf_counter()
+    in_process = DrugCodeIndex(parse_workbook(xlsx))
+    parse_s = time.perf_counter() - start
+
+    DrugCodeIndex.attach(xlsx)  # make sure the snapshot exists and is fresh
+    start = time.perf_counter()
+    shared = DrugCodeIndex.attach(xlsx)
+    attach_s = time.perf_counter() - start
+
+    for name in ("insulin", "panadol", "amoxicillin 500"):
+        assert [r["Code"] for r in shared.search(drug_name=name)] == [r["Code"] for r in in_process.search(drug_name=name)]
+
+    snapshot = snapshot_path_for(xlsx)
+    print(f"rows:                {len(shared)}")
+    print(f"xlsx parse + index:  {parse_s:.2f}s")
+    print(f"snapshot attach:     {attach_s * 1e3:.1f}ms")
+    print(f"snapshot:            {snapshot} ({os.path.getsize(snapshot) / 1e6:.1f} MB)")
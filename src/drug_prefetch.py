@@ -0,0 +1,120 @@
+"""Per-session speculative prefetch of drug-code lookups.
+
+After `lookup_database` returns a patient, the SYSTEM_PROMPT workflow goes
+on to `lookup_drug_code` for the prescribed brand, its generic and the
+listed alternatives. Those resolutions are started in the background as
+soon as the record comes back, so the later tool calls are cache hits.
+
+Alternatives are listed with a strength ("Aspirin 100mg"), which matches
+no drug name; the LLM then retries with the bare name, so that is
+prefetched too.
+"""
+import re
+import time
+import asyncio
+from typing import Callable
+
+_STRENGTH_RE = re.compile(r"\s+\d+(?:\.\d+)?\s*(?:mg|mcg|g|ml|iu|units?|%)(?:\b.*)?$", re.IGNORECASE)
+
+
+def _normalize(value: str | None) -> str:
+    return " ".join((value or "").lower().split())
+
+
+def drug_names_for(record: dict) -> list[str]:
+    """Drug names a patient record leads to, in the order the workflow looks them up."""
+    names = [record.get("drug_brand_name"), record.get("drug_generic_name")]
+    for alternative in record.get("alternative_drugs") or []:
+        names += [alternative, _STRENGTH_RE.sub("", str(alternative))]
+
+    seen, out = set(), []
+    for name in names:
+        key = _normalize(name)
+        if key and key not in seen:
+            seen.add(key)
+            out.append(str(name).strip())
+    return out
+
+
+class DrugCodePrefetcher:
+    """Session cache of `search(drug_code=..., drug_name=...)` results.
+
+    `prefetch` schedules lookups on a worker thread without waiting for
+    them; `lookup` awaits a prefetched (possibly still running) entry or
+    runs the search itself, also on a worker thread. Every result is kept
+    for the session; a search that fails is dropped, so the next lookup
+    tries again.
+    """
+
+    def __init__(self, search: Callable[..., list[dict]]):
+        self._search = search
+        self._entries: dict[tuple[str, str], asyncio.Future] = {}
+        self._prefetched: set[tuple[str, str]] = set()
+        self._search_s: dict[tuple[str, str], float] = {}
+        self.lookups = 0
+        self.hits = 0
+        self.prefetch_hits = 0
+        self.saved_s = 0.0
+
+    def _timed_search(self, key: tuple[str, str], drug_code: str | None, drug_name: str | None) -> list[dict]:
+        start = time.perf_counter()
+        results = self._search(drug_code=drug_code, drug_name=drug_name)
+        self._search_s[key] = time.perf_counter() - start
+        return results
+
+    def _start(self, key: tuple[str, str], drug_code: str | None, drug_name: str | None) -> asyncio.Future:
+        entry = asyncio.ensure_future(asyncio.to_thread(self._timed_search, key, drug_code, drug_name))
+        self._entries[key] = entry
+        entry.add_done_callback(lambda f: self._evict_failed(key, f))
+        return entry
+
+    def _evict_failed(self, key: tuple[str, str], entry: asyncio.Future) -> None:
+        if entry.cancelled() or entry.exception() is not None:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            self._prefetched.discard(key)
+
+    def prefetch(self, records: list[dict]) -> int:
+        """Start lookups for every drug the records mention. Returns how many were new."""
+        started = 0
+        for record in records:
+            for name in drug_names_for(record):
+                key = ("", _normalize(name))
+                if key not in self._entries:
+                    self._start(key, None, name)
+                    self._prefetched.add(key)
+                    started += 1
+        return started
+
+    async def lookup(self, drug_code: str | None = None, drug_name: str | None = None) -> list[dict]:
+        self.lookups += 1
+        key = (_normalize(drug_code), _normalize(drug_name))
+        entry = self._entries.get(key)
+        if entry is None:
+            return await self._start(key, drug_code, drug_name)
+
+        prefetched = key in self._prefetched
+        start = time.perf_counter()
+        try:
+            results = await asyncio.shield(entry)
+        except Exception:
+            if not prefetched:
+                raise
+            # The speculative search failed (and was dropped); search again for this call
+            return await self._start(key, drug_code, drug_name)
+        self.hits += 1
+        if prefetched:
+            self.prefetch_hits += 1
+            # The part of the search this call did not have to wait for
+            self.saved_s += max(self._search_s.get(key, 0.0) - (time.perf_counter() - start), 0.0)
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "prefetched": len(self._prefetched),
+            "prefetch_hits": self.prefetch_hits,
+            "prefetch_hit_rate": self.prefetch_hits / self.lookups if self.lookups else 0.0,
+            "saved_ms": self.saved_s * 1e3,
+        }
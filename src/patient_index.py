@@ -0,0 +1,118 @@
+"""Secondary indexes over the patient records served by `lookup_database`."""
+import json
+
+from snapshot import Snapshot, SnapshotWriter, open_snapshot
+
+ID_FIELDS = ("emirates_id", "policy_number", "claim_id", "patient_id")
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class PatientIndex:
+    """Hash maps on the exact-ID fields plus a trigram index on patient_name.
+
+    Matching is the same as the original linear scan: exact equality on the
+    ID fields, case-insensitive substring on the name, results in DB order.
+    Built in-process from a list of records, or attached read-only to a
+    shared snapshot with `attach`.
+    """
+
+    SNAPSHOT_KIND = "patient-index-1"
+
+    def __init__(self, records: list[dict]):
+        self.records = records
+        self._by_field: dict[str, dict] = {field: {} for field in ID_FIELDS}
+        self._names: list[str] = []
+        self._name_grams: dict[str, list[int]] = {}
+
+        for pos, record in enumerate(records):
+            for field in ID_FIELDS:
+                value = record.get(field)
+                if value and isinstance(value, str):
+                    self._by_field[field].setdefault(value, []).append(pos)
+
+            name = (record.get("patient_name") or "").lower()
+            self._names.append(name)
+            for gram in _trigrams(name):
+                self._name_grams.setdefault(gram, []).append(pos)
+
+    @classmethod
+    def attach(cls, db_path: str) -> "PatientIndex":
+        """Attach to the shared snapshot of `db_path`, building it first if stale."""
+
+        def build(writer: SnapshotWriter) -> None:
+            with open(db_path, "r") as f:
+                cls(json.load(f)).save(writer)
+
+        return cls.from_snapshot(open_snapshot(db_path, cls.SNAPSHOT_KIND, build))
+
+    @classmethod
+    def from_snapshot(cls, snap: Snapshot) -> "PatientIndex":
+        index = cls.__new__(cls)
+        index.records = snap.records("records")
+        index._names = snap.strings("names")
+        index._name_grams = snap.multimap("name_grams")
+        index._by_field = {field: snap.multimap(f"by_field.{field}") for field in ID_FIELDS}
+        return index
+
+    def save(self, writer: SnapshotWriter) -> None:
+        writer.add_records("records", self.records)
+        writer.add_strings("names", self._names)
+        writer.add_multimap("name_grams", self._name_grams)
+        for field, mapping in self._by_field.items():
+            writer.add_multimap(f"by_field.{field}", mapping)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _match_name(self, patient_name: str, limit: int | None = None) -> list[int]:
+        query = patient_name.lower()
+        if len(query) < 3:
+            # Too short for the trigram index; fall back to a scan
+            candidates = range(len(self._names))
+        else:
+            # Every match contains all of the query's trigrams, so walking the
+            # rarest posting (already in DB order) and confirming the substring
+            # finds the same records without intersecting the rest
+            candidates = min(
+                (self._name_grams.get(gram, ()) for gram in _trigrams(query)),
+                key=len,
+            )
+
+        matches = []
+        for pos in candidates:
+            if query in self._names[pos]:
+                matches.append(pos)
+                if limit is not None and len(matches) >= limit:
+                    break
+        return matches
+
+    def lookup(
+        self,
+        emirates_id: str | None = None,
+        policy_number: str | None = None,
+        claim_id: str | None = None,
+        patient_id: str | None = None,
+        patient_name: str | None = None,
+        limit: int | None = None,
+    ) -> list[dict]:
+        """Return records matching ANY of the given identifiers, in DB order."""
+        hits: set[int] = set()
+        for field, value in (
+            ("emirates_id", emirates_id),
+            ("policy_number", policy_number),
+            ("claim_id", claim_id),
+            ("patient_id", patient_id),
+        ):
+            if value:
+                hits.update(self._by_field[field].get(value, ()))
+
+        if patient_name:
+            hits.update(self._match_name(patient_name, limit))
+
+        positions = sorted(hits)
+        if limit is not None:
+            positions = positions[:limit]
+        return [self.records[pos] for pos in positions]
@@ -0,0 +1,217 @@
+"""Pluggable patient stores for `lookup_database`.
+
+Two backends with the same `lookup` semantics (exact match on the ID fields,
+case-insensitive substring on patient_name, DB order):
+
+  json    data/db.json, indexed in memory and shared through the mmap'd
+          snapshot (patient_index.PatientIndex). Fine for small datasets.
+  sqlite  an indexed SQLite file with an FTS5 trigram index on names, for a
+          full membership export that should not be loaded into memory.
+
+Selected with PATIENT_BACKEND=json|sqlite (and PATIENT_SQLITE_PATH).
+
+Build the SQLite file from db.json (or a .jsonl export) and check that both
+backends answer the same:
+    python src/patient_store.py import data/db.json data/patients.sqlite
+    python src/patient_store.py verify data/db.json data/patients.sqlite
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from urllib.request import pathname2url
+
+from patient_index import ID_FIELDS, PatientIndex
+
+_SCHEMA = """
+CREATE TABLE patients (
+    id INTEGER PRIMARY KEY,  -- position in the source file, i.e. DB order
+    emirates_id TEXT,
+    policy_number TEXT,
+    claim_id TEXT,
+    patient_id TEXT,
+    patient_name TEXT,
+    name_lower TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+"""
+
+_INDEXES = [f"CREATE INDEX patients_{field} ON patients ({field})" for field in ID_FIELDS]
+
+# Trigram FTS gives substring matches (SQLite >= 3.34). Names are lowercased
+# in Python first, so the tokenizer must not fold case itself.
+_FTS = """
+CREATE VIRTUAL TABLE patient_names USING fts5(name_lower, tokenize='trigram case_sensitive 1');
+INSERT INTO patient_names (rowid, name_lower) SELECT id, name_lower FROM patients;
+"""
+
+
+def _read_records(path: str):
+    """Yield records from a JSON array file or a JSON Lines export."""
+    with open(path, "r") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def import_json(json_path: str, sqlite_path: str) -> int:
+    """Convert db.json (or .jsonl) into a patient SQLite file. Returns the row count."""
+    tmp_path = f"{sqlite_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(_SCHEMA)
+        rows = (
+            (
+                pos,
+                *(record.get(field) if isinstance(record.get(field), str) else None for field in ID_FIELDS),
+                record.get("patient_name"),
+                (record.get("patient_name") or "").lower(),
+                json.dumps(record, ensure_ascii=False),
+            )
+            for pos, record in enumerate(_read_records(json_path))
+        )
+        conn.executemany("INSERT INTO patients VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        # Indexes after the bulk insert: much faster than maintaining them per row
+        for statement in _INDEXES:
+            conn.execute(statement)
+        try:
+            conn.executescript(_FTS)
+        except sqlite3.OperationalError as e:
+            print(f"[PHARMA] >>> WARNING: no FTS5 trigram support ({e}); name lookups will scan", flush=True)
+        conn.commit()
+        count = conn.execute("SELECT count(*) FROM patients").fetchone()[0]
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, sqlite_path)
+    return count
+
+
+class SqlitePatientStore:
+    """Read-only patient lookups against the SQLite file built by `import_json`."""
+
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; build it with: python src/patient_store.py import data/db.json {path}")
+        self.path = path
+        self._uri = f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+        self._local = threading.local()
+        self._has_fts = self._conn().execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'patient_names'"
+        ).fetchone() is not None
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads, and tool calls
+        # can run on executor threads, so each thread gets its own read-only one.
+        # Calls on the event loop thread never interleave inside a query.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._uri, uri=True)
+            # Map the file so workers on a node share its pages via the page cache
+            conn.execute("PRAGMA mmap_size = 1073741824")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT count(*) FROM patients").fetchone()[0]
+
+    def lookup(
+        self,
+        emirates_id: str | None = None,
+        policy_number: str | None = None,
+        claim_id: str | None = None,
+        patient_id: str | None = None,
+        patient_name: str | None = None,
+        limit: int | None = None,
+    ) -> list[dict]:
+        """Return records matching ANY of the given identifiers, in DB order."""
+        clauses, params = [], []
+        for field, value in (
+            ("emirates_id", emirates_id),
+            ("policy_number", policy_number),
+            ("claim_id", claim_id),
+            ("patient_id", patient_id),
+        ):
+            if value:
+                clauses.append(f"SELECT id FROM patients WHERE {field} = ?")
+                params.append(value)
+
+        if patient_name:
+            query = patient_name.lower()
+            if self._has_fts and len(query) >= 3:
+                # A quoted trigram phrase matches the query as a substring
+                name_sql = "SELECT rowid AS id FROM patient_names WHERE patient_names MATCH ? ORDER BY rowid"
+                params.append('"' + query.replace('"', '""') + '"')
+            else:
+                name_sql = "SELECT id FROM patients WHERE instr(name_lower, ?) > 0 ORDER BY id"
+                params.append(query)
+            # Both come back in id order, so only the first `limit` can make the cut
+            if limit is not None:
+                name_sql += " LIMIT ?"
+                params.append(limit)
+            clauses.append(f"SELECT id FROM ({name_sql})")
+
+        if not clauses:
+            return []
+        sql = f"SELECT record FROM patients WHERE id IN ({' UNION '.join(clauses)}) ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [json.loads(record) for (record,) in self._conn().execute(sql, params)]
+
+
+def open_patient_store(backend: str, json_path: str, sqlite_path: str):
+    """Return the patient store for `backend` ("json" or "sqlite")."""
+    if backend == "json":
+        return PatientIndex.attach(json_path)
+    if backend == "sqlite":
+        return SqlitePatientStore(sqlite_path)
+    raise ValueError(f"Unknown PATIENT_BACKEND {backend!r} (expected 'json' or 'sqlite')")
+
+
+def _verify(json_path: str, sqlite_path: str) -> int:
+    """Run every identifier in the JSON file (plus name fragments) against both backends."""
+    records = list(_read_records(json_path))
+    memory = PatientIndex(records)
+    sqlite_store = SqlitePatientStore(sqlite_path)
+
+    queries = [{"patient_name": "x"}, {"patient_name": "al"}, {"policy_number": "POL-MISSING"}]
+    for record in records:
+        for field in ID_FIELDS:
+            if record.get(field):
+                queries.append({field: record[field]})
+        name = record.get("patient_name") or ""
+        queries += [{"patient_name": name}, {"patient_name": name[: len(name) // 2].upper()}]
+
+    mismatches = 0
+    for query in queries:
+        for limit in (3, None):
+            if memory.lookup(limit=limit, **query) != sqlite_store.lookup(limit=limit, **query):
+                mismatches += 1
+                print(f"MISMATCH {query} limit={limit}")
+    print(f"{len(queries) * 2} lookups compared, {mismatches} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["import", "verify"])
+    parser.add_argument("json_path", nargs="?", default="data/db.json")
+    parser.add_argument("sqlite_path", nargs="?", default="data/patients.sqlite")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        start = time.perf_counter()
+        count = import_json(args.json_path, args.sqlite_path)
+        print(f"Imported {count} records into {args.sqlite_path} in {time.perf_counter() - start:.2f}s")
+    else:
+        sys.exit(_verify(args.json_path, args.sqlite_path))
@@ -0,0 +1,135 @@
+"""HTTP clients for the STT, LLM and TTS providers, shared per event loop.
+
+Every session builds its own plugin instances (their metrics events belong
+to that session), but they borrow one aiohttp session (Deepgram,
+ElevenLabs) and one OpenAI client (Groq) per event loop. A call therefore
+reuses the keep-alive connections that the warm-up or an earlier call
+opened, instead of paying DNS, TCP and TLS again. warm() starts those
+connections as soon as a job begins, alongside the room join, so they are
+off the greeting's critical path.
+"""
+import asyncio
+import weakref
+from urllib.parse import urlsplit, urlunsplit
+
+import aiohttp
+import httpx
+import openai
+
+# Longest wait for the tail of a response body the client stopped reading
+DRAIN_TIMEOUT_S = 0.5
+
+_warm_tasks: set[asyncio.Task] = set()
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ProviderClients]" = weakref.WeakKeyDictionary()
+
+
+class _DrainingStream(httpx.AsyncByteStream):
+    """A response body that is read to its end before it is closed.
+
+    The OpenAI SDK stops reading a stream at the SSE [DONE] event, just short
+    of the end of the chunked body, and httpx drops a connection closed
+    mid-body; draining the last bytes returns it to the pool instead."""
+
+    def __init__(self, stream: httpx.AsyncByteStream):
+        self._stream = stream
+        self._chunks = stream.__aiter__()
+
+    async def __aiter__(self):
+        async for chunk in self._chunks:
+            yield chunk
+
+    async def _drain(self) -> None:
+        async for _ in self._chunks:
+            pass
+
+    async def aclose(self) -> None:
+        try:
+            await asyncio.wait_for(self._drain(), DRAIN_TIMEOUT_S)
+        except (httpx.HTTPError, asyncio.TimeoutError):
+            pass
+        await self._stream.aclose()
+
+
+class _DrainingTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await super().handle_async_request(request)
+        response.stream = _DrainingStream(response.stream)
+        return response
+
+
+def new_openai_client(max_connections: int = 50) -> openai.AsyncClient:
+    """An OpenAI client with its own pool of up to `max_connections` draining connections.
+
+    httpcore rescans the whole pool, once per idle connection, whenever a
+    request enters or leaves it, so a busy server is better off with a few
+    small pools than one large one."""
+    return openai.AsyncClient(
+        api_key="unset",
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            timeout=httpx.Timeout(connect=15.0, read=5.0, write=5.0, pool=5.0),
+            follow_redirects=True,
+            transport=_DrainingTransport(
+                limits=httpx.Limits(
+                    max_connections=max_connections, max_keepalive_connections=max_connections, keepalive_expiry=120,
+                ),
+            ),
+        ),
+    )
+
+
+class ProviderClients:
+    """One connection pool per provider protocol, bound to the running loop."""
+
+    def __init__(self):
+        # Same pool settings as LiveKit's per-job http session and the OpenAI plugin
+        self.http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=50, keepalive_timeout=120),
+        )
+        self._openai = new_openai_client()
+
+    def openai_client(self, base_url: str, api_key: str) -> openai.AsyncClient:
+        """A client for `base_url` and `api_key` that shares this loop's connection pool."""
+        return self._openai.with_options(base_url=base_url, api_key=api_key)
+
+    async def aclose(self) -> None:
+        await self.http.close()
+        await self._openai.close()
+
+
+def shared() -> ProviderClients:
+    """The clients for the running event loop, created on first use."""
+    loop = asyncio.get_running_loop()
+    clients = _clients.get(loop)
+    if clients is None or clients.http.closed:
+        clients = _clients[loop] = ProviderClients()
+    return clients
+
+
+async def aclose() -> None:
+    """Close the running loop's clients (at the end of a job)."""
+    clients = _clients.pop(asyncio.get_running_loop(), None)
+    if clients is not None:
+        await clients.aclose()
+
+
+async def _touch(http: aiohttp.ClientSession, url: str) -> None:
+    # Any response leaves a handshaken keep-alive connection in the pool,
+    # which the websocket upgrade to the same host then reuses
+    parts = urlsplit(url)
+    scheme = {"ws": "http", "wss": "https"}.get(parts.scheme, parts.scheme)
+    try:
+        async with http.head(urlunsplit((scheme, parts.netloc, parts.path, "", "")), allow_redirects=False):
+            pass
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        pass
+
+
+def warm(session, stt_url: str) -> None:
+    """Open the session's provider connections in the background, ahead of its first turn."""
+    session.llm.prewarm()
+    session.tts.prewarm()
+    # The Deepgram plugin has no prewarm of its own
+    task = asyncio.create_task(_touch(shared().http, stt_url))
+    _warm_tasks.add(task)
+    task.add_done_callback(_warm_tasks.discard)
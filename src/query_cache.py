@@ -0,0 +1,154 @@
+"""LRU + TTL cache with single-flight for repeated semantic search queries.
+
+Callers and the LLM repeat near-identical queries within and across
+sessions; each repeat would otherwise cost a full embed-and-search round
+trip. Entries are keyed on (namespace, top_k, normalized query). A lookup
+that finds a search already in flight waits for it instead of sending its
+own, so N identical concurrent requests make one upstream call.
+
+Results for a namespace are dropped when it is re-upserted: the upsert
+script calls `mark_namespace_upserted`, which touches a marker file that
+every worker's cache checks on lookup.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable
+
+UPSERT_MARKER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", ".pinecone-upserts")
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query, used in cache keys."""
+    return " ".join(query.lower().split())
+
+
+def _marker_path(namespace: str) -> str:
+    return os.path.join(UPSERT_MARKER_DIR, namespace.replace(os.sep, "_") or "_default")
+
+
+def mark_namespace_upserted(namespace: str) -> None:
+    """Record that `namespace` changed, invalidating cached results in every worker."""
+    os.makedirs(UPSERT_MARKER_DIR, exist_ok=True)
+    with open(_marker_path(namespace), "w") as f:
+        f.write(f"{time.time()}\n")
+
+
+def _marker_mtime(namespace: str) -> int:
+    try:
+        return os.stat(_marker_path(namespace)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+class _Entry:
+    __slots__ = ("future", "expires_at")
+
+    def __init__(self, future: Future):
+        self.future = future
+        self.expires_at: float | None = None  # None while the search is in flight
+
+
+class QueryCache:
+    """Thread-safe LRU + TTL cache of search results, coalescing concurrent misses.
+
+    Keys are tuples whose first element is the namespace. `claim` returns
+    the entry's Future and whether the caller must fill it (with `fill`);
+    `get` does both for synchronous callers. Failed searches are not cached.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl_s: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._markers: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_marker(self, namespace: str) -> None:
+        mtime = _marker_mtime(namespace)
+        seen = self._markers.setdefault(namespace, mtime)
+        if mtime != seen:
+            self._markers[namespace] = mtime
+            self._drop_namespace(namespace)
+
+    def _drop_namespace(self, namespace: str) -> None:
+        stale = [key for key in self._entries if key[0] == namespace]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += 1
+
+    def claim(self, key: tuple) -> tuple[Future, bool]:
+        """Return (future, leader). The leader must call `fill(key, future, compute)`."""
+        with self._lock:
+            self._check_marker(key[0])
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at is None:
+                    self.coalesced += 1
+                    self._entries.move_to_end(key)
+                    return entry.future, False
+                if entry.expires_at > self._clock():
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return entry.future, False
+                self.expirations += 1
+                del self._entries[key]
+
+            self.misses += 1
+            entry = _Entry(Future())
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return entry.future, True
+
+    def fill(self, key: tuple, future: Future, compute: Callable[[], object]) -> None:
+        """Run `compute` for a claimed key and publish the result to every waiter."""
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.future is future:
+                    del self._entries[key]
+            future.set_exception(e)
+            return
+
+        with self._lock:
+            entry = self._entries.get(key)
+            # Evicted or invalidated while in flight: waiters still get the value
+            if entry is not None and entry.future is future:
+                entry.expires_at = self._clock() + self.ttl_s
+        future.set_result(value)
+
+    def get(self, key: tuple, compute: Callable[[], object]):
+        future, leader = self.claim(key)
+        if leader:
+            self.fill(key, future, compute)
+        return future.result()
+
+    def invalidate_namespace(self, namespace: str) -> None:
+        """Drop every cached result for `namespace` in this process."""
+        with self._lock:
+            self._drop_namespace(namespace)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -1,24 +1,108 @@
 from pinecone import Pinecone
 import os
 import json
+import asyncio
 import logging
-from groq import Groq
+import threading
+from collections.abc import AsyncIterator
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from decouple import config
-from system_prompt import SYSTEM_PROMPT
-
-PINECONE_API_KEY     = config("PINECONE_API_KEY")
-PINECONE_HOST        = config("PINECONE_HOST")
-PINECONE_NAMESPACE   = config("PINECONE_NAMESPACE")
+import provider_clients
+from system_prompt import CallFacts, build_system_prompt
+from query_cache import QueryCache, normalize_query
+from bm25_index import BM25Index, rrf_fuse
+from chat_memory import ChatMemory
+
+# pinecone: the hosted index; local: vector_index.py over the JSON records
+RAG_BACKEND          = config("RAG_BACKEND", default="pinecone")
+LOCAL_EMBEDDER       = config("LOCAL_EMBEDDER", default="sentence-transformers")
+LOCAL_EMBED_MODEL    = config("LOCAL_EMBED_MODEL", default="sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_NPROBE         = config("LOCAL_NPROBE", default=8, cast=int)
+
+# Fuse the vector hits with BM25 over the record text (exact codes, IDs, names)
+RAG_HYBRID           = config("RAG_HYBRID", default=True, cast=bool)
+
+# Run the searches of one LLM step at once (each within PINECONE_TIMEOUT_S)
+RAG_PARALLEL_TOOLS   = config("RAG_PARALLEL_TOOLS", default=True, cast=bool)
+
+# Only required for the pinecone backend
+_pinecone_optional   = {} if RAG_BACKEND == "pinecone" else {"default": ""}
+PINECONE_API_KEY     = config("PINECONE_API_KEY", **_pinecone_optional)
+PINECONE_HOST        = config("PINECONE_HOST", **_pinecone_optional)
+PINECONE_NAMESPACE   = config("PINECONE_NAMESPACE", **_pinecone_optional) or "local"
+
+# Per-call deadline and the number of searches in flight per process
+PINECONE_TIMEOUT_S   = config("PINECONE_TIMEOUT_S", default=5.0, cast=float)
+PINECONE_MAX_WORKERS = config("PINECONE_MAX_WORKERS", default=8, cast=int)
+
+# Repeated queries are answered from a per-process cache (0 entries disables it)
+PINECONE_CACHE_SIZE  = config("PINECONE_CACHE_SIZE", default=512, cast=int)
+PINECONE_CACHE_TTL_S = config("PINECONE_CACHE_TTL_S", default=300.0, cast=float)
 
 GROQ_API_KEY  = config("GROQ_API_KEY")
 GROQ_MODEL    = "openai/gpt-oss-120b"
-
-pc             = Pinecone(api_key=PINECONE_API_KEY)
-pinecone_index = pc.Index(host=PINECONE_HOST)
-groq_client    = Groq(api_key=GROQ_API_KEY)
-
-def pinecone_search(query: str, top_k: int = 5):
-    """Semantic search over Pinecone. Returns list of text snippets or [] on failure."""
+# Same variable as the agent (Groq's OpenAI-compatible endpoint)
+GROQ_BASE_URL = config("GROQ_BASE_URL", default="https://api.groq.com/openai/v1")
+
+_logger = logging.getLogger(__name__)
+
+# One client per process: its keep-alive connection pool is reused by every
+# search instead of paying a TCP/TLS handshake per call
+if RAG_BACKEND == "pinecone":
+    # The keep-alive pool is sized to the search pool, so no search waits for a connection
+    pc             = Pinecone(api_key=PINECONE_API_KEY, connection_pool_maxsize=PINECONE_MAX_WORKERS)
+    pinecone_index = pc.Index(host=PINECONE_HOST)
+elif RAG_BACKEND != "local":
+    raise ValueError(f"Unknown RAG_BACKEND {RAG_BACKEND!r} (expected 'pinecone' or 'local')")
+
+_local_index = None
+_local_index_lock = threading.Lock()
+
+def _get_local_index():
+    """The local vector index, loaded (or built) on first use."""
+    global _local_index
+    if _local_index is None:
+        with _local_index_lock:
+            if _local_index is None:
+                import vector_index
+                _local_index = vector_index.attach(LOCAL_EMBEDDER, LOCAL_EMBED_MODEL)
+    return _local_index
+
+# Bounded pool for pinecone_search_async, so the blocking client never runs on
+# the event loop and a slow index cannot pile up unbounded threads
+_search_pool = ThreadPoolExecutor(max_workers=PINECONE_MAX_WORKERS, thread_name_prefix="pinecone-search")
+
+_search_cache = QueryCache(maxsize=PINECONE_CACHE_SIZE, ttl_s=PINECONE_CACHE_TTL_S)
+
+_bm25_index = None
+
+def _get_bm25_index():
+    """BM25 over the records the vector backend holds, built on first use."""
+    global _bm25_index
+    if _bm25_index is None:
+        with _local_index_lock:
+            if _bm25_index is None:
+                from vector_index import DATA_DIR, DEFAULT_SOURCES, load_record_texts
+                # pinecone_upsert.py indexes db.json; the local backend adds pharma.json
+                sources = DEFAULT_SOURCES if RAG_BACKEND == "local" else (os.path.join(DATA_DIR, "db.json"),)
+                _bm25_index = BM25Index(load_record_texts(sources))
+    return _bm25_index
+
+def _cache_key(query: str, top_k: int) -> tuple:
+    return (PINECONE_NAMESPACE, top_k, normalize_query(query))
+
+def search_cache_stats() -> dict[str, int]:
+    """Hit/miss/coalesced/eviction counters of the Pinecone query cache."""
+    return _search_cache.stats()
+
+def invalidate_search_cache(namespace: str = PINECONE_NAMESPACE) -> None:
+    """Drop cached results for `namespace` in this process (other workers follow the upsert marker)."""
+    _search_cache.invalidate_namespace(namespace)
+
+def _vector_search(query: str, top_k: int, timeout: float | None):
+    if RAG_BACKEND == "local":
+        return _get_local_index().search(query, top_k, nprobe=LOCAL_NPROBE)
     try:
         res = pinecone_index.search(
             namespace=PINECONE_NAMESPACE,
@@ -27,6 +111,7 @@ def pinecone_search(query: str, top_k: int = 5):
                 "top_k": top_k,
             },
             fields=["text"],
+            timeout=timeout,
         )
         hits = res.get("result", {}).get("hits", [])
         return [hit["fields"]["text"] for hit in hits if hit.get("fields", {}).get("text")]
@@ -37,90 +122,180 @@ def pinecone_search(query: str, top_k: int = 5):
         _logger.exception("Pinecone search failed: %s", e)
         raise
 
-CHAT_HISTORY = []
-
-def ask_groq_with_context(query: str, max_retries: int = 3):
-    global CHAT_HISTORY
-
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "pinecone_search",
-                "description": (
-                    "Search the insurance and pharmacy database to retrieve patient records, "
-                    "policy details, medication coverage, claim status, denial codes, "
-                    "dispensing history, and alternative drug availability."
-                ),
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "query": {
-                            "type": "string",
-                            "description": (
-                                "A natural language query to find the relevant patient or claim record. "
-                                "Include identifiers like Emirates ID, policy number, patient name, "
-                                "drug name, or claim ID when available."
-                            ),
-                        },
-                        "top_k": {
-                            "type": "integer",
-                            "description": "Number of records to retrieve. Default is 3.",
-                            "default": 3,
-                        },
+def _search_uncached(query: str, top_k: int, timeout: float | None):
+    if not RAG_HYBRID:
+        return _vector_search(query, top_k, timeout)
+    # Rank deeper than top_k on both sides so fusion can promote a record
+    # that only one of them places near the top
+    depth = max(2 * top_k, 10)
+    semantic = _vector_search(query, depth, timeout)
+    lexical = _get_bm25_index().search(query, depth)
+    # Lexical first: on equal fused scores the exact-token match wins
+    return rrf_fuse([lexical, semantic], top_k)
+
+def pinecone_search(query: str, top_k: int = 5, timeout: float | None = PINECONE_TIMEOUT_S):
+    """Semantic search over Pinecone (or the local index with RAG_BACKEND=local),
+    fused with BM25 unless RAG_HYBRID is off. Returns list of text snippets or [] on failure.
+
+    Served from the query cache when the same normalized query was searched
+    recently; concurrent identical searches share one upstream call.
+    """
+    key = _cache_key(query, top_k)
+    return list(_search_cache.get(key, partial(_search_uncached, query, top_k, timeout)))
+
+async def pinecone_search_async(query: str, top_k: int = 5, timeout: float = PINECONE_TIMEOUT_S):
+    """`pinecone_search` for async callers: runs on the bounded search pool.
+
+    Raises TimeoutError once `timeout` has passed, counting time spent waiting
+    for a free worker and the client's own retries.
+    """
+    key = _cache_key(query, top_k)
+    future, leader = _search_cache.claim(key)
+    if leader:
+        _search_pool.submit(_search_cache.fill, key, future, partial(_search_uncached, query, top_k, timeout))
+    # Shielded: timing out here must not cancel the search other callers share
+    waiter = asyncio.wrap_future(future)
+    waiter.add_done_callback(lambda f: f.cancelled() or f.exception())
+    try:
+        return list(await asyncio.wait_for(asyncio.shield(waiter), timeout))
+    except asyncio.TimeoutError:
+        _logger.warning("Pinecone search timed out after %.1fs: %r", timeout, query)
+        raise TimeoutError(f"Pinecone search timed out after {timeout:.1f}s") from None
+
+async def _run_searches(searches: list[tuple[str, int]],
+                        timeout: float = PINECONE_TIMEOUT_S) -> list[list[str] | None]:
+    """Hits of each (query, top_k), in order; None for a search that missed its deadline.
+
+    With RAG_PARALLEL_TOOLS the searches all start at once on the bounded
+    pool, so a step checking three drugs waits about as long as its slowest
+    search instead of the sum of the three."""
+    async def one(query: str, top_k: int) -> list[str] | None:
+        try:
+            return await pinecone_search_async(query, top_k, timeout)
+        except TimeoutError:
+            return None
+
+    if RAG_PARALLEL_TOOLS:
+        return list(await asyncio.gather(*(one(query, top_k) for query, top_k in searches)))
+    return [await one(query, top_k) for query, top_k in searches]
+
+def warm() -> None:
+    """Load the indexes and the embedder (local) or open the pooled connection
+    (Pinecone) with one uncached search, so the first caller query does not pay for it."""
+    try:
+        _search_uncached("prior authorization denial", 1, PINECONE_TIMEOUT_S)
+    except Exception as e:
+        _logger.warning("Search warm-up failed: %s", e)
+
+# JSON schema of the one tool the RAG agent has
+SEARCH_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "pinecone_search",
+            "description": (
+                "Search the insurance and pharmacy database to retrieve patient records, "
+                "policy details, medication coverage, claim status, denial codes, "
+                "dispensing history, and alternative drug availability."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": (
+                            "A natural language query to find the relevant patient or claim record. "
+                            "Include identifiers like Emirates ID, policy number, patient name, "
+                            "drug name, or claim ID when available."
+                        ),
+                    },
+                    "top_k": {
+                        "type": "integer",
+                        "description": "Number of records to retrieve. Default is 3.",
+                        "default": 3,
                     },
-                    "required": ["query"],
                 },
+                "required": ["query"],
             },
-        }
-    ]
-
-    CHAT_HISTORY.append({"role": "user", "content": query})
-
-    system_message = {"role": "system", "content": SYSTEM_PROMPT}
-
-    empty_search_retries = 0
-    max_total_steps = 10
+        },
+    }
+]
+
+# The prompt describes only the tools the model is given
+SEARCH_TOOL_NAMES = tuple(tool["function"]["name"] for tool in SEARCH_TOOLS)
+
+# How much of the caller's recent text search hits are matched against for
+# identifiers; the records it already identified stay in the session's CallFacts
+CALLER_TEXT_CHARS = 2000
+
+class ChatSession:
+    """One text conversation with the RAG agent: its memory and the tool loop.
+
+    Sessions share the running loop's Groq connection pool (provider_clients),
+    so one process can hold many of them; each keeps only its ChatMemory and
+    the records the caller has been identified with (CallFacts), which pick
+    the system prompt's sections.
+    """
+
+    def __init__(self, memory: ChatMemory | None = None, max_retries: int = 3, client=None):
+        self.memory = ChatMemory() if memory is None else memory
+        self.max_retries = max_retries
+        self.client = client
+        self.facts = CallFacts()
+        self._caller_text = ""
+
+    async def ask(self, query: str) -> AsyncIterator[dict]:
+        """Answer one message. Yields {"type": "search", "query"} for each
+        database lookup and {"type": "token", "text"} as the reply streams."""
+        client = self.client or provider_clients.shared().openai_client(GROQ_BASE_URL, GROQ_API_KEY)
+        memory = self.memory
+        memory.append({"role": "user", "content": query})
+        self._caller_text = (self._caller_text + "\n" + query)[-CALLER_TEXT_CHARS:]
+
+        empty_search_retries = 0
+        max_total_steps = 10
+
+        for step in range(max_total_steps):
+            system_message = {"role": "system", "content": build_system_prompt(self.facts, SEARCH_TOOL_NAMES)}
+            llm_messages = [system_message] + memory.messages()
+
+            chat_completion = await client.chat.completions.create(
+                model=GROQ_MODEL,
+                messages=llm_messages,
+                tools=SEARCH_TOOLS,
+                tool_choice="auto",
+                stream=True,
+            )
+
+            full_content      = ""
+            tool_calls_buffer = {}
+
+            async for chunk in chat_completion:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+
+                if delta.tool_calls:
+                    for tc in delta.tool_calls:
+                        idx = tc.index
+                        if idx not in tool_calls_buffer:
+                            tool_calls_buffer[idx] = {"id": tc.id or "", "name": "", "arguments": ""}
+                        if tc.id:
+                            tool_calls_buffer[idx]["id"] = tc.id
+                        if tc.function:
+                            if tc.function.name:
+                                tool_calls_buffer[idx]["name"] += tc.function.name
+                            if tc.function.arguments:
+                                tool_calls_buffer[idx]["arguments"] += tc.function.arguments
+
+                if delta.content:
+                    full_content += delta.content
+                    yield {"type": "token", "text": delta.content}
+
+            if not tool_calls_buffer:
+                memory.append({"role": "assistant", "content": full_content})
+                return
 
-    for step in range(max_total_steps):
-        llm_messages = [system_message] + CHAT_HISTORY
-
-        chat_completion = groq_client.chat.completions.create(
-            model=GROQ_MODEL,
-            messages=llm_messages,
-            tools=tools,
-            tool_choice="auto",
-            stream=True,
-        )
-
-        full_content      = ""
-        tool_calls_buffer = {}
-
-        print("\nAI Agent: ", end="", flush=True)
-
-        for chunk in chat_completion:
-            delta = chunk.choices[0].delta
-
-            if delta.tool_calls:
-                for tc in delta.tool_calls:
-                    idx = tc.index
-                    if idx not in tool_calls_buffer:
-                        tool_calls_buffer[idx] = {"id": tc.id or "", "name": "", "arguments": ""}
-                    if tc.id:
-                        tool_calls_buffer[idx]["id"] = tc.id
-                    if tc.function:
-                        if tc.function.name:
-                            tool_calls_buffer[idx]["name"] += tc.function.name
-                        if tc.function.arguments:
-                            tool_calls_buffer[idx]["arguments"] += tc.function.arguments
-
-            if delta.content:
-                print(delta.content, end="", flush=True)
-                full_content += delta.content
-
-        print()
-
-        if tool_calls_buffer:
             tool_calls = [
                 {
                     "id": tool_calls_buffer[idx]["id"],
@@ -133,7 +308,7 @@ def ask_groq_with_context(query: str, max_retries: int = 3):
                 for idx in sorted(tool_calls_buffer)
             ]
 
-            CHAT_HISTORY.append({
+            memory.append({
                 "role": "assistant",
                 "content": full_content or None,
                 "tool_calls": tool_calls,
@@ -141,40 +316,45 @@ def ask_groq_with_context(query: str, max_retries: int = 3):
 
             has_new_results = False
 
+            searches = []
             for tc in tool_calls:
-                fn_name = tc["function"]["name"]
+                if tc["function"]["name"] != "pinecone_search":
+                    continue
                 try:
                     fn_args = json.loads(tc["function"]["arguments"])
                 except json.JSONDecodeError:
                     fn_args = {}
-
-                if fn_name == "pinecone_search":
-                    search_query = fn_args.get("query", "")
-                    top_k        = fn_args.get("top_k", 3)
-
-                    print(f"  [Database lookup: \"{search_query}\"]")
-                    hits = pinecone_search(search_query, top_k=top_k)
-
-                    if hits:
-                        has_new_results = True
-                        context = "\n---\n".join(hits)
-                    else:
-                        context = (
-                            "No matching record found. "
-                            "The patient may not be in the system, or the details provided may be incorrect."
-                        )
-
-                    CHAT_HISTORY.append({
-                        "tool_call_id": tc["id"],
-                        "role": "tool",
-                        "name": fn_name,
-                        "content": context,
-                    })
+                search_query = fn_args.get("query", "")
+                top_k        = fn_args.get("top_k", 3)
+                yield {"type": "search", "query": search_query}
+                searches.append((tc, search_query, top_k))
+
+            # Results go back in tool_call order, whichever search finished first
+            all_hits = await _run_searches([(query, top_k) for _, query, top_k in searches])
+            for (tc, _, _), hits in zip(searches, all_hits):
+                self.facts.add_search_hits(hits, self._caller_text)
+                if hits:
+                    has_new_results = True
+                    context = "\n---\n".join(hits)
+                elif hits is None:
+                    context = "The database search timed out. Let the caller know and try again."
+                else:
+                    context = (
+                        "No matching record found. "
+                        "The patient may not be in the system, or the details provided may be incorrect."
+                    )
+
+                memory.append({
+                    "tool_call_id": tc["id"],
+                    "role": "tool",
+                    "name": "pinecone_search",
+                    "content": context,
+                }, records=hits)
 
             if not has_new_results:
                 empty_search_retries += 1
-                if empty_search_retries >= max_retries:
-                    CHAT_HISTORY.append({
+                if empty_search_retries >= self.max_retries:
+                    memory.append({
                         "role": "system",
                         "content": (
                             "Notice: Multiple database lookups returned no results. "
@@ -183,11 +363,45 @@ def ask_groq_with_context(query: str, max_retries: int = 3):
                         ),
                     })
 
-            continue
+# The console session's history (CHAT_TOKEN_BUDGET, CHAT_KEEP_TURNS)
+CHAT_MEMORY = ChatMemory()
 
+_console_loop = None
+_console_session = None
+
+async def _print_turn(session: ChatSession, query: str) -> None:
+    print("\nAI Agent: ", end="", flush=True)
+    async for event in session.ask(query):
+        if event["type"] == "search":
+            print(f"\n  [Database lookup: \"{event['query']}\"]", flush=True)
         else:
-            CHAT_HISTORY.append({"role": "assistant", "content": full_content})
-            break
+            print(event["text"], end="", flush=True)
+    print()
+
+def ask_groq_with_context(query: str, max_retries: int = 3, memory: ChatMemory | None = None):
+    """Answer one console message, printing the reply as it streams.
+
+    The console keeps one ChatSession for the process, so the records the
+    caller was identified with carry over between messages; passing another
+    `memory` starts a new session on it."""
+    global _console_loop, _console_session
+    # One loop for the whole console session, so its connections are reused
+    if _console_loop is None:
+        _console_loop = asyncio.new_event_loop()
+    if _console_session is None or (memory is not None and memory is not _console_session.memory):
+        _console_session = ChatSession(CHAT_MEMORY if memory is None else memory, max_retries)
+    _console_session.max_retries = max_retries
+    _console_loop.run_until_complete(_print_turn(_console_session, query))
+
+def close_console() -> None:
+    """Close the console session's connections and its event loop."""
+    global _console_loop, _console_session
+    _console_session = None
+    if _console_loop is not None:
+        _console_loop.run_until_complete(provider_clients.aclose())
+        _console_loop.run_until_complete(_console_loop.shutdown_asyncgens())
+        _console_loop.close()
+        _console_loop = None
 
 
 if __name__ == "__main__":
@@ -210,4 +424,5 @@ if __name__ == "__main__":
             break
         except Exception as e:
             print(f"\n[System Error]: {e}")
-            break
\ No newline at end of file
+            break
+    close_console()
\ No newline at end of file
@@ -0,0 +1,310 @@
+"""Compiled, memory-mapped snapshots of the patient and drug code tables.
+
+A snapshot sits next to its source (`data/db.json.snapshot`,
+`data/Claim Drug Code List.xlsx.snapshot`) and holds the rows plus the
+prebuilt lookup indexes as flat arrays. Worker processes mmap it read-only,
+so the pages live once in the OS page cache and are shared by every worker
+on the node instead of each worker building its own lists of dicts.
+
+A snapshot is reused while the source file's size and mtime match, or, if
+the mtime moved (git checkout, copy), while its sha256 still matches.
+Otherwise it is rebuilt from the source under a file lock, so workers that
+start together build it once.
+
+File layout: section data, then the JSON header, its length (u64) and the
+magic bytes. Sections are 8-byte aligned.
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import marshal
+import hashlib
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds are not serialized across workers
+    fcntl = None
+
+_MAGIC = b"PHARMASNAP2\n"
+_TRAILER = struct.Struct("<Q")
+# Rows are stored with marshal, whose format is tied to the interpreter
+_FORMAT = f"marshal-{marshal.version}-py{sys.version_info[0]}.{sys.version_info[1]}"
+
+
+def snapshot_path_for(source_path: str) -> str:
+    return source_path + ".snapshot"
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StringList:
+    """Read-only sequence of str stored as offsets + UTF-8 data."""
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def _blob(self, i: int) -> memoryview:
+        # Non-negative indexes only; offsets[i + 1] raises IndexError past the end
+        offsets = self._offsets
+        return self._data[offsets[i]:offsets[i + 1]]
+
+    def __getitem__(self, i: int) -> str:
+        return str(self._blob(i), "utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class RecordList(StringList):
+    """Read-only sequence of dicts, each decoded from its own blob on access.
+
+    Rows whose keys match the table's columns are stored as value tuples.
+    """
+
+    def __init__(self, offsets: memoryview, data: memoryview, columns: list[str]):
+        super().__init__(offsets, data)
+        self._columns = columns
+
+    def __getitem__(self, i: int) -> dict:
+        row = marshal.loads(self._blob(i))
+        return dict(zip(self._columns, row)) if isinstance(row, tuple) else row
+
+
+class MultiMap:
+    """Read-only mapping of str -> row positions (a memoryview of uint32)."""
+
+    def __init__(self, keys: StringList, starts: memoryview, postings: memoryview):
+        self._keys = keys
+        self._starts = starts
+        self._postings = postings
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def get(self, key: str, default=None):
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._postings[self._starts[i]:self._starts[i + 1]]
+        return default
+
+    def __getitem__(self, key: str) -> memoryview:
+        postings = self.get(key)
+        if postings is None:
+            raise KeyError(key)
+        return postings
+
+
+class Haystack:
+    """A bytes section searched in place with mmap.find (no private copy)."""
+
+    def __init__(self, mm: mmap.mmap, offset: int, length: int):
+        self._mm = mm
+        self._offset = offset
+        self._end = offset + length
+
+    def find(self, sub: bytes, start: int = 0) -> int:
+        i = self._mm.find(sub, self._offset + start, self._end)
+        return i if i < 0 else i - self._offset
+
+
+class SnapshotWriter:
+    """Writes sections to a temp file; `commit` adds the header and renames it into place."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.meta: dict = {}
+        self._tmp_path = f"{path}.{os.getpid()}.tmp"
+        self._f = open(self._tmp_path, "wb")
+        self._sections: dict[str, dict] = {}
+
+    def _begin(self) -> int:
+        pad = -self._f.tell() % 8
+        self._f.write(b"\0" * pad)
+        return self._f.tell()
+
+    def add_ints(self, name: str, values, typecode: str = "I") -> None:
+        data = array(typecode, values)
+        offset = self._begin()
+        data.tofile(self._f)
+        self._sections[name] = {"type": "ints", "typecode": typecode, "offset": offset, "count": len(data)}
+
+    def add_bytes(self, name: str, data: bytes) -> None:
+        offset = self._begin()
+        self._f.write(data)
+        self._sections[name] = {"type": "bytes", "offset": offset, "length": len(data)}
+
+    def _add_blobs(self, name: str, kind: str, blobs: list[bytes]) -> None:
+        offsets = array("Q", [0])
+        for blob in blobs:
+            offsets.append(offsets[-1] + len(blob))
+        self.add_ints(f"{name}.offsets", offsets, "Q")
+        self.add_bytes(f"{name}.data", b"".join(blobs))
+        self._sections[name] = {"type": kind}
+
+    def add_strings(self, name: str, strings) -> None:
+        self._add_blobs(name, "strings", [s.encode("utf-8") for s in strings])
+
+    def add_records(self, name: str, records) -> None:
+        columns = tuple(records[0]) if records else ()
+        self._add_blobs(name, "records", [
+            marshal.dumps(tuple(r.values()) if tuple(r) == columns else r) for r in records
+        ])
+        self._sections[name]["columns"] = list(columns)
+
+    def add_multimap(self, name: str, mapping: dict[str, list[int]]) -> None:
+        keys = sorted(mapping)
+        starts = array("Q", [0])
+        postings = array("I")
+        for key in keys:
+            postings.extend(mapping[key])
+            starts.append(len(postings))
+        self.add_strings(f"{name}.keys", keys)
+        self.add_ints(f"{name}.starts", starts, "Q")
+        self.add_ints(f"{name}.postings", postings, "I")
+        self._sections[name] = {"type": "multimap"}
+
+    def commit(self, source_path: str, kind: str) -> None:
+        st = os.stat(source_path)
+        header = json.dumps({
+            "format": _FORMAT,
+            "kind": kind,
+            "source": {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": _sha256(source_path)},
+            "meta": self.meta,
+            "sections": self._sections,
+        }).encode()
+        self._f.write(header + _TRAILER.pack(len(header)) + _MAGIC)
+        self._f.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        self._f.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class Snapshot:
+    """A read-only, memory-mapped snapshot file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        tail = len(_MAGIC) + _TRAILER.size
+        if len(self._mm) < tail or self._mm[-len(_MAGIC):] != _MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a snapshot")
+        (header_len,) = _TRAILER.unpack(self._mm[-tail:-len(_MAGIC)])
+        self.header = json.loads(self._mm[-tail - header_len:-tail])
+        self.meta = self.header.get("meta", {})
+        self._mv: memoryview | None = None
+
+    @classmethod
+    def open(cls, path: str) -> "Snapshot | None":
+        try:
+            return cls(path)
+        except (OSError, ValueError):
+            return None
+
+    def close(self) -> None:
+        if self._mv is None:
+            self._mm.close()
+
+    def is_fresh(self, source_path: str, kind: str) -> bool:
+        if self.header.get("format") != _FORMAT or self.header.get("kind") != kind:
+            return False
+        source = self.header["source"]
+        st = os.stat(source_path)
+        if source["size"] != st.st_size:
+            return False
+        return source["mtime_ns"] == st.st_mtime_ns or source["sha256"] == _sha256(source_path)
+
+    def _section(self, name: str) -> dict:
+        if self._mv is None:
+            self._mv = memoryview(self._mm)
+        return self.header["sections"][name]
+
+    def ints(self, name: str) -> memoryview:
+        s = self._section(name)
+        size = array(s["typecode"]).itemsize
+        return self._mv[s["offset"]:s["offset"] + s["count"] * size].cast(s["typecode"])
+
+    def data(self, name: str) -> memoryview:
+        s = self._section(name)
+        return self._mv[s["offset"]:s["offset"] + s["length"]]
+
+    def haystack(self, name: str) -> Haystack:
+        s = self._section(name)
+        return Haystack(self._mm, s["offset"], s["length"])
+
+    def strings(self, name: str) -> StringList:
+        return StringList(self.ints(f"{name}.offsets"), self.data(f"{name}.data"))
+
+    def records(self, name: str) -> RecordList:
+        columns = self._section(name)["columns"]
+        return RecordList(self.ints(f"{name}.offsets"), self.data(f"{name}.data"), columns)
+
+    def multimap(self, name: str) -> MultiMap:
+        return MultiMap(self.strings(f"{name}.keys"), self.ints(f"{name}.starts"), self.ints(f"{name}.postings"))
+
+
+@contextmanager
+def _build_lock(path: str):
+    with open(path + ".lock", "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def open_snapshot(source_path: str, kind: str, build: Callable[[SnapshotWriter], None]) -> Snapshot:
+    """Attach to the snapshot of `source_path`, (re)building it first if stale.
+
+    `build` receives a writer and adds the sections; `kind` names the layout
+    so a code change that alters it invalidates old snapshots.
+    """
+    path = snapshot_path_for(source_path)
+    start = time.perf_counter()
+
+    snap = Snapshot.open(path)
+    if snap is None or not snap.is_fresh(source_path, kind):
+        if snap is not None:
+            snap.close()
+        with _build_lock(path):
+            # Another worker may have finished the rebuild while we waited
+            snap = Snapshot.open(path)
+            if snap is None or not snap.is_fresh(source_path, kind):
+                if snap is not None:
+                    snap.close()
+                writer = SnapshotWriter(path)
+                try:
+                    build(writer)
+                    writer.commit(source_path, kind)
+                except BaseException:
+                    writer.abort()
+                    raise
+                snap = Snapshot(path)
+                print(f"[PHARMA] >>> Built snapshot {path} in {time.perf_counter() - start:.2f}s", flush=True)
+                return snap
+
+    print(f"[PHARMA] >>> Attached snapshot {path} in {time.perf_counter() - start:.3f}s", flush=True)
+    return snap
@@ -1,111 +1,376 @@
-import os
+"""
+Streaming Deepgram STT over asyncio: the live microphone, a WAV replay, or a
+load test of many concurrent streams.
+
+Audio goes through a bounded ring buffer to a sender that cuts it into
+--frame-ms frames. A WAV replay waits while the ring is full (backpressure);
+the microphone cannot wait, so its oldest audio is dropped and counted. When
+a connection drops, the client reconnects and first re-sends the audio after
+the last final transcript, so the utterance in progress is not lost.
+
+Each transcript's latency is the time from sending the end of the audio it
+covers (start + duration) to receiving it, for interim and final results.
+With --streams N, N replays run at once and the latency percentiles are
+printed at the end. Point DEEPGRAM_URL at scripts/sim_standins.py to run it
+offline.
+
+Usage:
+    python src/stt.py                                    # microphone
+    python src/stt.py --file call.wav --speed 2
+    python src/stt.py --file a.wav --file b.wav --streams 20 --speed 0 --report stt.json
+"""
+import sys
 import json
-import queue
-import threading
-import sounddevice as sd
-from websocket import create_connection
+import time
+import wave
+import asyncio
+import argparse
+from bisect import bisect_left
+from urllib.parse import urlencode
+
+import aiohttp
 from decouple import config
-# -------------------------------------------------------------------
-# CONFIG — replace or export your Deepgram API key first:
-#   export DEEPGRAM_API_KEY="YOUR_DEEPGRAM_API_KEY"
-# -------------------------------------------------------------------
+
 API_KEY = config("DEEPGRAM_API_KEY")
+# Same variable as the agent
+DEEPGRAM_URL = config("DEEPGRAM_URL", default="https://api.deepgram.com/v1/listen")
 
-# WebSocket endpoint with Nova-3 and interim results turned on
-WS_URL = (
-    "wss://api.deepgram.com/v1/listen"
-    "?model=nova-3"
-    "&language=en-US"
-    "&interim_results=true"
-    "&encoding=linear16"
-    "&sample_rate=16000"
-)
+MODEL = "nova-3"
+SAMPLE_RATE = 16000
+MAX_RECONNECTS = 5
+# Longest wait for the last results after CloseStream
+CLOSE_TIMEOUT_S = 10.0
 
-audio_queue = queue.Queue()
-stop_event = threading.Event()
 
-SAMPLE_RATE = 16000
-CHANNELS = 1
-DTYPE = "int16"
-BLOCK_SIZE = 1024
+class AudioRing:
+    """Bounded FIFO of PCM bytes between an audio source and the sender."""
 
-def mic_callback(indata, frames, time, status):
-    if status:
-        print(status)
-    audio_queue.put(indata.copy())
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.dropped = 0  # bytes overwritten by write_nowait
+        self._buf = bytearray(capacity)
+        self._start = 0
+        self._size = 0
+        self._closed = False
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
 
-def receive_loop(ws):
-    last_interim = ""
+    def _put(self, data: memoryview) -> None:
+        end = (self._start + self._size) % self.capacity
+        first = min(len(data), self.capacity - end)
+        self._buf[end:end + first] = data[:first]
+        self._buf[:len(data) - first] = data[first:]
+        self._size += len(data)
+        self._readable.set()
 
-    while not stop_event.is_set():
-        try:
-            msg = ws.recv()
-            if not msg:
-                continue
-            data = json.loads(msg)
+    async def write(self, data: bytes) -> None:
+        """Append `data`, waiting while the ring is full."""
+        view = memoryview(data)
+        while view:
+            while self._size == self.capacity:
+                self._writable.clear()
+                await self._writable.wait()
+            n = min(len(view), self.capacity - self._size)
+            self._put(view[:n])
+            view = view[n:]
+
+    def write_nowait(self, data: bytes) -> None:
+        """Append `data` without waiting, overwriting the oldest audio when full."""
+        view = memoryview(data)[-self.capacity:]
+        over = self._size + len(view) - self.capacity
+        if over > 0:
+            self._start = (self._start + over) % self.capacity
+            self._size -= over
+            self.dropped += over
+        self._put(view)
+
+    async def read(self, n: int) -> bytes:
+        """The next `n` bytes; fewer at the end of the audio, b"" once it is drained."""
+        while self._size < n and not self._closed:
+            self._readable.clear()
+            await self._readable.wait()
+        n = min(n, self._size)
+        first = min(n, self.capacity - self._start)
+        out = bytes(self._buf[self._start:self._start + first]) + bytes(self._buf[:n - first])
+        self._start = (self._start + n) % self.capacity
+        self._size -= n
+        self._writable.set()
+        return out
+
+    def close(self) -> None:
+        """No more audio: read() returns what is left, then b""."""
+        self._closed = True
+        self._readable.set()
 
-            # Print metadata or other non-transcript messages for debugging
-            if "channel" not in data:
-                if "metadata" in data:
-                    print(f"DEBUG: Connection Metadata: {data['metadata']}")
-                continue
 
-            alt = data["channel"]["alternatives"][0]
-            transcript = alt.get("transcript", "")
+class SttStream:
+    """One Deepgram stream: audio from a ring in, transcripts and their latency out."""
 
+    def __init__(self, http: aiohttp.ClientSession, ring: AudioRing, sample_rate: int, channels: int,
+                 frame_bytes: int, speed: float = 0.0, on_transcript=None):
+        self.http = http
+        self.ring = ring
+        self.sample_bytes = 2 * channels
+        self.bytes_per_s = self.sample_bytes * sample_rate
+        self.frame_bytes = frame_bytes
+        self.speed = speed
+        self.on_transcript = on_transcript
+        self.url = DEEPGRAM_URL.replace("http", "ws", 1) + "?" + urlencode({
+            "model": MODEL, "language": "en-US", "interim_results": "true",
+            "encoding": "linear16", "sample_rate": sample_rate, "channels": channels,
+        })
+
+        self.sent_s = 0.0       # audio sent so far
+        self.final_s = 0.0      # end of the last final transcript
+        self.reconnects = 0
+        self.interim_ms: list[float] = []
+        self.final_ms: list[float] = []
+        self.transcripts: list[str] = []
+        self._offset = 0.0      # where the current connection's timeline starts
+        self._unconfirmed = bytearray()  # sent after final_s; re-sent on reconnect
+        self._pending = b""     # read from the ring, not sent yet
+        self._sent_ends: list[float] = []
+        self._sent_at: list[float] = []
+        self._t0 = None
+
+    async def run(self) -> None:
+        """Stream the ring until it is drained and the last results are in."""
+        failures = 0
+        while True:
+            confirmed = self.final_s
+            try:
+                async with self.http.ws_connect(self.url, headers={"Authorization": f"Token {API_KEY}"}) as ws:
+                    self._offset = self.final_s
+                    receiver = asyncio.create_task(self._receive(ws))
+                    try:
+                        # Resume: the server has not finalized this audio yet
+                        for i in range(0, len(self._unconfirmed), self.frame_bytes):
+                            await ws.send_bytes(bytes(self._unconfirmed[i:i + self.frame_bytes]))
+                        if await self._send(ws, receiver):
+                            await ws.send_str(json.dumps({"type": "CloseStream"}))
+                            await asyncio.wait_for(receiver, CLOSE_TIMEOUT_S)
+                            if ws.close_code == aiohttp.WSCloseCode.OK:
+                                return
+                    finally:
+                        receiver.cancel()
+                error = f"closed by the server ({ws.close_code})"
+            except (aiohttp.ClientError, OSError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+            # Only a connection that got no audio finalized counts against the retries
+            failures = 0 if self.final_s > confirmed else failures + 1
+            if failures > MAX_RECONNECTS:
+                raise ConnectionError(f"Deepgram stream failed: {error}")
+            print(f"[STT] {error}, reconnecting at {self.final_s:.2f}s", flush=True)
+            self.reconnects += 1
+            if failures:
+                await asyncio.sleep(min(0.1 * 2 ** failures, 2.0))
+
+    async def _send(self, ws: aiohttp.ClientWebSocketResponse, receiver: asyncio.Task) -> bool:
+        """Send frames until the audio ends (True) or the connection closes (False)."""
+        while True:
+            frame = self._pending or await self.ring.read(self.frame_bytes)
+            if not frame:
+                return not (receiver.done() or ws.closed)
+            self._pending = frame
+            if self.speed:
+                if self._t0 is None:
+                    self._t0 = time.perf_counter()
+                delay = self._t0 + self.sent_s / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if receiver.done() or ws.closed:
+                return False
+            await ws.send_bytes(frame)
+            self._pending = b""
+            self._unconfirmed += frame
+            self.sent_s += len(frame) / self.bytes_per_s
+            self._sent_ends.append(self.sent_s)
+            self._sent_at.append(time.perf_counter())
+
+    async def _receive(self, ws: aiohttp.ClientWebSocketResponse) -> None:
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            data = json.loads(msg.data)
+            if data.get("type") != "Results":
+                continue
+            end = self._offset + data["start"] + data["duration"]
+            final = data.get("is_final", False)
+            transcript = data["channel"]["alternatives"][0].get("transcript", "")
+            latency_ms = (time.perf_counter() - self._sent_time(end)) * 1e3
+            if final:
+                # Final results over silence are empty, but still confirm the audio
+                self._confirm(end)
             if not transcript:
                 continue
-
-            if data.get("is_final", False) or data.get("speech_final", False):
-                # Final transcript
-                print("\rFINAL   →", transcript.strip() + " " * 20)
-                last_interim = ""
+            if final:
+                self.final_ms.append(latency_ms)
+                self.transcripts.append(transcript)
             else:
-                # Interim transcript (overwrite same line)
-                if transcript != last_interim:
-                    print("\rLIVE    →", transcript, end="", flush=True)
-                    last_interim = transcript
+                self.interim_ms.append(latency_ms)
+            if self.on_transcript:
+                self.on_transcript(transcript, final, latency_ms)
+
+    def _sent_time(self, end: float) -> float:
+        # When the audio up to `end` was first sent (re-sends don't count)
+        i = bisect_left(self._sent_ends, end - 1e-6)
+        return self._sent_at[min(i, len(self._sent_at) - 1)] if self._sent_at else time.perf_counter()
+
+    def _confirm(self, end: float) -> None:
+        cut = min(len(self._unconfirmed), int((end - self.final_s) * self.bytes_per_s) // self.sample_bytes * self.sample_bytes)
+        if cut <= 0:
+            return
+        del self._unconfirmed[:cut]
+        self.final_s += cut / self.bytes_per_s
+        i = bisect_left(self._sent_ends, self.final_s)
+        del self._sent_ends[:i], self._sent_at[:i]
+
+
+def load_wav(path: str) -> tuple[bytes, int, int]:
+    """The PCM, sample rate and channel count of a 16-bit WAV file."""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise SystemExit(f"{path}: expected 16-bit PCM, got {8 * f.getsampwidth()}-bit")
+        return f.readframes(f.getnframes()), f.getframerate(), f.getnchannels()
+
+
+async def feed_pcm(ring: AudioRing, pcm: bytes, block: int) -> None:
+    for i in range(0, len(pcm), block):
+        await ring.write(pcm[i:i + block])
+    ring.close()
 
+
+async def feed_microphone(ring: AudioRing, frame_samples: int) -> None:
+    import sounddevice as sd  # optional: only needed for the microphone
+
+    loop = asyncio.get_running_loop()
+
+    def callback(indata, frames, time_info, status):
+        if status:
+            print(status, flush=True)
+        # RawInputStream hands over a buffer, not an array: one copy, into the ring
+        loop.call_soon_threadsafe(ring.write_nowait, bytes(indata))
+
+    with sd.RawInputStream(samplerate=SAMPLE_RATE, blocksize=frame_samples, channels=1, dtype="int16",
+                           callback=callback):
+        print("Listening... Press Ctrl+C to stop.\n", flush=True)
+        await asyncio.Event().wait()
+
+
+def _print_transcript(transcript: str, final: bool, latency_ms: float) -> None:
+    if final:
+        print(f"\rFINAL {latency_ms:5.0f}ms  {transcript.strip()}" + " " * 20, flush=True)
+    else:
+        print(f"\rLIVE  {latency_ms:5.0f}ms  {transcript}", end="", flush=True)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+def frame_bytes(sample_rate: int, channels: int, frame_ms: float) -> int:
+    return 2 * channels * max(1, int(sample_rate * frame_ms / 1000))
+
+
+def _ring(buffer_s: float, sample_rate: int, channels: int, frame: int) -> AudioRing:
+    # A whole number of frames, at least two
+    capacity = max(int(buffer_s * sample_rate) * 2 * channels, 2 * frame)
+    return AudioRing(capacity - capacity % frame)
+
+
+async def run_streams(http: aiohttp.ClientSession, args, wavs: list[tuple[str, bytes, int, int]]) -> list[dict]:
+    """Replay the WAVs over args.streams concurrent connections (round robin)."""
+    verbose = args.streams == 1
+
+    async def one(name: str, pcm: bytes, rate: int, channels: int) -> dict:
+        frame = frame_bytes(rate, channels, args.frame_ms)
+        ring = _ring(args.buffer_s, rate, channels, frame)
+        stream = SttStream(http, ring, rate, channels, frame, args.speed, _print_transcript if verbose else None)
+        start = time.perf_counter()
+        feeder = asyncio.create_task(feed_pcm(ring, pcm, frame))
+        try:
+            await stream.run()
+            error = None
         except Exception as e:
-            if not stop_event.is_set():
-                print(f"\n[Receiver Error]: {e}")
-            break
+            error = str(e) or type(e).__name__
+        finally:
+            feeder.cancel()
+        return {
+            "file": name, "audio_s": len(pcm) / stream.bytes_per_s, "wall_s": time.perf_counter() - start,
+            "reconnects": stream.reconnects, "interim_ms": stream.interim_ms, "final_ms": stream.final_ms,
+            "transcripts": stream.transcripts, "error": error,
+        }
 
-def main():
-    print("🎙️  Listening... Press Ctrl+C to stop.\n")
+    return await asyncio.gather(*(one(*wavs[i % len(wavs)]) for i in range(args.streams)))
 
-    ws = create_connection(
-        WS_URL,
-        header=[f"Authorization: Token {API_KEY}"],
-    )
 
-    receiver = threading.Thread(target=receive_loop, args=(ws,), daemon=True)
-    receiver.start()
-    try:
-        with sd.InputStream(
-            samplerate=SAMPLE_RATE,
-            blocksize=BLOCK_SIZE,
-            channels=CHANNELS,
-            dtype=DTYPE,
-            callback=mic_callback,
-        ):
-            print("🟢 Audio stream started. Sending data to Deepgram...")
-            while not stop_event.is_set():
-                try:
-                    audio = audio_queue.get(timeout=1.0)
-                    if ws.connected:
-                        ws.send(audio.tobytes(), opcode=0x2)
-                except queue.Empty:
-                    continue
-                except Exception as e:
-                    print(f"Error sending audio: {e}")
-                    break
+def _summary(results: list[dict], wall: float) -> None:
+    ok = [r for r in results if r["error"] is None]
+    audio = sum(r["audio_s"] for r in ok)
+    print(f"\n{len(ok)}/{len(results)} streams, {audio:.1f}s of audio in {wall:.1f}s, "
+          f"{sum(r['reconnects'] for r in results)} reconnects", flush=True)
+    for kind in ("interim", "final"):
+        values = [v for r in ok for v in r[f"{kind}_ms"]]
+        if values:
+            print(f"{kind:<7} n={len(values):<5} p50 {_percentile(values, 0.5):5.0f}ms  "
+                  f"p95 {_percentile(values, 0.95):5.0f}ms  p99 {_percentile(values, 0.99):5.0f}ms  "
+                  f"max {max(values):5.0f}ms", flush=True)
+    for r in results:
+        if r["error"] is not None:
+            print(f"FAILED {r['file']}: {r['error']}", flush=True)
+
 
+async def main_async(args) -> None:
+    # One connection per stream; the default pool limit would queue streams past 100
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as http:
+        if not args.file:
+            frame = frame_bytes(SAMPLE_RATE, 1, args.frame_ms)
+            ring = _ring(args.buffer_s, SAMPLE_RATE, 1, frame)
+            stream = SttStream(http, ring, SAMPLE_RATE, 1, frame, on_transcript=_print_transcript)
+            mic = asyncio.create_task(feed_microphone(ring, frame // 2))
+            sender = asyncio.create_task(stream.run())
+            try:
+                await asyncio.wait({mic, sender}, return_when=asyncio.FIRST_COMPLETED)
+                if mic.done() and isinstance(mic.exception(), OSError):
+                    # sounddevice raises OSError when PortAudio or an input device is missing
+                    raise SystemExit(f"Cannot record audio ({mic.exception()}); replay a WAV with --file instead")
+                for task in (mic, sender):
+                    if task.done():
+                        task.result()
+            finally:
+                mic.cancel()
+                sender.cancel()
+                if stream.ring.dropped:
+                    print(f"\ndropped {stream.ring.dropped / stream.bytes_per_s:.2f}s of audio", flush=True)
+            return
+
+        wavs = [(path, *load_wav(path)) for path in args.file]
+        start = time.perf_counter()
+        results = await run_streams(http, args, wavs)
+        _summary(results, time.perf_counter() - start)
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump({"streams": args.streams, "speed": args.speed, "frame_ms": args.frame_ms,
+                           "results": results}, f, indent=2)
+        if any(r["error"] is not None for r in results):
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", action="append", help="replay this 16-bit WAV instead of the microphone "
+                                                        "(repeat for several)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, x real time (0: unpaced)")
+    parser.add_argument("--streams", type=int, default=1, help="concurrent replays (load mode)")
+    parser.add_argument("--frame-ms", type=float, default=50, help="audio per websocket message")
+    parser.add_argument("--buffer-s", type=float, default=5.0, help="ring buffer size, in seconds of audio")
+    parser.add_argument("--report", help="write per-stream latencies as JSON")
+    try:
+        asyncio.run(main_async(parser.parse_args()))
     except KeyboardInterrupt:
         print("\nStopping...")
-    finally:
-        stop_event.set()
-        ws.close()
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,123 @@
+"""Token-lean serialization of tool results for the LLM.
+
+Every tool result stays in the chat context for the rest of the call, so
+its size is paid again on each later turn (time-to-first-token and cost).
+
+Formats (TOOL_RESULT_FORMAT):
+  lines   one "key: value" per line, nulls and call-log fields dropped (default)
+  json    minified JSON with the same projection
+  pretty  the full records as indented JSON (the old output)
+
+Patient records can be cut down further to the field groups the current
+workflow step needs; patient_id and patient_name are always kept so
+results stay tied to a patient.
+"""
+import re
+import json
+
+FIELD_GROUPS = {
+    "identity": (
+        "patient_id", "patient_name", "emirates_id", "date_of_birth", "gender", "nationality", "contact_number",
+    ),
+    "policy": (
+        "policy_number", "pbm_name", "insurance_plan", "plan_tier", "copay_percentage", "annual_limit_aed",
+        "remaining_benefit_aed", "policy_start_date", "policy_end_date", "policy_active",
+    ),
+    "prescription": (
+        "drug_brand_name", "drug_generic_name", "drug_class", "ndc_code", "prescribed_dosage",
+        "prescribed_duration_days", "qty_dispensed_units", "unit_cost_aed", "total_claim_aed", "requires_prior_auth",
+        "prior_dispense_count", "last_dispensed_date", "already_dispensed_this_cycle", "pharmacy_id",
+        "physician_id", "icd_code", "diagnosis",
+    ),
+    "claim": (
+        "claim_id", "claim_status", "denial_code", "denial_reason", "pa_required", "recommended_resolution",
+    ),
+    "inventory": (
+        "primary_drug_inventory", "alternative_drugs", "alternative_availability",
+    ),
+}
+
+KEY_FIELDS = ("patient_id", "patient_name")
+
+FORMATS = ("lines", "json", "pretty")
+
+
+def token_counter():
+    """(name, count) for prompt tokens: tiktoken's o200k_base (the gpt-oss
+    tokenizer family) when installed, else a close approximation."""
+    try:
+        import tiktoken
+
+        enc = tiktoken.get_encoding("o200k_base")
+        return "o200k_base", lambda text: len(enc.encode(text))
+    except ImportError:
+        # Close to BPE on this text: letters runs, digits in threes, each
+        # punctuation mark, and a newline plus its indentation
+        pattern = re.compile(r"[^\W\d]+|\d{1,3}|[^\w\s]|\n\s*")
+        return "approx (tiktoken not installed)", lambda text: len(pattern.findall(text))
+
+
+def parse_groups(fields: str | None) -> list[str]:
+    """Comma-separated group names -> list; None or "all" selects every group."""
+    if not fields or fields.strip().lower() == "all":
+        return list(FIELD_GROUPS)
+    groups = [g.strip().lower() for g in fields.split(",") if g.strip()]
+    unknown = [g for g in groups if g not in FIELD_GROUPS]
+    if unknown:
+        raise ValueError(f"Unknown field group(s) {', '.join(unknown)}; choose from {', '.join(FIELD_GROUPS)}")
+    return groups
+
+
+def project_record(record: dict, groups: list[str] | None = None) -> dict:
+    """The record's non-empty fields from `groups`, in group order."""
+    keys = list(KEY_FIELDS)
+    for group in groups or FIELD_GROUPS:
+        keys += [k for k in FIELD_GROUPS[group] if k not in keys]
+
+    out = {k: record[k] for k in keys if record.get(k) not in (None, "", [], {})}
+    # alternative_availability already names every alternative
+    availability = out.get("alternative_availability")
+    if isinstance(availability, dict) and set(out.get("alternative_drugs", ())) <= set(availability):
+        out.pop("alternative_drugs", None)
+    return out
+
+
+def _line_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, dict):
+        return "; ".join(f"{k}={_line_value(v)}" for k, v in value.items())
+    if isinstance(value, list):
+        return ", ".join(_line_value(v) for v in value)
+    return str(value)
+
+
+def format_records(records: list[dict], fmt: str = "lines", groups: list[str] | None = None) -> str:
+    if fmt == "pretty":
+        return json.dumps(records, indent=2)
+    projected = [project_record(r, groups) for r in records]
+    if fmt == "json":
+        return json.dumps(projected, separators=(",", ":"), ensure_ascii=False)
+
+    blocks = []
+    for i, record in enumerate(projected, start=1):
+        lines = [f"record {i} of {len(projected)}"] if len(projected) > 1 else []
+        lines += [f"{k}: {_line_value(v)}" for k, v in record.items()]
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def format_table(rows: list[dict], fmt: str = "lines") -> str:
+    """Rows sharing the same keys (e.g. drug code results): a header line plus one line per row."""
+    if fmt == "pretty":
+        return json.dumps(rows, indent=2)
+    if fmt == "json":
+        return json.dumps(rows, separators=(",", ":"), ensure_ascii=False)
+    if not rows:
+        return ""
+    columns = list(rows[0])
+    lines = [" | ".join(columns)]
+    lines += [" | ".join(_line_value(row.get(c, "")) for c in columns) for row in rows]
+    return "\n".join(lines)
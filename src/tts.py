@@ -1,26 +1,240 @@
+"""
+Streaming ElevenLabs TTS: plays or writes audio as it arrives and reports
+what a caller would wait for, per utterance:
+
+  TTFA   request -> first audio chunk
+  total  request -> last audio chunk
+  RTF    total synthesis time / audio duration (below 1 keeps up with playback)
+
+One utterance is played as soon as its first chunk arrives (PCM through
+sounddevice), or written to --output chunk by chunk. With --file (one
+utterance per line, "-" for stdin) the lines are synthesized by a pool of
+--concurrency workers into --out-dir, followed by TTFA/RTF percentiles.
+Point ELEVEN_BASE_URL at scripts/sim_standins.py to run it offline.
+
+Usage:
+    python src/tts.py "Hello! This is a streaming test."
+    python src/tts.py "Hello!" --output hello.wav
+    python src/tts.py --file lines.txt --out-dir out/ --concurrency 4
+    cat lines.txt | python src/tts.py --file - --out-dir out/
+"""
 import os
-from elevenlabs.client import ElevenLabs
-from elevenlabs.play import play
+import sys
+import json
+import time
+import wave
+import asyncio
+import argparse
+from contextlib import aclosing
+
 from decouple import config
+from elevenlabs.client import AsyncElevenLabs
+
+API_KEY = config("ELEVEN_API_KEY")
+# Same variable as the agent (which includes the /v1 the SDK adds itself)
+BASE_URL = config("ELEVEN_BASE_URL", default="https://api.elevenlabs.io/v1").removesuffix("/v1")
+
+VOICE_ID = "TX3LPaxmHKxFdv7VOQHJ"
+MODEL_ID = "eleven_multilingual_v2"
+
+# Output format by file type; raw PCM for playback needs no decoder
+FORMATS = {".wav": "pcm_22050", ".pcm": "pcm_22050", ".mp3": "mp3_44100_128"}
+PLAYBACK_FORMAT = "pcm_22050"
+
+
+def pcm_rate(output_format: str) -> int | None:
+    """Sample rate of a pcm_<rate> output format; None for the compressed ones."""
+    kind, _, rate = output_format.partition("_")
+    return int(rate) if kind == "pcm" and rate.isdigit() else None
+
+
+def extension(output_format: str) -> str:
+    """File type for an output format: PCM goes into a WAV container."""
+    kind = output_format.partition("_")[0]
+    return ".wav" if kind == "pcm" else f".{kind}"
+
+
+def audio_seconds(output_format: str, nbytes: int) -> float:
+    kind, rate, *rest = output_format.split("_")
+    if kind == "pcm":
+        return nbytes / 2 / int(rate)
+    # mp3/opus at a constant bitrate (kbps)
+    return nbytes * 8 / (int(rest[0]) * 1000) if rest else 0.0
+
+
+class _Sink:
+    """Where the chunks go as they arrive: a file (WAV header for PCM) or the speakers."""
+
+    def __init__(self, output_format: str, path: str | None):
+        self.output_format = output_format
+        self.rate = pcm_rate(output_format)
+        if self.rate is None and (path is None or path.endswith(".wav")):
+            raise ValueError(f"{output_format} is not PCM; only pcm_<rate> can be played or written as WAV")
+        self._wav = self._file = self._stream = None
+        if path is None:
+            import sounddevice as sd  # optional: only needed to play
+
+            self._stream = sd.RawOutputStream(samplerate=self.rate, channels=1, dtype="int16")
+            self._stream.start()
+        elif path.endswith(".wav"):
+            self._wav = wave.open(path, "wb")
+            self._wav.setnchannels(1)
+            self._wav.setsampwidth(2)
+            self._wav.setframerate(self.rate)
+        else:
+            self._file = open(path, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        if self._stream is not None:
+            self._stream.write(chunk)  # blocks while the device buffer is full, paces the stream
+        elif self._wav is not None:
+            self._wav.writeframes(chunk)
+        else:
+            self._file.write(chunk)
+
+    def close(self) -> None:
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+        for f in (self._wav, self._file):
+            if f is not None:
+                f.close()
+
+
+async def synthesize(client: AsyncElevenLabs, text: str, output_format: str, path: str | None,
+                     voice_id: str = VOICE_ID, model_id: str = MODEL_ID) -> dict:
+    """Stream one utterance into `path` (or the speakers) and time it."""
+    # The speakers are opened up front; a file on the first chunk, so a
+    # failed request leaves no empty file behind
+    sink = _Sink(output_format, None) if path is None else None
+    start = time.perf_counter()
+    ttfa, nbytes = None, 0
+    try:
+        async with aclosing(client.text_to_speech.stream(
+            voice_id, text=text, model_id=model_id, output_format=output_format,
+        )) as chunks:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                if ttfa is None:
+                    ttfa = time.perf_counter() - start
+                    sink = sink or _Sink(output_format, path)
+                nbytes += len(chunk)
+                if path is None:
+                    # Playback blocks on the device; keep the event loop free for the other reads
+                    await asyncio.to_thread(sink.write, chunk)
+                else:
+                    sink.write(chunk)
+    finally:
+        if sink is not None:
+            sink.close()
+    total = time.perf_counter() - start
+    duration = audio_seconds(output_format, nbytes)
+    return {
+        "text": text, "output": path, "bytes": nbytes, "audio_s": duration,
+        "ttfa_ms": (ttfa or total) * 1e3, "total_ms": total * 1e3,
+        "rtf": total / duration if duration else None,
+    }
+
+
+def _print_result(r: dict) -> None:
+    rtf = f"{r['rtf']:.2f}" if r["rtf"] is not None else "-"
+    print(
+        f"TTFA {r['ttfa_ms']:6.0f}ms  total {r['total_ms']:6.0f}ms  audio {r['audio_s']:5.1f}s  RTF {rtf}  "
+        f"{r['text'][:50]}",
+        flush=True,
+    )
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+async def run_batch(client: AsyncElevenLabs, lines: list[str], out_dir: str, output_format: str,
+                    concurrency: int, voice_id: str, model_id: str) -> list[dict]:
+    """Synthesize `lines` into out_dir with at most `concurrency` requests in flight."""
+    os.makedirs(out_dir, exist_ok=True)
+    ext = extension(output_format)
+    queue: asyncio.Queue = asyncio.Queue()
+    for i, text in enumerate(lines):
+        queue.put_nowait((i, text))
+    results: list[dict | None] = [None] * len(lines)
+
+    async def worker():
+        while not queue.empty():
+            i, text = queue.get_nowait()
+            path = os.path.join(out_dir, f"{i + 1:04d}{ext}")
+            try:
+                results[i] = await synthesize(client, text, output_format, path, voice_id, model_id)
+                _print_result(results[i])
+            except Exception as e:
+                results[i] = {"text": text, "error": str(e)}
+                print(f"FAILED {text[:50]!r}: {e}", flush=True)
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(lines)))))
+    return [r for r in results if r is not None]
+
+
+async def main_async(args) -> None:
+    client = AsyncElevenLabs(api_key=API_KEY, base_url=BASE_URL)
+    if args.file is None:
+        fmt = args.format or (FORMATS.get(os.path.splitext(args.output)[1], "mp3_44100_128")
+                              if args.output else PLAYBACK_FORMAT)
+        try:
+            result = await synthesize(client, " ".join(args.text), fmt, args.output, args.voice, args.model)
+        except OSError as e:
+            # sounddevice raises OSError when PortAudio or an output device is missing
+            raise SystemExit(f"Cannot play audio ({e}); write it to a file with --output instead") from None
+        _print_result(result)
+        return
 
-# Load the API key from .env
-api_key = config("ELEVEN_API_KEY")
+    source = sys.stdin if args.file == "-" else open(args.file)
+    with source:
+        lines = [line.strip() for line in source if line.strip()]
+    fmt = args.format or "mp3_44100_128"
+    start = time.perf_counter()
+    results = await run_batch(client, lines, args.out_dir, fmt, args.concurrency, args.voice, args.model)
+    wall = time.perf_counter() - start
 
-# Initialize the ElevenLabs client
-elevenlabs = ElevenLabs(api_key=api_key)
+    ok = [r for r in results if "error" not in r]
+    if ok:
+        ttfa = [r["ttfa_ms"] for r in ok]
+        rtf = [r["rtf"] for r in ok if r["rtf"] is not None]
+        audio = sum(r["audio_s"] for r in ok)
+        print(
+            f"\n{len(ok)}/{len(results)} utterances, {audio:.1f}s of audio in {wall:.1f}s "
+            f"(concurrency {args.concurrency})\n"
+            f"TTFA p50 {_percentile(ttfa, 0.5):.0f}ms  p95 {_percentile(ttfa, 0.95):.0f}ms  "
+            f"max {max(ttfa):.0f}ms\n"
+            + (f"RTF  p50 {_percentile(rtf, 0.5):.2f}  p95 {_percentile(rtf, 0.95):.2f}" if rtf else ""),
+            flush=True,
+        )
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"format": fmt, "concurrency": args.concurrency, "wall_s": wall, "results": results}, f, indent=2)
 
-# Example text to convert
-text = "Hello! This is a simple text to speech test using ElevenLabs."
 
-# Replace with a voice ID you have (e.g., a default voice like "Bella" or any voice ID from your dashboard)
-voice_id = "TX3LPaxmHKxFdv7VOQHJ"
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("text", nargs="*", default=["Hello! This is a simple text to speech test using ElevenLabs."])
+    parser.add_argument("--output", help="write the audio here (.wav, .pcm or .mp3) instead of playing it")
+    parser.add_argument("--file", help="synthesize one utterance per line of this file ('-' for stdin)")
+    parser.add_argument("--out-dir", default="tts_out", help="batch mode output directory")
+    parser.add_argument("--concurrency", type=int, default=4, help="batch mode requests in flight")
+    parser.add_argument("--format", help="ElevenLabs output_format (default: by file type)")
+    parser.add_argument("--voice", default=VOICE_ID)
+    parser.add_argument("--model", default=MODEL_ID)
+    parser.add_argument("--report", help="batch mode: write per-utterance results as JSON")
+    args = parser.parse_args()
+    if args.format and pcm_rate(args.format) is None and args.file is None:
+        # Compressed audio would play as noise, and a WAV header over it makes a broken file
+        if not args.output:
+            parser.error(f"playback needs a pcm_<rate> --format, not {args.format}")
+        if args.output.endswith(".wav"):
+            parser.error(f"--output .wav needs a pcm_<rate> --format, not {args.format}; use .mp3 or .pcm")
+    asyncio.run(main_async(args))
 
-# Convert text to audio bytes
-audio_bytes = elevenlabs.text_to_speech.convert(
-    text=text,
-    voice_id=voice_id,
-    model_id="eleven_multilingual_v2",  # default recommended model
-    output_format="mp3_44100_128"
-)
 
-play(audio_bytes)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Per-turn latency of the voice pipeline.
+
+A turn starts when the caller stops speaking and is timed through:
+
+  eou             end of speech -> the turn is committed (VAD silence)
+  stt_final       end of speech -> final transcript
+  llm_ttft        LLM request -> first token (once per LLM call in the turn)
+  tool            each tool call, labelled with its name, plus result size
+  tts_ttfb        TTS request -> first audio byte
+  playout_start   end of speech -> agent audio starts playing
+
+Samples go to Prometheus histograms, served on /metrics by the worker
+(METRICS_PORT; job processes share a multiprocess directory so the
+endpoint sums every call on the worker), and to a rolling window per
+process whose p50/p95/p99 are logged at the end of each call. With
+OTEL_EXPORTER_OTLP_ENDPOINT set, each turn is also exported as a span
+with one child span per stage.
+"""
+import time
+import threading
+from collections import deque
+
+import prometheus_client
+from decouple import config
+
+STAGES = ("eou", "stt_final", "llm_ttft", "tool", "tts_ttfb", "playout_start")
+
+# Voice turns live between ~50ms (cached tool) and a few seconds (slow LLM)
+_LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+TURN_STAGE_SECONDS = prometheus_client.Histogram(
+    "pharma_turn_stage_seconds",
+    "Latency of each stage of a caller turn",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+TOOL_CALL_SECONDS = prometheus_client.Histogram(
+    "pharma_tool_call_seconds",
+    "Duration of each LLM tool call",
+    ["tool"],
+    buckets=_LATENCY_BUCKETS,
+)
+TOOL_RESULT_BYTES = prometheus_client.Histogram(
+    "pharma_tool_result_bytes",
+    "Size of each tool result sent back to the LLM",
+    ["tool"],
+    buckets=(64, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536),
+)
+
+OTLP_ENDPOINT = config("OTEL_EXPORTER_OTLP_ENDPOINT", default="")
+
+_window_lock = threading.Lock()
+_windows: dict[str, deque] = {stage: deque(maxlen=2048) for stage in STAGES}
+_tracer = None
+
+
+def observe(stage: str, seconds: float, tool: str | None = None) -> None:
+    """Record one stage sample in the histograms and the rolling window."""
+    if seconds < 0:
+        return
+    TURN_STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    if tool is not None:
+        TOOL_CALL_SECONDS.labels(tool=tool).observe(seconds)
+    with _window_lock:
+        _windows[stage].append(seconds)
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+def percentiles() -> dict[str, dict]:
+    """p50/p95/p99 (ms) and sample count per stage, over this process's recent turns."""
+    out = {}
+    with _window_lock:
+        samples = {stage: sorted(window) for stage, window in _windows.items()}
+    for stage, ordered in samples.items():
+        if ordered:
+            out[stage] = {
+                "n": len(ordered),
+                "p50": _percentile(ordered, 0.50) * 1e3,
+                "p95": _percentile(ordered, 0.95) * 1e3,
+                "p99": _percentile(ordered, 0.99) * 1e3,
+            }
+    return out
+
+
+def format_percentiles() -> str:
+    return ", ".join(
+        f"{stage} p50={p['p50']:.0f} p95={p['p95']:.0f} p99={p['p99']:.0f}ms (n={p['n']})"
+        for stage, p in percentiles().items()
+    ) or "no turns"
+
+
+def setup_tracing():
+    """Export turn spans (and LiveKit's own spans) over OTLP/HTTP, once per process.
+
+    Returns the tracer, or None when OTEL_EXPORTER_OTLP_ENDPOINT is not set."""
+    global _tracer
+    if _tracer is not None or not OTLP_ENDPOINT:
+        return _tracer
+
+    from opentelemetry import trace
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from livekit.agents.telemetry import set_tracer_provider
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "pharmacy-agent"}))
+    # The exporter reads OTEL_EXPORTER_OTLP_ENDPOINT and appends /v1/traces
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    set_tracer_provider(provider)
+    _tracer = provider.get_tracer(__name__)
+    print(f"[PHARMA] >>> Exporting turn spans to {OTLP_ENDPOINT}", flush=True)
+    return _tracer
+
+
+def flush_tracing() -> None:
+    if _tracer is not None:
+        from opentelemetry import trace
+
+        provider = trace.get_tracer_provider()
+        if hasattr(provider, "force_flush"):
+            provider.force_flush(timeout_millis=2000)
+
+
+def _ns(t: float) -> int:
+    return int(t * 1e9)
+
+
+class TurnTracker:
+    """Times each caller turn of one AgentSession from its events.
+
+    Stage timings come from the framework's own metrics where it has them
+    (EOU, LLM, TTS); tool calls and playout start are timed from event
+    timestamps. A turn is closed when the caller starts speaking again or
+    the session ends, so late LLM/TTS metrics still land on it.
+    """
+
+    def __init__(self, room: str):
+        self.room = room
+        self.turns = 0
+        self._tracer = setup_tracing()
+        self._turn: dict | None = None
+
+    def attach(self, session) -> None:
+        session.on("user_state_changed", self._on_user_state)
+        session.on("agent_state_changed", self._on_agent_state)
+        session.on("user_input_transcribed", self._on_transcribed)
+        session.on("metrics_collected", self._on_metrics)
+        session.on("function_tools_executed", self._on_tools)
+        session.on("close", lambda _ev: self.close())
+
+    def _span(self, name: str, start: float, end: float, **attributes) -> None:
+        if self._turn is not None:
+            self._turn["spans"].append((name, start, end, attributes))
+
+    def _on_user_state(self, ev) -> None:
+        if ev.new_state == "speaking":
+            self._finish_turn()
+        elif ev.old_state == "speaking" and ev.new_state == "listening":
+            self._finish_turn()
+            self._turn = {"start": ev.created_at, "stt_final": False, "playout": False, "spans": []}
+
+    def _on_transcribed(self, ev) -> None:
+        turn = self._turn
+        if turn is None or not ev.is_final or turn["stt_final"]:
+            return
+        turn["stt_final"] = True
+        self._span("stt_final", turn["start"], ev.created_at)
+
+    def _on_metrics(self, ev) -> None:
+        m = ev.metrics
+        kind = getattr(m, "type", "")
+        if kind == "eou_metrics" and m.end_of_utterance_delay > 0:
+            observe("eou", m.end_of_utterance_delay)
+            # The framework's transcription delay is measured against VAD end of speech
+            observe("stt_final", m.transcription_delay)
+            if self._turn is not None:
+                start = self._turn["start"]
+                self._span("eou", start, start + m.end_of_utterance_delay)
+        elif kind == "llm_metrics" and m.ttft >= 0 and not m.cancelled:
+            observe("llm_ttft", m.ttft)
+            start = m.timestamp - m.duration
+            self._span("llm_ttft", start, start + m.ttft, prompt_tokens=m.prompt_tokens)
+        elif kind == "tts_metrics" and m.ttfb >= 0 and not m.cancelled:
+            observe("tts_ttfb", m.ttfb)
+            start = m.timestamp - m.duration
+            self._span("tts_ttfb", start, start + m.ttfb, characters=m.characters_count)
+
+    def _on_tools(self, ev) -> None:
+        for call, output in zip(ev.function_calls, ev.function_call_outputs):
+            if output is None:
+                continue
+            seconds = max(output.created_at - call.created_at, 0.0)
+            size = len(output.output.encode())
+            observe("tool", seconds, tool=call.name)
+            TOOL_RESULT_BYTES.labels(tool=call.name).observe(size)
+            self._span(
+                f"tool {call.name}", call.created_at, output.created_at,
+                tool=call.name, result_bytes=size, is_error=output.is_error,
+            )
+
+    def _on_agent_state(self, ev) -> None:
+        turn = self._turn
+        if turn is None or ev.new_state != "speaking" or turn["playout"]:
+            return
+        turn["playout"] = True
+        observe("playout_start", ev.created_at - turn["start"])
+        self._span("playout_start", turn["start"], ev.created_at)
+
+    def _finish_turn(self) -> None:
+        turn, self._turn = self._turn, None
+        if turn is None or not turn["spans"]:
+            return
+        self.turns += 1
+        if self._tracer is None:
+            return
+
+        from opentelemetry import trace
+
+        end = max(span_end for _, _, span_end, _ in turn["spans"])
+        root = self._tracer.start_span(
+            "pharma.turn", start_time=_ns(turn["start"]), attributes={"room": self.room, "turn": self.turns},
+        )
+        parent = trace.set_span_in_context(root)
+        for name, start, span_end, attributes in turn["spans"]:
+            child = self._tracer.start_span(name, context=parent, start_time=_ns(start), attributes=attributes)
+            child.end(end_time=_ns(span_end))
+        root.end(end_time=_ns(max(end, turn["start"])))
+
+    def close(self) -> None:
+        self._finish_turn()
+
+
+if __name__ == "__main__":
+    # Feed a scripted turn through the tracker and print the exposition
+    from types import SimpleNamespace as NS
+
+    class _Session:
+        def __init__(self):
+            self.handlers = {}
+
+        def on(self, name, fn):
+            self.handlers[name] = fn
+
+        def emit(self, name, **fields):
+            self.handlers[name](NS(**fields))
+
+    session, tracker, now = _Session(), TurnTracker("demo"), time.time()
+    tracker.attach(session)
+    for turn in range(20):
+        t0 = now + turn * 10
+        session.emit("user_state_changed", old_state="speaking", new_state="listening", created_at=t0)
+        session.emit("user_input_transcribed", is_final=True, created_at=t0 + 0.2)
+        session.emit("metrics_collected", metrics=NS(
+            type="eou_metrics", end_of_utterance_delay=0.5, transcription_delay=0.2))
+        call = NS(name="lookup_database", created_at=t0 + 0.9)
+        out = NS(output="patient_id: P1\n" * 20, created_at=t0 + 0.9 + 0.01 * turn, is_error=False)
+        session.emit("function_tools_executed", function_calls=[call], function_call_outputs=[out])
+        session.emit("metrics_collected", metrics=NS(
+            type="llm_metrics", ttft=0.3 + 0.02 * turn, duration=0.8, timestamp=t0 + 1.8, cancelled=False,
+            prompt_tokens=1200))
+        session.emit("metrics_collected", metrics=NS(
+            type="tts_metrics", ttfb=0.15, duration=1.0, timestamp=t0 + 2.5, cancelled=False, characters_count=80))
+        session.emit("agent_state_changed", old_state="thinking", new_state="speaking", created_at=t0 + 1.7)
+    session.emit("close")
+    print(f"{tracker.turns} turns: {format_percentiles()}\n")
+    for line in prometheus_client.generate_latest().decode().splitlines():
+        if line.startswith("pharma_turn_stage_seconds") and 'stage="playout_start"' in line and "created" not in line:
+            print(line)
@@ -0,0 +1,266 @@
+"""In-process vector index over the local JSON records, a drop-in for Pinecone search.
+
+Records from data/db.json and data/pharma.json are turned into the same
+text Pinecone stores for them (the record JSON without its id), embedded
+once into a float32 matrix and saved to data/vector_index.npz. Queries are
+answered with a dot product over the normalized rows, either brute force
+or through a small IVF index (k-means lists, `nprobe` lists scanned).
+
+Embedders:
+  sentence-transformers  a CPU sentence-transformers model (LOCAL_EMBED_MODEL,
+                         default all-MiniLM-L6-v2); needs the package and model
+  hashing                hashed word and character-trigram features; no model
+                         download, for offline and test environments
+
+Rebuild the index and compare IVF with brute force:
+    python src/vector_index.py
+    python scripts/bench_vector_index.py
+"""
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import threading
+
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+DEFAULT_SOURCES = (os.path.join(DATA_DIR, "db.json"), os.path.join(DATA_DIR, "pharma.json"))
+DEFAULT_INDEX_PATH = os.path.join(DATA_DIR, "vector_index.npz")
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+INDEX_VERSION = 1
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def record_text(record: dict) -> str:
+    """The text Pinecone holds for a record (see pinecone/pinecone_upsert.py)."""
+    payload = {k: v for k, v in record.items() if k != "id"}
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def load_record_texts(sources) -> list[str]:
+    """`record_text` of every record in the JSON files, in file order."""
+    texts = []
+    for path in sources:
+        with open(path, "r") as f:
+            texts.extend(record_text(r) for r in json.load(f))
+    return texts
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+class HashingEmbedder:
+    """Hashed bag of words + character trigrams, sublinear tf, L2-normalized."""
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> dict[int, float]:
+        counts: dict[int, float] = {}
+        for word in _WORD_RE.findall(text.lower()):
+            for feature in (word, *(f"#{word[i:i + 3]}" for i in range(len(word) - 2))):
+                bucket = zlib.crc32(feature.encode()) % self.dim
+                counts[bucket] = counts.get(bucket, 0.0) + 1.0
+        return counts
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for bucket, count in self._features(text).items():
+                matrix[row, bucket] = 1.0 + np.log(count)
+        return _normalize_rows(matrix)
+
+
+class SentenceTransformerEmbedder:
+    """A sentence-transformers model on CPU, loaded on first use."""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL):
+        self.model_name = model_name
+        self.name = f"st-{model_name}"
+        self._model = None
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer  # optional dependency
+
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+        vectors = self._model.encode(texts, batch_size=64, normalize_embeddings=True, convert_to_numpy=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def get_embedder(name: str, model_name: str = DEFAULT_MODEL):
+    if name == "hashing":
+        return HashingEmbedder()
+    if name == "sentence-transformers":
+        return SentenceTransformerEmbedder(model_name)
+    raise ValueError(f"Unknown embedder {name!r} (expected 'sentence-transformers' or 'hashing')")
+
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means: returns (unit centroids, assignment per row)."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(k):
+            members = vectors[assign == c]
+            # An emptied list is reseeded from a random row
+            centroids[c] = members.sum(axis=0) if len(members) else vectors[rng.integers(len(vectors))]
+        centroids = _normalize_rows(centroids)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indexes of the k highest scores, best first."""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+class LocalVectorIndex:
+    """Normalized embedding matrix plus an optional IVF layout over it.
+
+    With IVF, rows are stored grouped by list (`_list_starts` delimits each
+    list's slice), so scanning `nprobe` lists reads contiguous blocks.
+    """
+
+    def __init__(self, texts: list[str], embeddings: np.ndarray, embedder, nlist: int = 0, meta: dict | None = None):
+        self.texts = texts
+        self.embedder = embedder
+        self.meta = meta or {}
+        self.nlist = nlist if nlist and len(texts) >= nlist else 0
+        if self.nlist:
+            centroids, assign = _kmeans(embeddings, self.nlist)
+            order = np.argsort(assign, kind="stable")
+            self._centroids = centroids
+            self._order = order.astype(np.int64)
+            self._list_starts = np.searchsorted(assign[order], np.arange(self.nlist + 1)).astype(np.int64)
+            self.embeddings = np.ascontiguousarray(embeddings[order])
+        else:
+            self._centroids = None
+            self._order = np.arange(len(texts), dtype=np.int64)
+            self._list_starts = None
+            self.embeddings = np.ascontiguousarray(embeddings)
+
+    @classmethod
+    def build(cls, sources, embedder, nlist: int | None = None) -> "LocalVectorIndex":
+        texts = load_record_texts(sources)
+        embeddings = embedder.encode(texts) if texts else np.zeros((0, 1), dtype=np.float32)
+        if nlist is None:
+            # ~sqrt(n) lists; brute force is already cheap below a few thousand rows
+            nlist = int(np.sqrt(len(texts))) if len(texts) >= 4096 else 0
+        meta = {"version": INDEX_VERSION, "embedder": embedder.name, "sources": _fingerprint(sources)}
+        return cls(texts, embeddings, embedder, nlist, meta)
+
+    def save(self, path: str) -> None:
+        arrays = {
+            "embeddings": self.embeddings,
+            "order": self._order,
+            "texts": np.frombuffer(json.dumps(self.texts).encode("utf-8"), dtype=np.uint8),
+            "meta": np.frombuffer(json.dumps({**self.meta, "nlist": self.nlist}).encode("utf-8"), dtype=np.uint8),
+        }
+        if self.nlist:
+            arrays["centroids"] = self._centroids
+            arrays["list_starts"] = self._list_starts
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, embedder) -> "LocalVectorIndex":
+        with np.load(path) as data:
+            index = cls.__new__(cls)
+            index.meta = json.loads(data["meta"].tobytes())
+            index.texts = json.loads(data["texts"].tobytes())
+            index.embedder = embedder
+            index.nlist = index.meta.pop("nlist", 0)
+            index.embeddings = data["embeddings"]
+            index._order = data["order"]
+            index._centroids = data["centroids"] if index.nlist else None
+            index._list_starts = data["list_starts"] if index.nlist else None
+        return index
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def search_vector(self, query: np.ndarray, top_k: int = 5, nprobe: int | None = None) -> list[tuple[int, float]]:
+        """(record position, score) of the top_k rows; IVF unless nprobe is 0 or there are no lists."""
+        if not len(self.texts) or top_k <= 0:
+            return []
+        if not self.nlist or nprobe == 0:
+            scores = self.embeddings @ query
+            top = _top_k(scores, top_k)
+            return [(int(self._order[i]), float(scores[i])) for i in top]
+
+        probe = _top_k(self._centroids @ query, min(nprobe or 8, self.nlist))
+        spans = [(self._list_starts[c], self._list_starts[c + 1]) for c in probe]
+        # Score each list's contiguous slice in place rather than gathering rows
+        scores = np.concatenate([self.embeddings[a:b] @ query for a, b in spans])
+        rows = np.concatenate([np.arange(a, b) for a, b in spans])
+        top = _top_k(scores, top_k)
+        return [(int(self._order[rows[i]]), float(scores[i])) for i in top]
+
+    def search(self, query: str, top_k: int = 5, nprobe: int | None = None) -> list[str]:
+        """Record texts of the top_k matches for `query`, best first."""
+        vector = self.embedder.encode([query])[0]
+        return [self.texts[pos] for pos, _ in self.search_vector(vector, top_k, nprobe)]
+
+
+def _fingerprint(sources) -> list[dict]:
+    out = []
+    for path in sources:
+        st = os.stat(path)
+        out.append({"path": os.path.basename(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+    return out
+
+
+_attach_lock = threading.Lock()
+
+
+def attach(
+    embedder_name: str = "sentence-transformers",
+    model_name: str = DEFAULT_MODEL,
+    sources=DEFAULT_SOURCES,
+    index_path: str = DEFAULT_INDEX_PATH,
+) -> LocalVectorIndex:
+    """Load the saved index, rebuilding it if the sources or embedder changed."""
+    embedder = get_embedder(embedder_name, model_name)
+    with _attach_lock:
+        start = time.perf_counter()
+        if os.path.exists(index_path):
+            try:
+                index = LocalVectorIndex.load(index_path, embedder)
+                if (
+                    index.meta.get("version") == INDEX_VERSION
+                    and index.meta.get("embedder") == embedder.name
+                    and index.meta.get("sources") == _fingerprint(sources)
+                ):
+                    print(f"[PHARMA] >>> Loaded vector index {index_path} ({len(index)} rows) in {time.perf_counter() - start:.3f}s", flush=True)
+                    return index
+            except (OSError, ValueError, KeyError):
+                pass
+        index = LocalVectorIndex.build(sources, embedder)
+        index.save(index_path)
+        print(f"[PHARMA] >>> Built vector index {index_path} ({len(index)} rows, {embedder.name}) in {time.perf_counter() - start:.2f}s", flush=True)
+        return index
+
+
+if __name__ == "__main__":
+    name = sys.argv[1] if len(sys.argv) > 1 else "sentence-transformers"
+    index = attach(name)
+    for query in ("prior authorization rejection insulin Daman", "Fatima Al Mansoori"):
+        start = time.perf_counter()
+        hits = index.search(query, top_k=3)
+        print(f"{query!r}: {len(hits)} hits in {(time.perf_counter() - start) * 1e3:.2f}ms")
+        for text in hits:
+            print("   ", text[:120])
@@ -0,0 +1,184 @@
+import json
+import os
+from datetime import date
+
+import pytest
+
+from coverage_rules import check_coverage, format_verdict
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "db.json")
+TODAY = date(2025, 1, 15)
+
+
+def load_records() -> list[dict]:
+    with open(DB_PATH) as f:
+        return json.load(f)
+
+
+# A claim nothing stands in the way of: active policy, ample benefit, no PA, in stock
+CLEAN = {
+    "patient_id": "PAT-000001",
+    "patient_name": "Test Member",
+    "drug_brand_name": "Lipitor",
+    "drug_generic_name": "Atorvastatin",
+    "claim_id": "CLM-000001",
+    "policy_active": True,
+    "policy_end_date": "2026-06-30",
+    "remaining_benefit_aed": 50000.0,
+    "total_claim_aed": 1000.0,
+    "copay_percentage": 10,
+    "requires_prior_auth": False,
+    "pa_required": False,
+    "already_dispensed_this_cycle": False,
+    "last_dispensed_date": "2024-12-01",
+    "claim_status": "Approved",
+    "denial_code": "",
+    "denial_reason": "",
+    "recommended_resolution": "",
+    "primary_drug_inventory": "In Stock",
+    "alternative_drugs": ["Rosuvastatin 10mg", "Simvastatin 20mg", "Pravastatin 40mg"],
+    "alternative_availability": {
+        "Rosuvastatin 10mg": "Low Stock", "Simvastatin 20mg": "Out of Stock", "Pravastatin 40mg": "In Stock",
+    },
+}
+
+
+def verdict_for(**changes) -> dict:
+    return check_coverage({**CLEAN, **changes}, today=TODAY)
+
+
+def test_clean_claim_is_approved():
+    v = verdict_for()
+    assert v["verdict"] == "approved"
+    assert v["blocking"] == []
+    assert v["copay_aed"] == 100.0
+    assert v["drug"] == "Lipitor (Atorvastatin)"
+    assert "alternatives" not in v and "warnings" not in v and "resolution" not in v
+
+
+@pytest.mark.parametrize("status", ["Submitted", "Under Review", "Appealed"])
+def test_open_claim_is_pending(status):
+    assert verdict_for(claim_status=status)["verdict"] == "pending"
+
+
+def test_expired_policy_blocks():
+    v = verdict_for(policy_active=False, policy_end_date="2024-12-31")
+    assert v["verdict"] == "blocked"
+    assert len(v["blocking"]) == 1
+    assert v["blocking"][0].startswith("policy not active (end date 2024-12-31)")
+
+
+def test_exhausted_benefit_blocks():
+    v = verdict_for(remaining_benefit_aed=400.0)
+    assert v["verdict"] == "blocked"
+    assert v["blocking"] == ["remaining benefit 400.00 AED is below the claim of 1000.00 AED"]
+
+
+def test_benefit_for_one_more_claim_warns():
+    v = verdict_for(remaining_benefit_aed=1500.0)
+    assert v["verdict"] == "approved"
+    assert v["warnings"] == ["remaining benefit 1500.00 AED covers fewer than 2 such claims"]
+
+
+def test_outstanding_prior_authorization_blocks():
+    v = verdict_for(requires_prior_auth=True, pa_required=True, claim_status="Under Review")
+    assert v["verdict"] == "blocked"
+    assert v["blocking"][0].startswith("prior authorization required")
+
+
+def test_obtained_prior_authorization_does_not_block():
+    assert verdict_for(requires_prior_auth=True, pa_required=False)["verdict"] == "approved"
+
+
+def test_dispensed_this_cycle_blocks():
+    v = verdict_for(already_dispensed_this_cycle=True)
+    assert v["verdict"] == "blocked"
+    assert v["blocking"][0].startswith("already dispensed this cycle (last on 2024-12-01)")
+
+
+def test_denied_claim_blocks_with_the_code_resolution():
+    v = verdict_for(claim_status="Denied", denial_code="79", denial_reason="Prior Authorization Required")
+    assert v["verdict"] == "blocked"
+    assert v["blocking"] == ["claim denied: Prior Authorization Required"]
+    assert v["resolution"] == "Submit PA form with clinical notes"
+
+
+def test_appealed_claim_keeps_its_resolution():
+    v = verdict_for(claim_status="Appealed", denial_code="76")
+    assert v["verdict"] == "pending"
+    assert v["resolution"] == "Appeal with medical necessity letter"
+
+
+def test_unknown_denial_code_falls_back_to_the_record():
+    v = verdict_for(claim_status="Denied", denial_code="X9", recommended_resolution="Call the insurer")
+    assert v["resolution"] == "Call the insurer"
+
+
+def test_every_blocker_is_listed():
+    v = verdict_for(policy_active=False, remaining_benefit_aed=0.0, requires_prior_auth=True, pa_required=True,
+                    already_dispensed_this_cycle=True, claim_status="Denied")
+    assert [b.split(" ")[0] for b in v["blocking"]] == ["policy", "remaining", "prior", "already", "claim"]
+
+
+def test_blocked_claim_offers_only_alternatives_in_stock():
+    v = verdict_for(claim_status="Denied", denial_code="70")
+    assert v["alternatives"] == ["Rosuvastatin 10mg", "Pravastatin 40mg"]
+
+
+def test_out_of_stock_drug_warns_and_offers_alternatives():
+    v = verdict_for(primary_drug_inventory="Out of Stock")
+    assert v["verdict"] == "approved"
+    assert v["warnings"] == ["Lipitor is out of stock"]
+    assert v["alternatives"] == ["Rosuvastatin 10mg", "Pravastatin 40mg"]
+
+
+def test_policy_ending_soon_warns():
+    assert verdict_for(policy_end_date="2025-02-01")["warnings"] == ["policy ends on 2025-02-01"]
+
+
+def test_policy_end_date_passed_reads_as_ended():
+    v = verdict_for(policy_end_date="2025-01-01")
+    assert v["warnings"] == ["policy ended on 2025-01-01, though it is marked active"]
+
+
+def test_format_verdict_lines():
+    text = format_verdict(verdict_for(claim_status="Denied", denial_code="79", denial_reason="PA"))
+    assert "verdict: blocked" in text.splitlines()
+    assert "blocking: claim denied: PA" in text.splitlines()
+    assert json.loads(format_verdict(verdict_for(), "json"))["verdict"] == "approved"
+
+
+# Two records of data/db.json, with their outcomes worked out by hand
+def test_inactive_policy_with_pending_pa_record():
+    record = next(r for r in load_records() if r["patient_id"] == "PAT-832052")
+    v = check_coverage(record, today=TODAY)
+    assert v["verdict"] == "blocked"
+    assert [b.split(" ")[0] for b in v["blocking"]] == ["policy", "prior"]
+    assert v["alternatives"] == ["Aspirin 100mg"]
+    assert v["copay_aed"] == 0.0
+
+
+def test_active_policy_awaiting_pa_record():
+    record = next(r for r in load_records() if r["patient_id"] == "PAT-434198")
+    v = check_coverage(record, today=TODAY)
+    assert v["verdict"] == "blocked"
+    assert len(v["blocking"]) == 1 and v["blocking"][0].startswith("prior authorization required")
+    assert v["warnings"] == ["policy ended on 2025-01-01, though it is marked active"]
+    assert v["copay_aed"] == 573.5
+
+
+@pytest.mark.parametrize("record", load_records(), ids=lambda r: r["patient_id"])
+def test_every_record(record):
+    v = check_coverage(record, today=TODAY)
+    # The prompt's STEPS 2, 4 and 5: an inactive policy, a claim beyond the
+    # remaining benefit, a refill this cycle or a denied claim ends the request
+    if (not record["policy_active"] or record["remaining_benefit_aed"] < record["total_claim_aed"]
+            or record["already_dispensed_this_cycle"] or record["claim_status"] == "Denied"):
+        assert v["verdict"] == "blocked"
+    # The data states each claim's next step; the engine maps the code to it
+    if record["claim_status"] in ("Denied", "Appealed"):
+        assert v["resolution"] == record["recommended_resolution"]
+    for drug in v.get("alternatives", ()):
+        assert record["alternative_availability"][drug] in ("In Stock", "Low Stock")
+    assert v["patient_id"] == record["patient_id"]
+    assert v == check_coverage(json.loads(json.dumps(record)), today=TODAY)
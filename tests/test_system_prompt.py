@@ -0,0 +1,30 @@
+import json
+import os
+
+import system_prompt
+from system_prompt import AGENT_TOOLS, CallFacts, build_system_prompt
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "db.json")
+
+
+def identified() -> CallFacts:
+    with open(DB_PATH) as f:
+        record = json.load(f)[0]
+    facts = CallFacts()
+    facts.add(record)
+    return facts
+
+
+def test_agent_prompt_lists_every_tool():
+    prompt = build_system_prompt(identified())
+    assert "You have access to four tools:" in prompt
+    assert all(f"`{tool}`:" in prompt for tool in AGENT_TOOLS)
+    assert "Call `check_coverage` for the member" in prompt
+
+
+def test_search_only_prompt_mentions_no_other_tool(monkeypatch):
+    for staged in (True, False):
+        monkeypatch.setattr(system_prompt, "SYSTEM_PROMPT_STAGED", staged)
+        prompt = build_system_prompt(identified(), ("pinecone_search",))
+        assert "You have access to one tool:\n1. `pinecone_search`:" in prompt
+        assert "check_coverage" not in prompt